@@ -1,7 +1,7 @@
 import logging
-from src.ingest import run_ingest
+from src.ingest_daemon import start_ingest_daemon
+from src.RAGService import start_warmup
 from chainlit.cli import run_chainlit
-import time
 import os
 import sys
 
@@ -24,14 +24,10 @@ logger = logging.getLogger(__name__)
 
 
 if __name__ == "__main__":
-    logger.info("Starting the RAG Ingestion process...")
-    while True:
-        try:
-            run_ingest()
-            logger.info("Ingestion completed successfully!")
-            break
-        except Exception as e:
-            logger.error(f"Ingestion crashed with error: {e}. Retrying in 10s...")
-            time.sleep(10)
+    #Model loading and endpoint lookup overlap with ingestion instead of delaying the first answer
+    start_warmup()
+    #Serving starts right away: data/ is ingested (and watched) in the background, documents become
+    #searchable as they are embedded. Progress: `python -m src.ingest_daemon status` or /status in the chat
+    start_ingest_daemon()
     target_path = os.path.join("src", "search.py") 
     run_chainlit(target_path)
\ No newline at end of file
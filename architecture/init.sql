@@ -3,13 +3,80 @@ CREATE EXTENSION IF NOT EXISTS vector;
 CREATE EXTENSION IF NOT EXISTS pg_search;
 DROP TABLE doc_chunks;
 
+-- One partition per collection (src/collection.py), the partition key has to be part of the primary key
 CREATE TABLE doc_chunks (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     content TEXT NOT NULL,
     filename TEXT,
+    -- Voyage's dimension; src.embeddings.check_corpus resizes it for another provider while doc_chunks is empty
     embedding vector(1024),
-    page_number INTEGER
+    page_number INTEGER,
+    chunk_hash TEXT,
+    file_hash TEXT,
+    embedding_model TEXT,
+    embedding_dim INTEGER,
+    collection TEXT NOT NULL DEFAULT 'default',
+    PRIMARY KEY (id, collection)
+) PARTITION BY LIST (collection);
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    keywords TEXT[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
-CREATE INDEX IF NOT EXISTS idx_bm25 ON doc_chunks 
-USING bm25 (id, content, filename) 
-WITH (key_field = 'id');
\ No newline at end of file
+INSERT INTO collections (name) VALUES ('default') ON CONFLICT (name) DO NOTHING;
+CREATE TABLE doc_chunks_default PARTITION OF doc_chunks FOR VALUES IN ('default');
+-- BM25 indexes are per partition, src.collection.ensure_collection adds one to each new collection
+CREATE INDEX IF NOT EXISTS doc_chunks_default_bm25 ON doc_chunks_default
+USING bm25 (id, content, filename)
+WITH (key_field = 'id');
+CREATE INDEX IF NOT EXISTS idx_embedding_hnsw ON doc_chunks
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+CREATE TABLE IF NOT EXISTS query_embedding_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dimension INTEGER NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_query_cache_created ON query_embedding_cache (created_at);
+CREATE INDEX IF NOT EXISTS idx_doc_chunks_file ON doc_chunks (filename, file_hash);
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    chunk_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    embedding vector NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (chunk_hash, model)
+);
+CREATE TABLE IF NOT EXISTS ingest_queue (
+    path TEXT PRIMARY KEY,
+    collection TEXT NOT NULL DEFAULT 'default',
+    status TEXT NOT NULL DEFAULT 'queued',
+    requeue BOOLEAN NOT NULL DEFAULT false,
+    file_size BIGINT,
+    file_mtime DOUBLE PRECISION,
+    chunks_done INTEGER,
+    chunks_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result JSONB,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    available_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_queue_next ON ingest_queue (queued_at) WHERE status = 'queued';
+CREATE TABLE IF NOT EXISTS ingested_files (
+    filename TEXT NOT NULL,
+    collection TEXT NOT NULL DEFAULT 'default',
+    file_hash TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    completed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (filename, collection)
+);
+CREATE TABLE IF NOT EXISTS corpus_generation (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    generation BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO corpus_generation DEFAULT VALUES ON CONFLICT (id) DO NOTHING;
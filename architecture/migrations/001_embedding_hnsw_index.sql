@@ -0,0 +1,6 @@
+-- HNSW index on the embedding column so the ANN leg of hybrid search is index driven.
+-- Safe to run on a live database; CONCURRENTLY avoids blocking ingestion while it builds.
+SET maintenance_work_mem = '1GB';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_embedding_hnsw ON doc_chunks
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
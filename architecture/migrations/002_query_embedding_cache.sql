@@ -0,0 +1,9 @@
+-- Persistent tier of the query embedding cache (src/embedding_cache.py).
+CREATE TABLE IF NOT EXISTS query_embedding_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dimension INTEGER NOT NULL,
+    embedding vector(1024) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_query_cache_created ON query_embedding_cache (created_at);
@@ -0,0 +1,14 @@
+-- Content hashes for incremental re-ingestion (src/content_hash.py).
+-- Existing rows keep NULL hashes until `python -m src.content_hash` backfills them;
+-- until then their files are treated as changed and re-ingested once, reusing nothing.
+ALTER TABLE doc_chunks ADD COLUMN IF NOT EXISTS chunk_hash TEXT;
+ALTER TABLE doc_chunks ADD COLUMN IF NOT EXISTS file_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_doc_chunks_file ON doc_chunks (filename, file_hash);
+-- One vector per distinct chunk text and model, shared by every file that contains it
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    chunk_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    embedding vector(1024) NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (chunk_hash, model)
+);
@@ -0,0 +1,9 @@
+-- Which embedding model made each vector (src/embeddings.py), so two vector spaces are never mixed.
+ALTER TABLE doc_chunks ADD COLUMN IF NOT EXISTS embedding_model TEXT;
+ALTER TABLE doc_chunks ADD COLUMN IF NOT EXISTS embedding_dim INTEGER;
+-- Everything ingested so far came from Voyage
+UPDATE doc_chunks SET embedding_model = 'voyage-code-3', embedding_dim = vector_dims(embedding)
+WHERE embedding_model IS NULL AND embedding IS NOT NULL;
+-- Both tables are keyed by model already, so they can hold vectors of any dimension
+ALTER TABLE chunk_embeddings ALTER COLUMN embedding TYPE vector;
+ALTER TABLE query_embedding_cache ALTER COLUMN embedding TYPE vector;
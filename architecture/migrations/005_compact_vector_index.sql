@@ -0,0 +1,13 @@
+-- Compact ANN index for VECTOR_STORAGE=halfvec (src/retrieval.py), pgvector 0.7+.
+-- Half the size of the float32 HNSW index; candidates are re-scored against doc_chunks.embedding.
+-- Written for 1024-dim Voyage vectors, `python -m src.quantize` works out the dimension itself.
+SET maintenance_work_mem = '1GB';
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_embedding_halfvec ON doc_chunks
+USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+-- VECTOR_STORAGE=binary instead (1 bit per dimension, 32x smaller, needs a larger RETRIEVAL_RESCORE_K):
+-- CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_embedding_binary ON doc_chunks
+-- USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)
+-- WITH (m = 16, ef_construction = 64);
+-- Once searches run on the compact index the full one is only dead weight in shared_buffers:
+-- DROP INDEX CONCURRENTLY IF EXISTS idx_embedding_hnsw;
@@ -0,0 +1,42 @@
+-- Named collections (src/collection.py): doc_chunks becomes LIST-partitioned on a collection column,
+-- everything ingested so far lands in the "default" partition. Rewrites the table and rebuilds its
+-- indexes, so stop ingestion and expect searches to wait for it.
+SET maintenance_work_mem = '1GB';
+BEGIN;
+CREATE TABLE IF NOT EXISTS collections (
+    name TEXT PRIMARY KEY,
+    keywords TEXT[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO collections (name) VALUES ('default') ON CONFLICT (name) DO NOTHING;
+
+ALTER TABLE doc_chunks RENAME TO doc_chunks_unpartitioned;
+ALTER INDEX IF EXISTS doc_chunks_pkey RENAME TO doc_chunks_unpartitioned_pkey;
+ALTER INDEX IF EXISTS idx_bm25 RENAME TO idx_bm25_unpartitioned;
+ALTER INDEX IF EXISTS idx_embedding_hnsw RENAME TO idx_embedding_hnsw_unpartitioned;
+ALTER INDEX IF EXISTS idx_embedding_halfvec RENAME TO idx_embedding_halfvec_unpartitioned;
+ALTER INDEX IF EXISTS idx_embedding_binary RENAME TO idx_embedding_binary_unpartitioned;
+ALTER INDEX IF EXISTS idx_doc_chunks_file RENAME TO idx_doc_chunks_file_unpartitioned;
+
+-- Same columns (the embedding keeps whatever dimension src.reembed gave it) and the same id sequence
+CREATE TABLE doc_chunks (
+    LIKE doc_chunks_unpartitioned INCLUDING DEFAULTS,
+    collection TEXT NOT NULL DEFAULT 'default',
+    PRIMARY KEY (id, collection)
+) PARTITION BY LIST (collection);
+ALTER SEQUENCE doc_chunks_id_seq OWNED BY doc_chunks.id;
+CREATE TABLE doc_chunks_default PARTITION OF doc_chunks FOR VALUES IN ('default');
+INSERT INTO doc_chunks SELECT *, 'default' FROM doc_chunks_unpartitioned;
+DROP TABLE doc_chunks_unpartitioned;
+
+-- Built on the filled table; indexes on doc_chunks itself are created on every future partition too
+CREATE INDEX idx_embedding_hnsw ON doc_chunks
+USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+CREATE INDEX idx_doc_chunks_file ON doc_chunks (filename, file_hash);
+CREATE INDEX doc_chunks_default_bm25 ON doc_chunks_default
+USING bm25 (id, content, filename)
+WITH (key_field = 'id');
+COMMIT;
+ANALYZE doc_chunks;
+-- A compact VECTOR_STORAGE index has to be rebuilt afterwards: python -m src.quantize halfvec
@@ -0,0 +1,22 @@
+-- Persistent work queue of the watched-folder ingestion daemon (src/ingest_daemon.py).
+-- One row per PDF under data/, keyed by its path relative to data/: queued -> running -> done | failed.
+-- `requeue` marks a file that changed while it was being ingested, it goes back to queued when that run ends.
+CREATE TABLE IF NOT EXISTS ingest_queue (
+    path TEXT PRIMARY KEY,
+    collection TEXT NOT NULL DEFAULT 'default',
+    status TEXT NOT NULL DEFAULT 'queued',
+    requeue BOOLEAN NOT NULL DEFAULT false,
+    file_size BIGINT,
+    file_mtime DOUBLE PRECISION,
+    chunks_done INTEGER,
+    chunks_total INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result JSONB,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    available_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_queue_next ON ingest_queue (queued_at) WHERE status = 'queued';
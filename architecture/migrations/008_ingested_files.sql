@@ -0,0 +1,16 @@
+-- Files whose ingest finished (src/content_hash.py mark_complete), with the chunk count it loaded.
+-- Rows at a file's hash without a matching entry here are a partial load, re-ingested on the next run.
+CREATE TABLE IF NOT EXISTS ingested_files (
+    filename TEXT NOT NULL,
+    collection TEXT NOT NULL DEFAULT 'default',
+    file_hash TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    completed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (filename, collection)
+);
+-- Everything already loaded counts as finished, as it did before; files with a checkpoint still resume from it
+INSERT INTO ingested_files (filename, collection, file_hash, chunks)
+SELECT filename, collection, file_hash, count(*) FROM doc_chunks
+WHERE filename IS NOT NULL AND file_hash IS NOT NULL
+GROUP BY filename, collection, file_hash
+ON CONFLICT (filename, collection) DO NOTHING;
@@ -0,0 +1,8 @@
+-- One row, bumped in the same transaction as every doc_chunks change (src/db.py bump_corpus_generation).
+-- The app re-reads it every few seconds (CorpusWatcher) to drop answers cached before a change another
+-- process made, like a src.rebuild swap or a src.reembed.
+CREATE TABLE IF NOT EXISTS corpus_generation (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    generation BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO corpus_generation DEFAULT VALUES ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,99 @@
+"""
+Throughput of RagService.answer_many against the per-question loop over get_response_and_context,
+on the suite's synthetic corpus and fakes: FakeEmbedder with a simulated API round trip,
+FakeCrossEncoder and the stub Ollama. Needs ParadeDB (pg_search), like the suite's end_to_end stage.
+
+    python -m benchmarks.bench_batch --questions 50 --embed-latency-ms 150 --llm-first-token-ms 200 \
+        --llm-token-ms 5 --concurrency 1 2 4
+
+The stub serves any number of generations at once, a real Ollama only OLLAMA_NUM_PARALLEL of them:
+pick --concurrency to match the server being modelled.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.suite import setup_schema, drop_schema, bench_ingest  # sets the scratch search_path
+from benchmarks.corpus import make_corpus, make_queries
+from benchmarks.fakes import FakeEmbedder, FakeCrossEncoder, StubOllama
+from src.extract import PDF_WORKERS
+from src.pool import close_pools
+
+
+def make_service(stub_url, embedder, rerank_pair_ms: float):
+    import src.RAGService as rag
+    from src.embedding_cache import QueryEmbeddingCache
+    rag.embed_text = embedder
+    service = rag.RagService(ollama_base=stub_url, reranker=FakeCrossEncoder(rerank_pair_ms / 1000))
+    service.embedding_cache = QueryEmbeddingCache(persistent=False)
+    # Every question is new work: nothing may come from the answer cache
+    service.answer_cache.threshold = 2.0
+    return service
+
+
+def run_loop(service, questions):
+    for question in questions:
+        gen, _ = service.get_response_and_context(question)
+        if gen is not None:
+            "".join(gen)
+
+
+def run_batch(service, questions, concurrency: int):
+    """Returns seconds until the first answer arrived."""
+    first = None
+    start = time.perf_counter()
+    for _ in service.answer_many(questions, concurrency=concurrency):
+        first = first or time.perf_counter() - start
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50, help="corpus size in pages")
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--embed-latency-ms", type=float, default=150.0, help="simulated embedding API round trip")
+    parser.add_argument("--rerank-pair-ms", type=float, default=0.0)
+    parser.add_argument("--llm-first-token-ms", type=float, default=200.0)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    questions = make_queries(args.questions)
+    tokens = [f" token{i}" for i in range(64)]
+    rows = []
+    with StubOllama(tokens=tokens, token_delay=args.llm_token_ms / 1000,
+                    first_token_delay=args.llm_first_token_ms / 1000) as stub, tempfile.TemporaryDirectory() as tmp:
+        if not setup_schema():
+            print("pg_search not installed: hybrid search needs ParadeDB, nothing to compare", file=sys.stderr)
+            drop_schema()
+            close_pools()
+            return
+        embedder = FakeEmbedder(latency=args.embed_latency_ms / 1000)
+        bench_ingest([], args.pages, make_corpus(os.path.join(tmp, "corpus"), args.pages), embedder, PDF_WORKERS)
+        try:
+            cases = [("per-question loop", None)] + [(f"answer_many x{c}", c) for c in args.concurrency]
+            for name, concurrency in cases:
+                embedder.calls = 0
+                service = make_service(stub.url, embedder, args.rerank_pair_ms)
+                start = time.perf_counter()
+                first = run_loop(service, questions) if concurrency is None else run_batch(service, questions, concurrency)
+                seconds = time.perf_counter() - start
+                rows.append((name, seconds, first, embedder.calls))
+                service.reranker.close()
+                service.llm.close()
+        finally:
+            drop_schema()
+    close_pools()
+
+    base = rows[0][1]
+    print(f"\n{args.questions} questions, {args.pages} pages")
+    print(f"{'case':<22}{'total s':>10}{'q/s':>10}{'speedup':>10}{'first s':>10}{'embed calls':>13}")
+    for name, seconds, first, calls in rows:
+        print(f"{name:<22}{seconds:>10.2f}{args.questions / seconds:>10.2f}{base / seconds:>9.2f}x"
+              f"{'' if first is None else f'{first:.2f}':>10}{calls:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Search latency of one collection while unrelated collections grow next to it. A search scoped
+to the collection should stay flat (it only touches that partition's indexes), an unscoped one
+pays for every partition. Random vectors, runs in its own schema:
+
+    python -m benchmarks.bench_collections --target 5000 --steps 0 20000 60000 --per-collection 20000
+
+On plain Postgres + pgvector (no pg_search) only the ANN leg is timed.
+"""
+import argparse
+import numpy as np
+from benchmarks.common import create_bookkeeping, summarize, timed, use_scratch_schema
+
+SCHEMA = use_scratch_schema("bench_collections")
+
+from src.collection import ensure_collection, has_bm25, partitions  # noqa: E402
+from src.loader import StreamingLoader  # noqa: E402
+from src.pool import get_pool, close_pools  # noqa: E402
+from src.retrieval import RetrievalConfig, SETTINGS_SQL, ann_sql, fetch_candidates, _scope, _settings  # noqa: E402
+
+WORDS = ("vacuum wal checkpoint index planner replication lock tuple toast buffer asyncio generator "
+         "decorator typing dataclass import module thread process socket").split()
+
+
+def setup_schema(dim: int):
+    """Fresh scratch schema shaped like architecture/init.sql, at `dim` dimensions."""
+    with get_pool().connection() as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        conn.execute(f"""CREATE TABLE {SCHEMA}.doc_chunks (
+            id SERIAL, content TEXT NOT NULL, filename TEXT, embedding vector({dim}), page_number INTEGER,
+            chunk_hash TEXT, file_hash TEXT, embedding_model TEXT, embedding_dim INTEGER,
+            collection TEXT NOT NULL DEFAULT 'default', PRIMARY KEY (id, collection)) PARTITION BY LIST (collection)""")
+        conn.execute(f"""CREATE TABLE {SCHEMA}.collections (
+            name TEXT PRIMARY KEY, keywords TEXT[] NOT NULL DEFAULT '{{}}', created_at TIMESTAMPTZ NOT NULL DEFAULT now())""")
+        conn.execute(f"""CREATE INDEX idx_embedding_hnsw ON {SCHEMA}.doc_chunks USING hnsw (embedding vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64)""")
+        create_bookkeeping(conn, SCHEMA)
+
+
+def load(collection: str, rows: int, dim: int, rng, batch: int = 2000):
+    ensure_collection(collection)
+    loader = StreamingLoader(f"{collection}.pdf", collection=collection)
+    for start in range(0, rows, batch):
+        n = min(batch, rows - start)
+        vectors = rng.standard_normal((n, dim), dtype=np.float32)
+        loader.write_rows((" ".join(rng.choice(WORDS, 30)), start + i, vectors[i]) for i in range(n))
+    with get_pool().connection() as conn:
+        conn.execute("ANALYZE doc_chunks")
+
+
+def search(vectors, queries, config: RetrievalConfig, bm25: bool, collections=None):
+    """Runs every query once per call, returns nothing; hybrid when BM25 exists, else the ANN leg alone."""
+    filters, scope = _scope(collections)
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            for vector, query in zip(vectors, queries):
+                if bm25:
+                    fetch_candidates(cur, vector, query, config, collections)
+                else:
+                    cur.execute(SETTINGS_SQL, _settings(config), prepare=True)
+                    cur.execute(ann_sql("full", len(vector), filters), {"vector": vector, "k_ann": config.k_ann, **scope},
+                                prepare=not filters)
+                cur.fetchall()
+                conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--target", type=int, default=5000, help="rows in the collection that is searched")
+    parser.add_argument("--steps", type=int, nargs="+", default=[0, 20000, 60000],
+                        help="rows in unrelated collections at each measurement")
+    parser.add_argument("--per-collection", type=int, default=20000, help="rows per unrelated collection")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    config = RetrievalConfig()
+    setup_schema(args.dim)
+    with get_pool().connection() as conn:
+        bm25 = has_bm25(conn)
+    load("target", args.target, args.dim, rng)
+    vectors = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    queries = [" ".join(rng.choice(WORDS, 3)) for _ in range(args.queries)]
+
+    results, unrelated = [], 0
+    try:
+        for step in sorted(args.steps):
+            while unrelated < step:
+                rows = min(args.per_collection, step - unrelated)
+                load(f"other-{unrelated // args.per_collection}", rows, args.dim, rng)
+                unrelated += rows
+            with get_pool().connection() as conn:
+                count = len(partitions(conn))
+            for name, collections in (("scoped", ["target"]), ("unscoped", None)):
+                samples = timed(lambda: search(vectors, queries, config, bm25, collections), args.runs)
+                row = summarize(name, [s / args.queries for s in samples])
+                row.update(unrelated=unrelated, partitions=count)
+                results.append(row)
+    finally:
+        if not args.keep:
+            with get_pool().connection() as conn:
+                conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        close_pools()
+
+    print(f"\n{'hybrid search' if bm25 else 'ANN leg (no pg_search)'}, {args.target} rows in the searched collection, "
+          f"{args.dim} dims, ms per query")
+    print(f"{'unrelated rows':>15}{'partitions':>12}{'case':>10}{'p50':>10}{'p95':>10}")
+    for r in results:
+        print(f"{r['unrelated']:>15}{r['partitions']:>12}{r['name']:>10}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
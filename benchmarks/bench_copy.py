@@ -0,0 +1,104 @@
+"""
+Text COPY (the original loader) vs streaming binary COPY from a memmapped checkpoint.
+Each path runs in its own subprocess so peak RSS is measured separately. Needs a reachable
+Postgres with pgvector; rows go to a scratch table that is dropped at the end.
+
+    python -m benchmarks.bench_copy --rows 20000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.common import PROJECT_ROOT
+from src.db import EMBEDDING_DIMENSION
+from src.pool import get_pool
+
+TABLE = "bench_copy_target"
+BATCH = 100
+
+
+def make_table():
+    with get_pool().connection() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        conn.execute(f"""CREATE TABLE {TABLE} (
+            id SERIAL PRIMARY KEY, content TEXT NOT NULL, filename TEXT,
+            embedding vector({EMBEDDING_DIMENSION}), page_number INTEGER)""")
+
+
+def synthetic_rows(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        yield f"chunk {i} " + "lorem ipsum " * 80, i // 5 + 1, rng.standard_normal(EMBEDDING_DIMENSION, dtype=np.float32)
+
+
+def run_text(rows: int):
+    # Mirrors the original ingestPdf: every vector kept as a Python list until the end, then one text COPY
+    chunks, vectors, pages = [], [], []
+    for text, page, vector in synthetic_rows(rows):
+        chunks.append(text)
+        pages.append(page)
+        vectors.append(vector.tolist())
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(f"COPY {TABLE} (content, embedding, filename, page_number) FROM STDIN") as copy:
+                for chunk, vector, page in zip(chunks, vectors, pages):
+                    vector_str = "[" + ",".join(map(str, vector)) + "]"
+                    copy.write_row((chunk, vector_str, "bench.pdf", page))
+    return time.perf_counter() - start
+
+
+def run_binary(rows: int):
+    from src.checkpoint import CheckpointStore
+    from src.loader import StreamingLoader
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore("bench.pdf", directory=tmp)
+        store.write_plan((text, page) for text, page, _ in synthetic_rows(rows))
+        generated = synthetic_rows(rows)
+        loader = StreamingLoader("bench.pdf", table=TABLE)
+        start = time.perf_counter()
+        # Same shape as ingestPdf: append a batch to the checkpoint, then load it in its own transaction
+        while store.committed < rows:
+            batch = [next(generated) for _ in range(min(BATCH, rows - store.committed))]
+            store.append(np.stack([v for _, _, v in batch]))
+            loader.write_rows(batch)
+        return time.perf_counter() - start
+
+
+def child(mode: str, rows: int):
+    elapsed = run_text(rows) if mode == "text" else run_binary(rows)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "rows": rows, "seconds": elapsed,
+                      "rows_per_sec": rows / elapsed, "peak_rss_mb": peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--child", choices=["text", "binary"])
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.rows)
+        return
+
+    results = []
+    for mode in ("text", "binary"):
+        make_table()
+        out = subprocess.run([sys.executable, "-m", "benchmarks.bench_copy", "--child", mode, "--rows", str(args.rows)],
+                             cwd=PROJECT_ROOT, capture_output=True, text=True, check=True, env=os.environ)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    with get_pool().connection() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    print(f"{'path':<10}{'rows':>10}{'seconds':>10}{'rows/sec':>12}{'peak RSS MB':>14}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['rows']:>10}{r['seconds']:>10.2f}{r['rows_per_sec']:>12.0f}{r['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
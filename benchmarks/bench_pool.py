@@ -0,0 +1,59 @@
+"""
+Per-query latency of a fresh psycopg.connect() vs the shared pool.
+Needs a reachable Postgres/ParadeDB (DATABASE_URL or the DB_* variables), e.g.
+
+    python -m benchmarks.bench_pool --runs 200
+"""
+import argparse
+import random
+from benchmarks.common import summarize, timed, print_table, LEGACY_HYBRID_SQL
+import psycopg
+from src.db import get_connection_string
+from src.pool import get_pool, pool_stats
+
+DIM = 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--query", default="io_uring")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vector = [rng.uniform(-1, 1) for _ in range(DIM)]
+    params = (vector, args.query, vector)
+    conn_str = get_connection_string()
+
+    def connect_per_query():
+        with psycopg.connect(conn_str) as conn:
+            with conn.cursor() as cur:
+                cur.execute(LEGACY_HYBRID_SQL, params)
+                cur.fetchall()
+
+    def pooled():
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(LEGACY_HYBRID_SQL, params, prepare=True)
+                cur.fetchall()
+
+    def connect_only():
+        with psycopg.connect(conn_str) as conn:
+            conn.execute("SELECT 1")
+
+    def pooled_only():
+        with get_pool().connection() as conn:
+            conn.execute("SELECT 1")
+
+    rows = [
+        summarize("connect + SELECT 1", timed(connect_only, args.runs)),
+        summarize("pool + SELECT 1", timed(pooled_only, args.runs)),
+        summarize("connect + hybrid search", timed(connect_per_query, args.runs)),
+        summarize("pool + prepared hybrid search", timed(pooled, args.runs)),
+    ]
+    print_table(rows)
+    print(pool_stats())
+
+
+if __name__ == "__main__":
+    main()
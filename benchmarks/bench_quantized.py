@@ -0,0 +1,89 @@
+"""
+Storage size, ANN latency and recall@k of each VECTOR_STORAGE mode against exact search.
+Query vectors are sampled from stored chunks, so it runs against whatever corpus is loaded.
+Compact indexes have to exist (`python -m src.quantize halfvec`), or pass --create:
+
+    python -m benchmarks.bench_quantized --queries 100 --k 10 --rescore 40 100 200 --create
+"""
+import argparse
+import time
+from benchmarks.common import summarize
+from benchmarks.bench_retrieval import sample_queries, exact_neighbours
+from src.pool import get_pool
+from src.quantize import build, pgvector_version, corpus_dimension, index_sizes
+from src.retrieval import RetrievalConfig, COMPACT_STORAGE, SETTINGS_SQL, ann_sql, _settings
+
+INDEX_NAMES = {"full": "idx_embedding_hnsw", **{s: f"idx_embedding_{s}" for s in COMPACT_STORAGE}}
+
+
+def run_ann(cur, storage: str, dim: int, vector, config: RetrievalConfig):
+    cur.execute(SETTINGS_SQL, _settings(config))
+    cur.execute(ann_sql(storage, dim), {"vector": vector, "k_ann": config.k_ann,
+                                        "k_rescore": max(config.rescore_k, config.k_ann)})
+    return [r[0] for r in cur.fetchall()]
+
+
+def uses_index(cur, storage: str, dim: int, vector, config: RetrievalConfig) -> bool:
+    cur.execute(SETTINGS_SQL, _settings(config))
+    cur.execute("EXPLAIN " + ann_sql(storage, dim), {"vector": vector, "k_ann": config.k_ann,
+                                                     "k_rescore": max(config.rescore_k, config.k_ann)})
+    return any(INDEX_NAMES[storage] in r[0] for r in cur.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10, help="recall@k and the ANN leg's LIMIT")
+    parser.add_argument("--ef", type=int, default=80)
+    parser.add_argument("--storage", nargs="+", default=["full", *COMPACT_STORAGE])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[50, 100, 200, 400],
+                        help="candidates taken from the compact index before exact re-scoring")
+    parser.add_argument("--create", action="store_true", help="build missing compact indexes first")
+    args = parser.parse_args()
+
+    with get_pool().connection() as conn:
+        version = pgvector_version(conn)
+        dim = corpus_dimension(conn)
+    storages = [s for s in args.storage if s == "full" or version >= (0, 7, 0)]
+    if len(storages) < len(args.storage):
+        print(f"pgvector {'.'.join(map(str, version))}: halfvec/binary need 0.7+, only running {storages}")
+    if args.create:
+        for storage in storages:
+            build(storage)
+
+    results = []
+    with get_pool().connection() as conn:
+        sizes = index_sizes(conn)
+        with conn.cursor() as cur:
+            samples = sample_queries(cur, args.queries)
+            truth = [exact_neighbours(cur, v, args.k) for v, _ in samples]
+            conn.commit()
+            for storage in storages:
+                if INDEX_NAMES[storage] not in sizes:
+                    print(f"{storage}: {INDEX_NAMES[storage]} missing, run `python -m src.quantize {storage}` or pass --create")
+                    continue
+                for rescore_k in ([0] if storage == "full" else args.rescore):
+                    config = RetrievalConfig(k_ann=args.k, ef_search=args.ef, storage=storage, rescore_k=rescore_k)
+                    indexed = uses_index(cur, storage, dim, samples[0][0], config)
+                    conn.commit()
+                    samples_ms, hits = [], 0
+                    for (vector, _), exact in zip(samples, truth):
+                        start = time.perf_counter()
+                        found = run_ann(cur, storage, dim, vector, config)
+                        samples_ms.append((time.perf_counter() - start) * 1000)
+                        conn.commit()
+                        hits += len(set(found) & exact)
+                    row = summarize(storage if storage == "full" else f"{storage} rescore={rescore_k}", samples_ms)
+                    row.update(index_mb=sizes[INDEX_NAMES[storage]] / 2**20, recall=hits / (len(samples) * args.k),
+                               indexed=indexed)
+                    results.append(row)
+
+    print(f"\ndoc_chunks {dim} dims, heap + TOAST {sizes['doc_chunks'] / 2**20:.1f} MB, ef_search={args.ef}")
+    print(f"{'case':<26}{'index MB':>10}{'p50 ms':>10}{'p95 ms':>10}{'recall@' + str(args.k):>12}  index used")
+    for r in results:
+        print(f"{r['name']:<26}{r['index_mb']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['recall']:>12.3f}  "
+              f"{'yes' if r['indexed'] else 'NO (seq scan)'}")
+
+
+if __name__ == "__main__":
+    main()
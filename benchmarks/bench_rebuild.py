@@ -0,0 +1,147 @@
+"""
+Full corpus reload the old way (empty doc_chunks, then one COPY per file into the indexed table)
+against src.rebuild (UNLOGGED staging table, indexes built once at the end, swap). A reader counts
+doc_chunks rows throughout, to show what searches see while each one runs. Random vectors, in its
+own schema:
+
+    python -m benchmarks.bench_rebuild --files 20 --rows-per-file 2000 --dim 256 --parallel 0 2 4
+"""
+import argparse
+import threading
+import time
+import numpy as np
+from benchmarks.common import create_bookkeeping, use_scratch_schema
+
+SCHEMA = use_scratch_schema("bench_rebuild")
+
+from src import rebuild  # noqa: E402
+from src.collection import DEFAULT_COLLECTION  # noqa: E402
+from src.loader import StreamingLoader  # noqa: E402
+from src.pool import get_pool, close_pools  # noqa: E402
+
+WORDS = "vacuum wal checkpoint index planner replication lock tuple toast buffer asyncio generator".split()
+
+
+def setup_schema(dim: int):
+    """Fresh scratch schema shaped like architecture/init.sql, at `dim` dimensions."""
+    with get_pool().connection() as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        conn.execute(f"""CREATE TABLE {SCHEMA}.doc_chunks (
+            id SERIAL, content TEXT NOT NULL, filename TEXT, embedding vector({dim}), page_number INTEGER,
+            chunk_hash TEXT, file_hash TEXT, embedding_model TEXT, embedding_dim INTEGER,
+            collection TEXT NOT NULL DEFAULT 'default', PRIMARY KEY (id, collection)) PARTITION BY LIST (collection)""")
+        conn.execute(f"""CREATE TABLE {SCHEMA}.collections (
+            name TEXT PRIMARY KEY, keywords TEXT[] NOT NULL DEFAULT '{{}}', created_at TIMESTAMPTZ NOT NULL DEFAULT now())""")
+        conn.execute(f"""CREATE INDEX idx_embedding_hnsw ON {SCHEMA}.doc_chunks USING hnsw (embedding vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64)""")
+        conn.execute(f"CREATE INDEX idx_doc_chunks_file ON {SCHEMA}.doc_chunks (filename, file_hash)")
+        # Not ensure_collection: public.doc_chunks_default would pass for this schema's partition
+        conn.execute(f"CREATE TABLE {SCHEMA}.doc_chunks_default PARTITION OF {SCHEMA}.doc_chunks FOR VALUES IN ('default')")
+        conn.execute(f"INSERT INTO {SCHEMA}.collections (name) VALUES ('default')")
+        create_bookkeeping(conn, SCHEMA)
+
+
+def load(table: str, files: int, rows: int, dim: int, batch: int = 500):
+    rng = np.random.default_rng(0)
+    for f in range(files):
+        loader = StreamingLoader(f"file_{f:03d}.pdf", table=table, collection=DEFAULT_COLLECTION)
+        for start in range(0, rows, batch):
+            n = min(batch, rows - start)
+            vectors = rng.standard_normal((n, dim), dtype=np.float32)
+            loader.write_rows((" ".join(rng.choice(WORDS, 30)), start + i, vectors[i]) for i in range(n))
+
+
+class Reader:
+    """Counts doc_chunks rows in a loop until stopped; `seen` is every count it got."""
+    def __init__(self):
+        self.seen = []
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        with get_pool().connection() as conn:
+            while not self._stop.is_set():
+                try:
+                    self.seen.append(conn.execute("SELECT count(*) FROM doc_chunks", prepare=True).fetchone()[0])
+                    conn.commit()
+                except Exception:
+                    self.errors += 1
+                    conn.rollback()
+                time.sleep(0.01)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def reload_in_place(args) -> dict:
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        conn.execute("TRUNCATE doc_chunks")
+    load("doc_chunks", args.files, args.rows_per_file, args.dim)
+    with get_pool().connection() as conn:
+        conn.execute("ANALYZE doc_chunks")
+    return {"load_s": time.perf_counter() - start, "index_s": 0.0, "swap_s": 0.0}
+
+
+def staged(args, parallel: int) -> dict:
+    collections = [DEFAULT_COLLECTION]
+    with get_pool().connection() as conn:
+        rebuild.create_staging(conn, collections, args.dim)
+        start = time.perf_counter()
+        load(f"{rebuild.STAGING_SCHEMA}.doc_chunks", args.files, args.rows_per_file, args.dim)
+        rebuild.set_logged(conn, collections)
+        load_s = time.perf_counter() - start
+        timings = rebuild.build_indexes(conn, collections, parallel)
+        conn.execute(f"ANALYZE {rebuild.STAGING_SCHEMA}.doc_chunks")
+        conn.commit()
+        swap_s = rebuild.swap(conn, collections)
+    return {"load_s": load_s, "index_s": sum(s for _, s in timings), "swap_s": swap_s}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--rows-per-file", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--parallel", type=int, nargs="+", default=[0, 2, 4],
+                        help="max_parallel_maintenance_workers for the staged index builds")
+    args = parser.parse_args()
+    total = args.files * args.rows_per_file
+
+    results = []
+    setup_schema(args.dim)
+    try:
+        # Something to serve while the first rebuild runs
+        load("doc_chunks", args.files, args.rows_per_file, args.dim)
+        cases = [("reload in place", None)] + [(f"staged, {p} workers", p) for p in args.parallel]
+        for name, parallel in cases:
+            with Reader() as reader:
+                start = time.perf_counter()
+                row = reload_in_place(args) if parallel is None else staged(args, parallel)
+                row["total_s"] = time.perf_counter() - start
+                time.sleep(0.05)
+            # Anything the reader saw other than the full corpus was a partial (or empty) search
+            row.update(name=name, partial=sum(n != total for n in reader.seen) / max(len(reader.seen), 1),
+                       errors=reader.errors)
+            results.append(row)
+    finally:
+        with get_pool().connection() as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        close_pools()
+
+    print(f"\n{total} rows ({args.files} files x {args.rows_per_file}), {args.dim} dims")
+    print(f"{'case':<22}{'load s':>9}{'index s':>9}{'swap s':>9}{'total s':>9}{'partial reads':>15}{'errors':>8}")
+    for r in results:
+        print(f"{r['name']:<22}{r['load_s']:>9.2f}{r['index_s']:>9.2f}{r['swap_s']:>9.3f}{r['total_s']:>9.2f}"
+              f"{r['partial']:>14.0%}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Cross-encoder rerank latency on CPU: the original call (fp32, one predict over all pairs) vs
+the Reranker backends, plus a repeated query served from the score cache.
+Needs the model in the local Hugging Face cache (or network access), no database.
+
+    python -m benchmarks.bench_rerank --runs 30 --backends torch,quantized,onnx
+"""
+import argparse
+import random
+import time
+from benchmarks.common import summarize, timed, print_table
+from src.reranker import Reranker, load_cross_encoder, RERANKER_MODEL
+
+WORDS = ("postgres", "index", "vacuum", "checkpoint", "wal", "buffer", "query", "planner", "tuple",
+         "lock", "replication", "io_uring", "latency", "throughput", "page", "segment", "hnsw", "bm25")
+
+
+def synthetic_candidates(n: int, seed: int = 0):
+    # Chunks are up to 1000 characters, the tail of a page is shorter
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        size = rng.choice((1000, 1000, 1000, 600, 250))
+        text = ""
+        while len(text) < size:
+            text += rng.choice(WORDS) + " "
+        rows.append((text[:size], "bench.pdf", i + 1, 0.0, i))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=RERANKER_MODEL)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--backends", default="torch,quantized")
+    args = parser.parse_args()
+
+    candidates = synthetic_candidates(args.candidates)
+    queries = iter(f"how does {w} affect {v}?" for v in WORDS for w in WORDS)
+    results = []
+
+    baseline, _, _ = load_cross_encoder(args.model, device="cpu", backend="torch", threads=args.threads)
+    pairs = [[next(queries), c[0]] for c in candidates]
+    results.append(summarize("original: fp32 predict(all pairs)", timed(lambda: baseline.predict(pairs), args.runs)))
+
+    for backend in args.backends.split(","):
+        model, _, loaded = load_cross_encoder(args.model, device="cpu", backend=backend, threads=args.threads)
+        if loaded != backend:
+            print(f"{backend}: not available here, ran as {loaded}")
+            continue
+        reranker = Reranker(model=model, model_name=args.model, device="cpu", backend=loaded)
+        # A new query every run so nothing comes from the score cache
+        results.append(summarize(f"{loaded}: bucketed, cold",
+                                 timed(lambda: reranker.rerank(next(queries), candidates), args.runs)))
+        results.append(summarize(f"{loaded}: repeated query (cached)",
+                                 timed(lambda: reranker.rerank("repeated question", candidates), args.runs)))
+
+    print_table(results)
+    print(f"\n{'case':<40}{'pairs/sec':>12}")
+    for r in results:
+        print(f"{r['name']:<40}{args.candidates / (r['mean_ms'] / 1000):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Concurrent rerank load: every simulated user reranks 20 fresh candidates per query, either
+calling the cross-encoder directly (the original behaviour) or through the shared RerankBatcher.
+The score cache is disabled so every query hits the model.
+
+    python -m benchmarks.bench_rerank_load --users 16 --queries 5 --backend quantized
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.common import summarize, print_table
+from benchmarks.bench_rerank import synthetic_candidates
+from src.reranker import Reranker, load_cross_encoder, RERANKER_MODEL
+
+
+def run(reranker: Reranker, users: int, queries: int, candidates):
+    latencies = []
+
+    def user(n):
+        for i in range(queries):
+            start = time.perf_counter()
+            reranker.rerank(f"user {n} question {i} about vacuum and wal", candidates)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=RERANKER_MODEL)
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20)
+    args = parser.parse_args()
+
+    model, device, backend = load_cross_encoder(args.model, device=args.device, backend=args.backend)
+    candidates = synthetic_candidates(args.candidates)
+    rows, throughput = [], {}
+    for batching in (False, True):
+        reranker = Reranker(model=model, model_name=args.model, device=device, backend=backend,
+                            cache_size=0, batching=batching)
+        latencies, elapsed = run(reranker, args.users, args.queries, candidates)
+        name = "micro-batched" if batching else "direct predict per request"
+        rows.append(summarize(name, latencies))
+        throughput[name] = (args.users * args.queries / elapsed, reranker.stats.get("batcher"))
+        reranker.close()
+
+    print(f"{args.users} users x {args.queries} queries, {args.candidates} pairs each, {device} ({backend})")
+    print_table(rows)
+    print(f"\n{'case':<40}{'queries/sec':>12}{'batch fill':>12}{'pairs/batch':>12}")
+    for name, (qps, metrics) in throughput.items():
+        fill = f"{metrics['batch_fill']:.2f}" if metrics else "-"
+        per_batch = f"{metrics['pairs_per_batch']:.1f}" if metrics else "-"
+        print(f"{name:<40}{qps:>12.2f}{fill:>12}{per_batch:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Recall vs latency of the fused index-backed retrieval against the legacy OR-filtered query.
+Query vectors are sampled from stored chunks (and their first words are used as the text query),
+so it runs against whatever corpus is already loaded:
+
+    python -m benchmarks.bench_retrieval --queries 50 --ef 40 80 200
+"""
+import argparse
+import time
+from benchmarks.common import summarize, print_table, LEGACY_HYBRID_SQL
+from src.pool import get_pool
+from src.retrieval import RetrievalConfig, fetch_candidates, fuse
+
+EXACT_SQL = """
+    SELECT id FROM doc_chunks
+    ORDER BY embedding <=> %s::vector
+    LIMIT %s
+    """
+
+
+def sample_queries(cur, n: int):
+    cur.execute("SELECT embedding::text, content FROM doc_chunks ORDER BY random() LIMIT %s", (n,))
+    samples = []
+    for vector_text, content in cur.fetchall():
+        vector = [float(x) for x in vector_text.strip("[]").split(",")]
+        words = [w for w in content.split() if w.isalnum()][:6]
+        samples.append((vector, " ".join(words) or "postgres"))
+    return samples
+
+
+def exact_neighbours(cur, vector, k: int):
+    # Planner is forced off the ANN index so this is the true top-k
+    cur.execute("SET LOCAL enable_indexscan = off")
+    cur.execute(EXACT_SQL, (vector, k))
+    ids = {r[0] for r in cur.fetchall()}
+    cur.execute("RESET enable_indexscan")
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--ef", type=int, nargs="+", default=[40, 80, 200])
+    args = parser.parse_args()
+
+    rows = []
+    recall_report = []
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            samples = sample_queries(cur, args.queries)
+            truth = [exact_neighbours(cur, v, args.k) for v, _ in samples]
+            conn.commit()
+
+            legacy_ms, legacy_ids = [], []
+            for vector, text in samples:
+                start = time.perf_counter()
+                cur.execute(LEGACY_HYBRID_SQL, (vector, text, vector))
+                result = cur.fetchall()
+                legacy_ms.append((time.perf_counter() - start) * 1000)
+                legacy_ids.append({(r[1], r[2], r[0][:64]) for r in result})
+            conn.commit()
+            rows.append(summarize("legacy OR-filtered scan", legacy_ms))
+
+            for ef in args.ef:
+                config = RetrievalConfig(k_ann=args.k, ef_search=ef)
+                fused_ms, ann_hits, overlap = [], 0, 0
+                for (vector, text), exact, old in zip(samples, truth, legacy_ids):
+                    start = time.perf_counter()
+                    candidates = fetch_candidates(cur, vector, text, config)
+                    fused = fuse(candidates, config)
+                    fused_ms.append((time.perf_counter() - start) * 1000)
+                    conn.commit()
+                    ann_ids = {r[0] for r in candidates if r[1] == "ann"}
+                    ann_hits += len(ann_ids & exact)
+                    overlap += len({(r[1], r[2], r[0][:64]) for r in fused} & old)
+                rows.append(summarize(f"fused ({config.fusion}) ef_search={ef}", fused_ms))
+                recall_report.append((ef, ann_hits / (len(samples) * args.k), overlap / max(1, sum(map(len, legacy_ids)))))
+
+    print_table(rows)
+    print(f"\n{'ef_search':<12}{'ANN recall@' + str(args.k):>16}{'overlap w/ legacy':>20}")
+    for ef, recall, overlap in recall_report:
+        print(f"{ef:<12}{recall:>16.3f}{overlap:>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import statistics
+
+# Benchmarks are run from the repo root: python -m benchmarks.<name>
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+
+def use_scratch_schema(name: str) -> str:
+    """
+    Every pooled connection opened afterwards resolves doc_chunks (and the other tables) to schema `name`,
+    real data is never touched. Call it before the pool opens its first connection. Returns `name`.
+    """
+    os.environ["PGOPTIONS"] = f"-c search_path={name},public"
+    return name
+
+
+def create_bookkeeping(conn, schema: str):
+    """
+    ingested_files and corpus_generation (with its row) in the scratch schema, as architecture/init.sql
+    has them. Without them mark_complete and the corpus watcher fall through to the public tables.
+    """
+    conn.execute(f"""CREATE TABLE {schema}.ingested_files (
+        filename TEXT NOT NULL, collection TEXT NOT NULL DEFAULT 'default', file_hash TEXT NOT NULL,
+        chunks INTEGER NOT NULL, completed_at TIMESTAMPTZ NOT NULL DEFAULT now(), PRIMARY KEY (filename, collection))""")
+    conn.execute(f"""CREATE TABLE {schema}.corpus_generation (
+        id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id), generation BIGINT NOT NULL DEFAULT 0)""")
+    conn.execute(f"INSERT INTO {schema}.corpus_generation DEFAULT VALUES")
+
+
+# The original OR-filtered full-scan query, kept as the comparison baseline
+LEGACY_HYBRID_SQL = """
+    SELECT content, filename, page_number,
+    ( paradedb.score(id) + (1.0 - (embedding <=> %s::vector))) as combined_score
+    FROM doc_chunks 
+    WHERE 
+        id @@@ paradedb.match('content', %s)
+        OR 
+        embedding <=> %s::vector < 0.5 
+    ORDER BY combined_score DESC
+    LIMIT 20
+    """
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def summarize(name: str, samples_ms) -> dict:
+    return {
+        "name": name,
+        "runs": len(samples_ms),
+        "mean_ms": statistics.fmean(samples_ms) if samples_ms else 0.0,
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "max_ms": max(samples_ms) if samples_ms else 0.0,
+    }
+
+
+def timed(fn, runs: int, warmup: int = 1):
+    """Calls fn() warmup+runs times and returns the timed samples in ms."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def print_table(rows):
+    print(f"{'case':<40}{'runs':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for r in rows:
+        print(f"{r['name']:<40}{r['runs']:>6}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['max_ms']:>10.2f}")
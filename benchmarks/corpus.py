@@ -0,0 +1,66 @@
+"""
+Deterministic synthetic corpus: PostgreSQL-manual-like pages rendered into PDFs with the same
+heading/bold/body font sizes renderPage turns into markdown. Same seed, same bytes.
+"""
+import os
+import random
+import fitz
+
+TOPICS = ("checkpoint", "vacuum", "autovacuum", "wal", "replication", "index", "hnsw", "bm25", "planner",
+          "shared_buffers", "work_mem", "io_uring", "tuple", "toast", "lock", "deadlock", "partition",
+          "statistics", "bgwriter", "fsync", "copy", "prepared statement", "connection pool", "latency")
+VERBS = ("controls", "reduces", "increases", "triggers", "delays", "flushes", "scans", "rewrites", "limits")
+PARAMS = ("checkpoint_timeout", "max_wal_size", "maintenance_work_mem", "effective_io_concurrency",
+          "random_page_cost", "hnsw.ef_search", "autovacuum_naptime", "wal_compression", "io_method")
+PAGES_PER_PDF = 50
+LINES_PER_PAGE = 38
+
+
+def sentence(rng: random.Random) -> str:
+    a, b = rng.sample(TOPICS, 2)
+    return (f"The {a} subsystem {rng.choice(VERBS)} {b} activity when {rng.choice(PARAMS)} "
+            f"is set to {rng.randint(1, 512)}{rng.choice(('ms', 'MB', 's', ''))}.")
+
+
+def page_lines(rng: random.Random, page: int):
+    """(text, fontsize, bold) lines for one page."""
+    lines = [(f"Chapter {page // 10 + 1}: {rng.choice(TOPICS).title()}", 18, False),
+             (f"{page // 10 + 1}.{page % 10 + 1} Tuning {rng.choice(PARAMS)}", 13, False),
+             ("Note:", 10, True)]
+    text = " ".join(sentence(rng) for _ in range(14))
+    # Wrap to the page width so every page carries roughly the same amount of text
+    while text and len(lines) < LINES_PER_PAGE:
+        cut = text.rfind(" ", 0, 95)
+        cut = len(text) if len(text) <= 95 or cut <= 0 else cut
+        lines.append((text[:cut], 9, False))
+        text = text[cut:].lstrip()
+    return lines
+
+
+def make_pdf(path: str, pages: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        y = 60
+        for text, size, bold in page_lines(rng, n):
+            page.insert_text((50, y), text, fontsize=size, fontname="hebo" if bold else "helv")
+            y += size + 8
+    doc.save(path, deflate=True)
+    doc.close()
+    return path
+
+
+def make_corpus(directory: str, total_pages: int, seed: int = 0) -> list:
+    """Splits total_pages over PDFs of at most PAGES_PER_PDF pages, returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, start in enumerate(range(0, total_pages, PAGES_PER_PDF)):
+        path = os.path.join(directory, f"synthetic_{total_pages}_{i:03d}.pdf")
+        paths.append(make_pdf(path, min(PAGES_PER_PDF, total_pages - start), seed=seed * 1000 + i))
+    return paths
+
+
+def make_queries(n: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [f"how does {rng.choice(PARAMS)} affect {rng.choice(TOPICS)}?" for _ in range(n)]
@@ -0,0 +1,56 @@
+"""
+Offline stand-ins for the paid/remote parts of the pipeline, all deterministic:
+FakeEmbedder for embed_text, FakeCrossEncoder for the reranker model, and the stub
+Ollama server from benchmarks/stub_ollama.py (which the tests use too).
+"""
+import re
+import time
+import numpy as np
+import xxhash
+from src.db import EMBEDDING_DIMENSION
+from benchmarks.stub_ollama import StubOllama  # noqa: F401  re-exported for the suite
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeEmbedder:
+    """
+    Hashed bag-of-words projected onto fixed random directions: the same text always gets the
+    same unit vector and texts sharing words end up close, so ANN search has real structure.
+    `latency` adds a per-call delay to stand in for the network round trip.
+    """
+    def __init__(self, dim: int = EMBEDDING_DIMENSION, buckets: int = 4096, seed: int = 0, latency: float = 0.0):
+        rng = np.random.default_rng(seed)
+        self.table = rng.standard_normal((buckets, dim)).astype(np.float32)
+        self.buckets = buckets
+        self.latency = latency
+        self.calls = 0
+        self.texts = 0
+
+    def vector(self, text: str) -> np.ndarray:
+        idx = [xxhash.xxh32_intdigest(w) % self.buckets for w in _WORD.findall(text.casefold())]
+        v = self.table[idx].sum(axis=0) if idx else self.table[0].copy()
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def __call__(self, texts, is_query: bool = False):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.texts += len(texts)
+        return [self.vector(t) for t in texts]
+
+
+class FakeCrossEncoder:
+    """Word-overlap scorer with the CrossEncoder.predict signature and a fixed per-pair cost."""
+    def __init__(self, per_pair: float = 0.0):
+        self.per_pair = per_pair
+
+    def predict(self, pairs, batch_size: int = 32):
+        if self.per_pair:
+            time.sleep(self.per_pair * len(pairs))
+        scores = []
+        for query, text in pairs:
+            q = set(_WORD.findall(query.casefold()))
+            t = set(_WORD.findall(text.casefold()))
+            scores.append(len(q & t) / (len(q) or 1))
+        return scores
@@ -0,0 +1,66 @@
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubOllama:
+    """
+    Minimal stand-in for Ollama's /api/generate streaming endpoint.
+    Streams `tokens` as NDJSON with `token_delay` seconds between them, then a final done record.
+    Usage:
+        with StubOllama(tokens=["Hi", " there"]) as stub:
+            RagService(ollama_base=stub.url)
+    """
+    def __init__(self, tokens=None, token_delay: float = 0.0, first_token_delay: float = 0.0):
+        self.tokens = tokens or ["Hello", " from", " stub"]
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.requests = []
+        self.connections = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                stub.requests.append(body)
+                stub.connections.add(self.client_address)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                # An empty prompt is how Ollama clients load/keep a model warm
+                tokens = stub.tokens if body.get("prompt") else []
+                time.sleep(stub.first_token_delay)
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(stub.token_delay)
+                    self._write_chunk(json.dumps({"model": body.get("model"), "response": token, "done": False}).encode() + b"\n")
+                final = {"model": body.get("model"), "response": "", "done": True,
+                         "eval_count": len(tokens), "eval_duration": int(max(stub.token_delay, 1e-6) * len(tokens) * 1e9),
+                         "prompt_eval_count": len(body.get("prompt", "").split())}
+                self._write_chunk(json.dumps(final).encode() + b"\n")
+                self._write_chunk(b"")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
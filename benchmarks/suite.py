@@ -0,0 +1,314 @@
+"""
+Offline, deterministic benchmark of every pipeline stage: PDF parse, chunk, embed, COPY load,
+hybrid search, rerank, context packing, time to first token and end to end.
+Embeddings come from FakeEmbedder, the cross-encoder is FakeCrossEncoder and the LLM is the stub
+Ollama server, so only a local Postgres is needed (ParadeDB for the search and end-to-end stages;
+on plain Postgres + pgvector those are reported as skipped). Everything runs in its own schema.
+
+    python -m benchmarks.suite --sizes 20,100 --runs 30 --output bench.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --update-baseline
+    python -m benchmarks.suite --baseline benchmarks/baseline.json   # exits 1 on a regression
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from benchmarks.common import PROJECT_ROOT, create_bookkeeping, summarize, use_scratch_schema
+
+SCHEMA = use_scratch_schema("bench_suite")
+
+from benchmarks.corpus import make_corpus, make_queries  # noqa: E402
+from benchmarks.fakes import FakeEmbedder, FakeCrossEncoder, StubOllama  # noqa: E402
+from src.collection import DEFAULT_COLLECTION, bm25_index_sql, partition_name  # noqa: E402
+from src.db import EMBEDDING_DIMENSION  # noqa: E402
+from src.pool import get_pool, close_pools  # noqa: E402
+
+STAGE_UNITS = {"parse": "pages/s", "chunk": "chunks/s", "embed": "chunks/s", "copy": "rows/s"}
+
+
+def setup_schema() -> bool:
+    """Fresh scratch schema shaped like architecture/init.sql. Returns whether BM25 (pg_search) is available."""
+    with get_pool().connection() as conn:
+        has_bm25 = conn.execute("SELECT EXISTS(SELECT 1 FROM pg_extension WHERE extname = 'pg_search')").fetchone()[0]
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.execute(f"CREATE SCHEMA {SCHEMA}")
+        conn.execute(f"""CREATE TABLE {SCHEMA}.doc_chunks (
+            id SERIAL, content TEXT NOT NULL, filename TEXT, embedding vector({EMBEDDING_DIMENSION}), page_number INTEGER,
+            chunk_hash TEXT, file_hash TEXT, embedding_model TEXT, embedding_dim INTEGER,
+            collection TEXT NOT NULL DEFAULT 'default', PRIMARY KEY (id, collection)) PARTITION BY LIST (collection)""")
+        conn.execute(f"""CREATE TABLE {SCHEMA}.collections (
+            name TEXT PRIMARY KEY, keywords TEXT[] NOT NULL DEFAULT '{{}}', created_at TIMESTAMPTZ NOT NULL DEFAULT now())""")
+        conn.execute(f"INSERT INTO {SCHEMA}.collections (name) VALUES (%s)", (DEFAULT_COLLECTION,))
+        # Not ensure_collection: public.doc_chunks_default would pass for this schema's partition
+        partition = partition_name(DEFAULT_COLLECTION)
+        conn.execute(f"CREATE TABLE {SCHEMA}.{partition} PARTITION OF {SCHEMA}.doc_chunks "
+                     f"FOR VALUES IN ('{DEFAULT_COLLECTION}')")
+        if has_bm25:
+            conn.execute(bm25_index_sql(partition, SCHEMA))
+        conn.execute(f"""CREATE INDEX idx_embedding_hnsw ON {SCHEMA}.doc_chunks USING hnsw (embedding vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64)""")
+        conn.execute(f"CREATE INDEX idx_doc_chunks_file ON {SCHEMA}.doc_chunks (filename, file_hash)")
+        create_bookkeeping(conn, SCHEMA)
+    return has_bm25
+
+
+def drop_schema():
+    with get_pool().connection() as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+
+def stage(results: list, size: int, name: str, samples_ms, items: int = None):
+    entry = summarize(name, samples_ms)
+    entry["size"] = size
+    if items is not None and samples_ms:
+        entry["throughput"] = items / (sum(samples_ms) / 1000 / len(samples_ms))
+        entry["unit"] = STAGE_UNITS.get(name, "items/s")
+    results.append(entry)
+    return entry
+
+
+def timed_runs(fn, runs: int, reset=None):
+    """Calls fn() `runs` times, reset() before each one. Returns the last value and the samples in ms."""
+    samples = []
+    for _ in range(runs):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        value = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return value, samples
+
+
+def bench_ingest(results, size, paths, embedder, workers, runs: int):
+    from src.extract import iterPagesFromPDF
+    from src.ingest import getChunks, CHECKPOINT_EVERY
+    from src.loader import StreamingLoader
+    from src.embed_scheduler import EmbeddingScheduler
+
+    # Each stage is timed `runs` times, one sample would make its p50 whatever that run happened to hit
+    pages, ms = timed_runs(lambda: [(os.path.basename(p), page, text)
+                                    for p in paths for page, text in iterPagesFromPDF(p, workers)], runs)
+    stage(results, size, "parse", ms, len(pages))
+    records, ms = timed_runs(lambda: [(f, chunk, page) for f, page, text in pages for chunk in getChunks(text)], runs)
+    stage(results, size, "chunk", ms, len(records))
+
+    def embed():
+        scheduler = EmbeddingScheduler(embedder, rpm=1e9, tpm=1e12, linger=0.005)
+        try:
+            return scheduler.embed([text for _, text, _ in records])
+        finally:
+            scheduler.close()
+    vectors, ms = timed_runs(embed, runs)
+    stage(results, size, "embed", ms, len(records))
+
+    def load():
+        loaders = {}
+        for start in range(0, len(records), CHECKPOINT_EVERY):
+            window = records[start:start + CHECKPOINT_EVERY]
+            by_file = {}
+            for (filename, text, page), vector in zip(window, vectors[start:start + CHECKPOINT_EVERY]):
+                by_file.setdefault(filename, []).append((text, page, vector))
+            for filename, rows in by_file.items():
+                loaders.setdefault(filename, StreamingLoader(filename)).write_rows(rows)
+    def truncate():
+        with get_pool().connection() as conn:
+            conn.execute(f"TRUNCATE {SCHEMA}.doc_chunks")
+    # Every run loads into an empty table, the last run's rows are what the query stages search
+    _, ms = timed_runs(load, runs, truncate)
+    stage(results, size, "copy", ms, len(records))
+    with get_pool().connection() as conn:
+        conn.execute(f"ANALYZE {SCHEMA}.doc_chunks")
+    return len(records)
+
+
+def ann_candidates(query_vector):
+    """Plain pgvector: ANN leg only, same row shape as hybrid_search."""
+    with get_pool().connection() as conn:
+        return conn.execute("""SELECT content, filename, page_number, 1 - (embedding <=> %s::vector), id
+                               FROM doc_chunks ORDER BY embedding <=> %s::vector LIMIT 20""",
+                            (query_vector, query_vector)).fetchall()
+
+
+def bench_query(results, size, embedder, queries, has_bm25, args, stub):
+    from src.retrieval import hybrid_search
+    from src.reranker import Reranker
+    from src.context_packer import ContextPacker
+    from src.llm import OllamaClient, build_prompt
+    import numpy as np
+
+    vectors = [np.asarray(v) for v in embedder(queries, is_query=True)]
+    candidates = []
+    if has_bm25:
+        samples = []
+        for query, vector in zip(queries, vectors):
+            start = time.perf_counter()
+            candidates.append(hybrid_search(vector, query))
+            samples.append((time.perf_counter() - start) * 1000)
+        stage(results, size, "search", samples)
+    else:
+        candidates = [ann_candidates(v) for v in vectors]
+
+    reranker = Reranker(model=FakeCrossEncoder(args.rerank_pair_ms / 1000), model_name="fake",
+                        cache_size=0, batching=False)
+    packer = ContextPacker()
+    ranked, samples = [], []
+    for query, rows in zip(queries, candidates):
+        start = time.perf_counter()
+        ranked.append(reranker.rerank(query, rows))
+        samples.append((time.perf_counter() - start) * 1000)
+    stage(results, size, "rerank", samples)
+
+    contexts, samples = [], []
+    for rows in ranked:
+        start = time.perf_counter()
+        contexts.append(packer.pack(rows).text)
+        samples.append((time.perf_counter() - start) * 1000)
+    stage(results, size, "pack", samples)
+
+    client = OllamaClient(base_url=stub.url)
+    ttft, generation = [], []
+    for query, context in zip(queries, contexts):
+        start = time.perf_counter()
+        for i, _ in enumerate(client.stream(build_prompt(query, context))):
+            if i == 0:
+                ttft.append((time.perf_counter() - start) * 1000)
+        generation.append((time.perf_counter() - start) * 1000)
+    client.close()
+    stage(results, size, "ttft", ttft)
+    stage(results, size, "generate", generation)
+
+    if has_bm25:
+        stage(results, size, "end_to_end", bench_end_to_end(embedder, queries, stub, args))
+
+
+def bench_end_to_end(embedder, queries, stub, args):
+    import src.RAGService as rag
+    from src.embedding_cache import QueryEmbeddingCache
+    rag.embed_text = embedder
+    service = rag.RagService(ollama_base=stub.url, reranker=FakeCrossEncoder(args.rerank_pair_ms / 1000))
+    service.embedding_cache = QueryEmbeddingCache(persistent=False)
+    # Every query is new work: nothing may come from the answer cache
+    service.answer_cache.threshold = 2.0
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        "".join(service.get_response(query))
+        samples.append((time.perf_counter() - start) * 1000)
+    service.reranker.close()
+    service.llm.close()
+    return samples
+
+
+def environment(has_bm25: bool) -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = None
+    with get_pool().connection() as conn:
+        server = conn.execute("SHOW server_version").fetchone()[0]
+    return {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "git": rev,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "postgres": server, "bm25": has_bm25}
+
+
+def compare(results, baseline, tolerance: float, min_delta_ms: float):
+    """Returns (rows for printing, regressions). A stage regresses when its p50 grew past tolerance."""
+    old = {(r["size"], r["name"]): r for r in baseline.get("results", [])}
+    rows, regressions = [], []
+    for r in results:
+        before = old.get((r["size"], r["name"]))
+        if before is None:
+            rows.append((r, None, None, "new"))
+            continue
+        ratio = r["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        regressed = ratio > 1 + tolerance and r["p50_ms"] - before["p50_ms"] > min_delta_ms
+        rows.append((r, before, ratio, "REGRESSION" if regressed else "ok"))
+        if regressed:
+            regressions.append(r)
+    return rows, regressions
+
+
+def print_results(results, comparison=None):
+    print(f"{'size':>6} {'stage':<12}{'runs':>6}{'p50 ms':>10}{'p95 ms':>10}{'throughput':>18}{'baseline':>10}{'ratio':>8}  status")
+    rows = comparison or [(r, None, None, "") for r in results]
+    for r, before, ratio, status in rows:
+        rate = f"{r['throughput']:.0f} {r['unit']}" if "throughput" in r else ""
+        base = f"{before['p50_ms']:.2f}" if before else ""
+        change = f"{ratio:.2f}x" if ratio is not None else ""
+        print(f"{r['size']:>6} {r['name']:<12}{r['runs']:>6}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{rate:>18}{base:>10}{change:>8}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="20,100", help="corpus sizes in pages, comma separated")
+    parser.add_argument("--runs", type=int, default=20, help="queries per query-side stage")
+    parser.add_argument("--ingest-runs", type=int, default=5, help="samples per ingest stage")
+    parser.add_argument("--workers", type=int, default=None, help="PDF parse processes (default PDF_WORKERS)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated embedding API round trip")
+    parser.add_argument("--rerank-pair-ms", type=float, default=0.0, help="simulated cross-encoder cost per pair")
+    parser.add_argument("--llm-first-token-ms", type=float, default=0.0)
+    parser.add_argument("--llm-token-ms", type=float, default=0.0)
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite --baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown, 0.25 = 25%%")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--keep-schema", action="store_true")
+    args = parser.parse_args()
+
+    from src.extract import PDF_WORKERS
+    workers = args.workers or PDF_WORKERS
+    sizes = [int(s) for s in args.sizes.split(",")]
+    queries = make_queries(args.runs)
+    results = []
+    tokens = [f" token{i}" for i in range(64)]
+    with StubOllama(tokens=tokens, token_delay=args.llm_token_ms / 1000,
+                    first_token_delay=args.llm_first_token_ms / 1000) as stub, tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            has_bm25 = setup_schema()
+            paths = make_corpus(os.path.join(tmp, str(size)), size)
+            embedder = FakeEmbedder(latency=args.embed_latency_ms / 1000)
+            chunks = bench_ingest(results, size, paths, embedder, workers, args.ingest_runs)
+            print(f"size {size}: {len(paths)} PDFs, {chunks} chunks loaded", file=sys.stderr)
+            bench_query(results, size, embedder, queries, has_bm25, args, stub)
+        env = environment(has_bm25)
+        if not has_bm25:
+            print("pg_search not installed: search and end_to_end skipped, rerank uses ANN-only candidates",
+                  file=sys.stderr)
+        if not args.keep_schema:
+            drop_schema()
+    close_pools()
+
+    report = {"environment": env, "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison, regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f"compared against {args.baseline} ({baseline['environment'].get('git')}, "
+              f"{baseline['environment'].get('timestamp')})")
+        print_results(results, comparison)
+    else:
+        print_results(results)
+    if args.baseline and (args.update_baseline or not os.path.exists(args.baseline)):
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
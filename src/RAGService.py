@@ -1,104 +1,376 @@
-from src.db import get_connection_string, embed_text
-import requests
-import json
-import subprocess
-import psycopg
+from src.db import embed_text, on_corpus_change, CorpusWatcher
+from src.retrieval import hybrid_search, hybrid_search_many, ahybrid_search, RetrievalConfig
+from src.embedding_cache import QueryEmbeddingCache
+from src.answer_cache import SemanticAnswerCache
+from src.reranker import Reranker
+from src.context_packer import ContextPacker
+from src.collection import CollectionRouter, normalize_name
+from src.llm import OllamaClient, LLMTimeout, build_prompt, resolve_endpoint
+from src import telemetry
+import os
+import time
+import asyncio
 import logging
-from sentence_transformers import CrossEncoder
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 logger = logging.getLogger(__name__)
 
+# Per-stage timeouts (seconds) for the async pipeline
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "15"))
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "10"))
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", "15"))
+FIRST_TOKEN_TIMEOUT = float(os.getenv("FIRST_TOKEN_TIMEOUT", "60"))
+TOKEN_IDLE_TIMEOUT = float(os.getenv("TOKEN_IDLE_TIMEOUT", "30"))
+# Threads for blocking work (embedding calls, cross-encoder) taken off the event loop
+OFFLOAD_WORKERS = int(os.getenv("RAG_OFFLOAD_WORKERS", "4"))
+# Generations answer_many runs at once; match Ollama's OLLAMA_NUM_PARALLEL, extra requests only queue there
+BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "2"))
+
+
+class StageTimeout(Exception):
+    """Raised by the async pipeline when a stage runs past its budget."""
+
 
 class RagService:
-    def __init__(self):
-        self.OLLAMA_BASE = self.get_ollama_endpoint()
-        self.reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2", device="cuda")
+    #Construction is cheap: the cross-encoder and the Ollama endpoint are resolved on first use
+    #(or by warmup()), so importing search.py or collecting tests doesn't load a model
+    def __init__(self, ollama_base=None, reranker=None):
+        #Device/backend come from RERANKER_* env vars; a bare model with predict() gets wrapped
+        if reranker is not None and not isinstance(reranker, Reranker):
+            reranker = Reranker(model=reranker)
+        self._reranker = reranker
+        self._init_lock = threading.Lock()
+        self.retrieval_config = RetrievalConfig()
+        self.embedding_cache = QueryEmbeddingCache()
+        self.answer_cache = SemanticAnswerCache()
+        self.context_packer = ContextPacker()
+        self.router = CollectionRouter()
+        on_corpus_change(self.answer_cache.on_corpus_change)
+        #Picks up rebuilds, re-embeds and ingests run by other processes before the answer cache is consulted
+        self.corpus_watcher = CorpusWatcher()
+        self._executor = ThreadPoolExecutor(max_workers=OFFLOAD_WORKERS, thread_name_prefix="rag-offload")
+        #Pooled keep-alive connections to Ollama; the endpoint is looked up on first request
+        self.llm = OllamaClient(base_url=ollama_base, first_token_timeout=FIRST_TOKEN_TIMEOUT,
+                                idle_timeout=TOKEN_IDLE_TIMEOUT, resolver=self.get_ollama_endpoint)
         
+    @property
+    def reranker(self) -> Reranker:
+        if self._reranker is None:
+            with self._init_lock:
+                if self._reranker is None:
+                    self._reranker = Reranker()
+        return self._reranker
+
+    @property
+    def OLLAMA_BASE(self) -> str:
+        return self.llm.base_url
+
+    def warmup(self):
+        """Loads everything a first query would otherwise wait for. Safe to call from any thread, any number of times."""
+        from src.db import get_voyage_client
+        from src.pool import get_pool
+        from src.embeddings import get_provider, assert_corpus_matches, EmbeddingMismatch
+        start = time.perf_counter()
+        # Loads the model into Ollama now, and keeps it loaded, instead of on the first question
+        self.llm.warm()
+        provider = get_provider()
+        if provider.remote:
+            get_voyage_client()
+        else:
+            provider.embed(["warmup"], is_query=True)
+        # One real forward pass so lazy kernel/allocator setup doesn't land on the first user
+        self.reranker.predict([("warmup", "warmup")])
+        try:
+            get_pool()
+            assert_corpus_matches(provider)
+        except EmbeddingMismatch as e:
+            logger.error(str(e))
+        except Exception as e:
+            logger.warning(f"Warmup could not open the database pool: {e}")
+        logger.info(f"RAG service warm in {time.perf_counter() - start:.1f}s")
+
     @staticmethod
     def get_ollama_endpoint():
-        try:
-            window_ip = subprocess.check_output("ip route | grep default | awk '{print $3}'", shell=True).decode().strip()
-            return f"http://{window_ip}:11434"
-        except:
-            return "http://localhost:11434"
+        return resolve_endpoint()
     
-    #Database search with combined ParadeDB and vector similarity scoring
-    def search_database(self, query_vector, query):
-        conn_str = get_connection_string()
-        with psycopg.connect(conn_str) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                        SELECT content, filename, page_number,
-                        ( paradedb.score(id) + (1.0 - (embedding <=> %s::vector))) as combined_score
-                        FROM doc_chunks 
-                        WHERE 
-                            id @@@ paradedb.match('content', %s)
-                            OR 
-                            embedding <=> %s::vector < 0.5 
-                        ORDER BY combined_score DESC
-                        LIMIT 20
-                        """, 
-                        (query_vector, query, query_vector))
-                return cur.fetchall()
+    #Hybrid search: BM25 top-k and HNSW top-k as separate index scans, merged with rank fusion
+    #Rows are (content, filename, page_number, fused_score, id)
+    def search_database(self, query_vector, query, collections=None, files=None):
+        return hybrid_search(query_vector, query, self.retrieval_config, collections, files)
+
+    #Same, for many questions sharing one scope in a single SQL round trip; one result list per question
+    def search_database_many(self, query_vectors, queries, collections=None, files=None):
+        return hybrid_search_many(query_vectors, queries, self.retrieval_config, collections, files)
+
+    #Explicit collections/files win; otherwise a question naming exactly one collection only searches that one.
+    #Returns only the filters that are set, so an unscoped search passes no extra arguments
+    def resolve_scope(self, query, collections=None, files=None) -> dict:
+        if isinstance(collections, str):
+            collections = [collections]
+        if isinstance(files, str):
+            files = [files]
+        if not collections and not files:
+            collections = self.router.route(query)
+            if collections:
+                logger.info(f"Routed to collection {collections[0]}: {query}")
+        scope = {}
+        if collections:
+            scope["collections"] = sorted({normalize_name(c) for c in collections})
+        if files:
+            scope["files"] = sorted(set(files))
+        return scope
+
+    #Answers are cached per scope, the same question asked of another collection is another answer
+    @staticmethod
+    def _cache_scope(scope):
+        return tuple((name, tuple(values)) for name, values in scope.items()) or None
     
+    #Scores are cached per (query, chunk id), so a repeated query skips the cross-encoder
     def rerank_results(self, query, candidates):
-        if not candidates: return []
-        pairs = [[query,c[0]] for c in candidates]
-        scores = self.reranker.predict(pairs)
-        ranked_results = [c for _, c in sorted(zip(scores, candidates), key=lambda x: x[0], reverse=True)]
-        return ranked_results[:10]
+        return self.reranker.rerank(query, candidates)
 
     
-    # RAG response generation with strict adherence to provided context and source citation
-    def generate_response(self, query, context):
-        prompt = f"""
-            You are a Technical Support Engineer. 
-            Your goal is to provide high-precision answers based ONLY on the provided context.
-            <instructions>
-            STRICT RULES:
-            1. Use ONLY information from the Context. If missing, say: "Information not found in provided documents."
-            2. Cite sources in parentheses: (Source: filename, p. XX). 
-            3. DE-DUPLICATION: If multiple sources provide the same fact, combine them into one sentence and list all sources at the end, e.g., (Source: file1, p. 10; file2, p. 55).
-            4. Formatting: Use `code blocks` for Code/SQL/parameters. Do NOT use LaTeX for version numbers or simple integers.
-            </instructions>
-            <context>
-            {context}
-            </context>
-
-            <question>
-            {query}
-            </question>"""
-            
-        url = f"{self.OLLAMA_BASE}/api/generate"
-        payload = {"model": "llama3.1", "prompt": prompt, "stream": True, "options": {"num_ctx": 8192}}
+    # RAG prompt: the static instructions go out as the system prompt (see src/llm.py), so only
+    # context and question differ between requests
+    @staticmethod
+    def build_prompt(query, context):
+        return build_prompt(query, context)
+
+    def generate_response(self, query, context, parent=None):
         # Stream response from Ollama and yield tokens as they arrive
-        full_response = []
-        with requests.post(url, json=payload, stream=True, timeout=60) as response:
-            for line in response.iter_lines():
-                if line:
-                    chunk = json.loads(line.decode('utf-8'))
-                    token = chunk.get("response", "")
-                    
-                    full_response.append(token)
+        with telemetry.span("rag.generate", parent) as span:
+            yield from self.llm.stream(self.build_prompt(query, context), span=span)
+
+    # Async twin of generate_response; closing the generator (user disconnect) closes the HTTP stream
+    async def agenerate_response(self, query, context, parent=None):
+        with telemetry.span("rag.generate", parent) as span:
+            try:
+                async for token in self.llm.astream(self.build_prompt(query, context), span=span):
                     yield token
+            except LLMTimeout as e:
+                raise StageTimeout(str(e))
+
+    async def _offload(self, stage, timeout, fn, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout(timeout):
+                return await loop.run_in_executor(self._executor, fn, *args)
+        except TimeoutError:
+            raise StageTimeout(f"{stage} took longer than {timeout}s")
 
-    # Main method to get RAG response with context for a query
-    def get_response_and_context(self, query):
-        query_vector = embed_text([query], is_query=True)[0]
-        candidates = self.search_database(query_vector, query)
+    async def asearch_database(self, query_vector, query, collections=None, files=None):
+        try:
+            async with asyncio.timeout(SEARCH_TIMEOUT):
+                return await ahybrid_search(query_vector, query, self.retrieval_config, collections, files)
+        except TimeoutError:
+            raise StageTimeout(f"search took longer than {SEARCH_TIMEOUT}s")
+
+    # Passes tokens through and only caches the answer once the stream finished cleanly.
+    # The query span is handed over and ends with the stream, so it covers generation too
+    def _record_answer(self, query, query_vector, tokens, packed, generation, span=telemetry.NOOP, scope=None):
+        with span:
+            full_response = []
+            for token in tokens:
+                full_response.append(token)
+                yield token
+            self.answer_cache.store(query, query_vector, full_response, packed.chunks, packed.files, generation,
+                                    self._cache_scope(scope or {}))
+
+    # Runs before every answer cache lookup, so the lookup sees other processes' corpus changes
+    def _embed_query(self, query):
+        self.corpus_watcher.check()
+        return self.embedding_cache.get_or_embed(query, embed_text)
+
+    # Embedding, cache lookup, search, rerank and packing as child spans of `root`
+    def _retrieve(self, query, root, scope=None):
+        scope = scope or {}
+        with telemetry.span("rag.embed", root):
+            query_vector = self._embed_query(query)
+        with telemetry.span("rag.answer_cache", root) as span:
+            cached = self.answer_cache.lookup(query_vector, self._cache_scope(scope))
+            span.set(hit=cached is not None)
+        if cached is not None:
+            return query_vector, cached, None, None
+        generation = self.answer_cache.generation
+        with telemetry.span("rag.search", root, **{k: ",".join(v) for k, v in scope.items()}) as span:
+            candidates = self.search_database(query_vector, query, **scope)
+            span.set(candidates=len(candidates))
         if not candidates:
+            return query_vector, None, generation, None
+        with telemetry.span("rag.rerank", root, candidates=len(candidates)) as span:
+            ranked_results = self.rerank_results(query, candidates)
+            span.set(kept=len(ranked_results))
+        #Overlapping chunks are stitched, duplicates collapsed and the result capped to the token budget
+        with telemetry.span("rag.pack", root, chunks=len(ranked_results)) as span:
+            packed = self.context_packer.pack(ranked_results)
+            span.set(passages=len(packed.blocks), tokens=packed.tokens, tokens_saved=packed.tokens_saved)
+        return query_vector, None, generation, packed
+
+    # Main method to get RAG response with context for a query.
+    # collections / files restrict the search, e.g. collections=["python-3.12"]; see resolve_scope
+    def get_response_and_context(self, query, collections=None, files=None):
+        root = telemetry.span("rag.query").start()
+        try:
+            scope = self.resolve_scope(query, collections, files)
+            query_vector, cached, generation, packed = self._retrieve(query, root, scope)
+        except BaseException as e:
+            root.end(e)
+            raise
+        if cached is not None:
+            logger.info(f"Answer cache hit for: {query} (cached: {cached.query})")
+            root.set(cache_hit=True).end()
+            return cached.replay(), cached.context
+        if packed is None:
+            root.end()
             return None, []
 
-        ranked_results = self.rerank_results(query, candidates)
-        formatted_context = "\n".join([f"Source: {r[1]} p.{r[2]}\nContent: {r[0]}" for r in ranked_results])
-        raw_context_list = [r[0] for r in ranked_results]
-        
-        return self.generate_response(query, formatted_context), raw_context_list
+        tokens = self.generate_response(query, packed.text, root)
+        return self._record_answer(query, query_vector, tokens, packed, generation, root, scope), packed.chunks
     # Method that gets called in the UI, only returning the response
-    def get_response(self, query):
-        gen, _ = self.get_response_and_context(query)
+    def get_response(self, query, collections=None, files=None):
+        gen, _ = self.get_response_and_context(query, collections, files)
         if gen is None:
             yield "No relevant documents found."
             return
         yield from gen
 
+    # Non-blocking version of get_response for the Chainlit event loop.
+    # Cancelling the consuming task stops the pipeline at whatever stage it is in.
+    async def aget_response(self, query, collections=None, files=None):
+        try:
+            with telemetry.span("rag.query") as root:
+                scope = self.resolve_scope(query, collections, files)
+                with telemetry.span("rag.embed", root):
+                    query_vector = await self._offload("embedding", EMBED_TIMEOUT, self._embed_query, query)
+                with telemetry.span("rag.answer_cache", root) as span:
+                    cached = self.answer_cache.lookup(query_vector, self._cache_scope(scope))
+                    span.set(hit=cached is not None)
+                if cached is not None:
+                    logger.info(f"Answer cache hit for: {query} (cached: {cached.query})")
+                    root.set(cache_hit=True)
+                    for token in cached.replay():
+                        yield token
+                    return
+
+                generation = self.answer_cache.generation
+                with telemetry.span("rag.search", root, **{k: ",".join(v) for k, v in scope.items()}) as span:
+                    candidates = await self.asearch_database(query_vector, query, **scope)
+                    span.set(candidates=len(candidates))
+                if not candidates:
+                    yield "No relevant documents found."
+                    return
+                with telemetry.span("rag.rerank", root, candidates=len(candidates)) as span:
+                    ranked_results = await self._offload("rerank", RERANK_TIMEOUT, self.rerank_results, query, candidates)
+                    span.set(kept=len(ranked_results))
+                with telemetry.span("rag.pack", root, chunks=len(ranked_results)) as span:
+                    packed = self.context_packer.pack(ranked_results)
+                    span.set(passages=len(packed.blocks), tokens=packed.tokens, tokens_saved=packed.tokens_saved)
+
+                full_response = []
+                async for token in self.agenerate_response(query, packed.text, root):
+                    full_response.append(token)
+                    yield token
+                self.answer_cache.store(query, query_vector, full_response, packed.chunks, packed.files, generation,
+                                        self._cache_scope(scope))
+        except asyncio.CancelledError:
+            logger.info(f"Query cancelled: {query}")
+            raise
+
+    # Bulk question answering for evaluation runs and offline QA. All questions are embedded in one
+    # provider call, retrieved with one SQL statement per scope and reranked in one combined pass;
+    # generations then run `concurrency` at a time. Yields a dict per question as soon as its answer
+    # is complete, so results come back out of order ("index" is the question's position).
+    def answer_many(self, queries, collections=None, files=None, concurrency: int = BATCH_CONCURRENCY):
+        queries = list(queries)
+        start = time.perf_counter()
+
+        def result(i, answer, context, cached=False, error=None):
+            return {"index": i, "query": queries[i], "answer": answer, "context": context, "cached": cached,
+                    "error": error, "seconds": time.perf_counter() - start}
+
+        with telemetry.span("rag.batch", queries=len(queries)) as root:
+            scopes = [self.resolve_scope(q, collections, files) for q in queries]
+            with telemetry.span("rag.embed", root, queries=len(queries)):
+                self.corpus_watcher.check()
+                vectors = self.embedding_cache.get_or_embed_many(queries, embed_text)
+            todo = []
+            for i, (vector, scope) in enumerate(zip(vectors, scopes)):
+                cached = self.answer_cache.lookup(vector, self._cache_scope(scope))
+                if cached is None:
+                    todo.append(i)
+                else:
+                    yield result(i, "".join(cached.tokens), cached.context, cached=True)
+            generation = self.answer_cache.generation
+
+            #Routed questions differ in scope, each distinct scope is one statement
+            groups = {}
+            for i in todo:
+                groups.setdefault(self._cache_scope(scopes[i]), []).append(i)
+            candidates = {}
+            with telemetry.span("rag.search", root, queries=len(todo), statements=len(groups)):
+                for members in groups.values():
+                    found = self.search_database_many([vectors[i] for i in members], [queries[i] for i in members],
+                                                      **scopes[members[0]])
+                    candidates.update(zip(members, found))
+            for i in todo:
+                if not candidates[i]:
+                    yield result(i, None, [])
+            todo = [i for i in todo if candidates[i]]
+            with telemetry.span("rag.rerank", root, pairs=sum(len(candidates[i]) for i in todo)):
+                ranked = self.reranker.rerank_many([queries[i] for i in todo], [candidates[i] for i in todo])
+            with telemetry.span("rag.pack", root, queries=len(todo)):
+                packed = {i: self.context_packer.pack(rows) for i, rows in zip(todo, ranked)}
+
+            pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="rag-batch")
+            try:
+                futures = {pool.submit(self._answer_packed, queries[i], vectors[i], packed[i], generation, scopes[i],
+                                       root): i for i in todo}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        yield result(i, future.result(), packed[i].chunks)
+                    except Exception as e:
+                        logger.error(f"Batch answer failed for: {queries[i]}: {e}")
+                        yield result(i, None, packed[i].chunks, error=str(e))
+            finally:
+                # A consumer that stops early drops the generations that haven't started yet
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _answer_packed(self, query, query_vector, packed, generation, scope, parent):
+        tokens = list(self.generate_response(query, packed.text, parent))
+        self.answer_cache.store(query, query_vector, tokens, packed.chunks, packed.files, generation,
+                                self._cache_scope(scope))
+        return "".join(tokens)
+
+    async def aclose(self):
+        await self.llm.aclose()
+        self._executor.shutdown(wait=False)
+        if self._reranker is not None:
+            self._reranker.close()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service() -> RagService:
+    """Process wide service, so the instance app.py warms up is the one the chat handlers use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RagService()
+        return _service
+
+
+def start_warmup() -> threading.Thread:
+    """Warms the shared service in a background thread, e.g. while ingestion is running."""
+    def run():
+        try:
+            get_rag_service().warmup()
+        except Exception as e:
+            logger.error(f"Warmup failed, models will load on the first query instead: {e}")
+    thread = threading.Thread(target=run, name="rag-warmup", daemon=True)
+    thread.start()
+    return thread
+
   
\ No newline at end of file
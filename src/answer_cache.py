@@ -0,0 +1,157 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+# Cosine similarity between query embeddings needed to reuse an answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+
+
+class CachedAnswer:
+    def __init__(self, query: str, vector, tokens: list, context: list, files: set, generation: int, scope=None):
+        self.query = query
+        self.vector = vector
+        self.tokens = tokens
+        self.context = context
+        self.files = files
+        self.generation = generation
+        self.scope = scope
+        self.created_at = time.time()
+
+    # Yields the original tokens so the UI streams it exactly like a fresh answer
+    def replay(self):
+        yield from self.tokens
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by query embedding. A lookup hits when a cached query is within
+    `threshold` cosine similarity and the corpus hasn't changed since it was answered.
+    Ingesting any file bumps the generation (new docs could change the answer), deleting
+    a file only drops the answers that cited it but still bumps the generation so answers
+    being generated meanwhile aren't stored.
+    An answer is only reused for a search of the same scope (collections/files), None being the whole corpus.
+    """
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: float = ANSWER_CACHE_TTL):
+        if max_entries <= 0:
+            raise ValueError("Cache size must be greater than 0.")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _drop(self, entry_id):
+        del self._entries[entry_id]
+        self._matrix = None
+
+    def _rebuild_matrix(self):
+        self._matrix_ids = list(self._entries.keys())
+        self._matrix = np.stack([self._entries[i].vector for i in self._matrix_ids]) if self._matrix_ids else None
+
+    def lookup(self, vector, scope=None):
+        query = self._unit(vector)
+        with self._lock:
+            if self._entries and self._matrix is None:
+                self._rebuild_matrix()
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            sims = self._matrix @ query
+            now = time.time()
+            for idx in np.argsort(-sims):
+                if sims[idx] < self.threshold:
+                    break
+                entry_id = self._matrix_ids[idx]
+                entry = self._entries[entry_id]
+                if entry.generation != self.generation or now - entry.created_at > self.ttl or entry.scope != scope:
+                    continue
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def store(self, query: str, vector, tokens: list, context: list, files: set, generation: int, scope=None):
+        with self._lock:
+            # Corpus changed while this answer was being generated, it may already be stale
+            if generation != self.generation:
+                return
+            self._entries[self._next_id] = CachedAnswer(query, self._unit(vector), list(tokens), list(context), set(files),
+                                                        generation, scope)
+            self._next_id += 1
+            self._matrix = None
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_file(self, filename: str) -> int:
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if filename in e.files]
+            for entry_id in stale:
+                self._drop(entry_id)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    # Registered with src.db.on_corpus_change. filename None: another process changed the corpus
+    # (src.db.CorpusWatcher) and which files it touched is unknown, so it counts as an ingest
+    def on_corpus_change(self, filename: str, action: str):
+        removed = self.invalidate_file(filename) if filename else 0
+        if action == "ingested" or filename is None:
+            # Every cached answer predates the new document, none of them can be served anymore
+            with self._lock:
+                self.generation += 1
+                removed += len(self._entries)
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._matrix = None
+        elif action == "deleted":
+            # An answer already being generated may cite the file, store() refuses it on the new generation.
+            # Cached answers that survived invalidate_file don't cite it and stay valid
+            with self._lock:
+                self.generation += 1
+                for entry in self._entries.values():
+                    entry.generation = self.generation
+        logger.info(f"Answer cache: {filename or 'corpus'} {action}, dropped {removed} answers")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
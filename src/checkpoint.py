@@ -0,0 +1,173 @@
+import os
+import json
+import zlib
+import struct
+import logging
+import numpy as np
+from src.db import EMBEDDING_DIMENSION, EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.join("data", "checkpoints")
+# Commit record: first row, row count, crc32 of the rows' float32 bytes
+_RECORD = struct.Struct("<QQI")
+
+
+class CheckpointStore:
+    """
+    Crash-safe, append-only checkpoint for one file's ingestion.
+
+    {name}.chunks.jsonl  chunk plan (text + page), written once and renamed into place
+    {name}.meta.json     chunk count / dimension / model / source file hash, written last so a torn plan is never used
+    {name}.vec           float32 rows appended as batches are embedded, read back with np.memmap
+    {name}.log           fixed size commit records; a batch only counts once its record is on disk
+
+    Vector bytes are fsynced before their commit record, so after a crash the log's last valid
+    record tells exactly how many rows are good and anything past it is truncated.
+    """
+    def __init__(self, name: str, directory: str = CHECKPOINT_DIR, dim: int = EMBEDDING_DIMENSION, model: str = None):
+        self.name = name
+        self.dim = dim
+        self.model = model
+        self.row_bytes = dim * 4
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, name)
+        self.plan_path = base + ".chunks.jsonl"
+        self.meta_path = base + ".meta.json"
+        self.vec_path = base + ".vec"
+        self.log_path = base + ".log"
+        self.total = None
+        self.source_hash = None
+        self.committed = 0
+        if self.has_plan():
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.total = meta["count"]
+            self.source_hash = meta.get("source_hash")
+            # Checkpoints from before models were recorded were all made with Voyage
+            old_model = meta.get("model") or EMBEDDING_MODEL
+            if model is not None and (meta["dim"] != dim or old_model != model):
+                # Vectors from another embedding model are useless, the chunk plan is still good
+                logger.info(f"Checkpoint {name} was embedded with {old_model}, keeping only its plan for {model}")
+                self._drop_vectors()
+                _atomic_write_json(self.meta_path, {**meta, "dim": dim, "model": model})
+            elif meta["dim"] != dim:
+                raise ValueError(f"Checkpoint {name} has dimension {meta['dim']}, expected {dim}.")
+        self.committed = self.recover()
+
+    def has_plan(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def write_plan(self, records, source_hash: str = None) -> int:
+        """records: iterable of (text, page). Streams to disk so the plan is never held in memory."""
+        tmp = self.plan_path + ".tmp"
+        count = 0
+        with open(tmp, "w", encoding="utf-8") as f:
+            for text, page in records:
+                f.write(json.dumps({"t": text, "p": page}, ensure_ascii=False))
+                f.write("\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.plan_path)
+        _atomic_write_json(self.meta_path, {"count": count, "dim": self.dim, "source": self.name,
+                                            "source_hash": source_hash, "model": self.model})
+        # A new plan invalidates any vectors left from an older one
+        self._drop_vectors()
+        self.total = count
+        self.source_hash = source_hash
+        self.committed = 0
+        return count
+
+    def _drop_vectors(self):
+        for path in (self.vec_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def iter_plan(self, start: int = 0):
+        """Yields (text, page) lazily, skipping the first `start` chunks."""
+        with open(self.plan_path, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                if i < start:
+                    continue
+                record = json.loads(line)
+                yield record["t"], record["p"]
+
+    def recover(self) -> int:
+        """Drops torn log records and unreferenced vector bytes, returns the committed row count."""
+        if not os.path.exists(self.log_path):
+            if os.path.exists(self.vec_path):
+                os.truncate(self.vec_path, 0)
+            return 0
+        rows = 0
+        good_records = 0
+        vec_size = os.path.getsize(self.vec_path) if os.path.exists(self.vec_path) else 0
+        with open(self.log_path, "rb") as log, open(self.vec_path, "ab+") as vec:
+            while True:
+                raw = log.read(_RECORD.size)
+                if len(raw) < _RECORD.size:
+                    break
+                start, count, crc = _RECORD.unpack(raw)
+                end = (start + count) * self.row_bytes
+                if start != rows or end > vec_size:
+                    break
+                vec.seek(start * self.row_bytes)
+                if zlib.crc32(vec.read(count * self.row_bytes)) != crc:
+                    break
+                rows += count
+                good_records += 1
+        torn = os.path.getsize(self.log_path) - good_records * _RECORD.size
+        if torn:
+            logger.warning(f"Checkpoint {self.name}: discarding {torn} bytes of torn commit log")
+        os.truncate(self.log_path, good_records * _RECORD.size)
+        os.truncate(self.vec_path, rows * self.row_bytes)
+        return rows
+
+    def append(self, vectors) -> int:
+        """Appends one embedded batch. Returns the new committed row count."""
+        block = np.ascontiguousarray(vectors, dtype=np.float32)
+        if block.ndim != 2 or block.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {block.shape}.")
+        data = block.tobytes()
+        with open(self.vec_path, "ab") as vec:
+            vec.write(data)
+            vec.flush()
+            os.fsync(vec.fileno())
+        with open(self.log_path, "ab") as log:
+            log.write(_RECORD.pack(self.committed, len(block), zlib.crc32(data)))
+            log.flush()
+            os.fsync(log.fileno())
+        self.committed += len(block)
+        return self.committed
+
+    def vectors(self) -> np.ndarray:
+        """Read-only memmap of the committed rows; pages are loaded by the OS only when touched."""
+        if self.committed == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(self.committed, self.dim))
+
+    def iter_rows(self, start: int = 0):
+        """Yields (text, page, vector) for committed rows, vectors are memmap views, not copies."""
+        vectors = self.vectors()
+        for i, (text, page) in enumerate(self.iter_plan(start), start=start):
+            if i >= self.committed:
+                break
+            yield text, page, vectors[i]
+
+    @property
+    def complete(self) -> bool:
+        return self.total is not None and self.committed >= self.total
+
+    def remove(self):
+        for path in (self.plan_path, self.meta_path, self.vec_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _atomic_write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
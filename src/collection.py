@@ -0,0 +1,191 @@
+"""
+Named collections. doc_chunks is LIST-partitioned on its collection column, one partition per
+collection with its own HNSW index (inherited from the parent's) and BM25 index, so a search scoped
+to a collection only touches that collection's partition and indexes.
+
+Files are assigned by folder: PDFs in data/<collection>/ belong to <collection>, PDFs directly in
+data/ to "default". Partitions are created on first ingest, or up front:
+
+    python -m src.collection add python-3.12 --keywords python py3 cpython
+    python -m src.collection list
+"""
+import os
+import re
+import time
+import logging
+import argparse
+import threading
+import xxhash
+from psycopg import sql
+from src.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "default"
+# 1 = an unscoped question naming exactly one collection (by its keywords) only searches that collection
+COLLECTION_ROUTING = os.getenv("COLLECTION_ROUTING", "1") == "1"
+# Seconds between re-reads of the collections table, so new collections route without a restart
+COLLECTION_REFRESH = float(os.getenv("COLLECTION_REFRESH", "60"))
+# Folders under data/ that aren't collections
+RESERVED_FOLDERS = {"checkpoints"}
+
+_NAME = re.compile(r"[a-z0-9][a-z0-9_.-]{0,39}")
+
+
+def normalize_name(name: str) -> str:
+    name = name.strip().lower()
+    if not _NAME.fullmatch(name):
+        raise ValueError(f"Invalid collection name: {name!r} (letters, digits, '.', '_' and '-', at most 40)")
+    return name
+
+
+def partition_name(name: str) -> str:
+    # '.' and '-' aren't kept, the hash suffix stops python-3.12 and python_3_12 sharing a partition
+    slug = re.sub(r"[^a-z0-9_]", "_", name)
+    if slug != name:
+        slug += "_" + xxhash.xxh32_hexdigest(name)[:6]
+    return f"doc_chunks_{slug}"
+
+
+def default_keywords(name: str) -> list:
+    """python-3.12 -> ["python"]. Bare numbers match too many questions to route on, and nothing routes to default."""
+    if name == DEFAULT_COLLECTION:
+        return []
+    return [t for t in re.split(r"[-_.]", name) if len(t) >= 3 and not t.isdigit()]
+
+
+def discover(data_dir: str = "data") -> list:
+    """[(path, collection)] for every PDF in data_dir and in its direct subfolders."""
+    found = []
+    for entry in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, entry)
+        if entry.endswith(".pdf") and os.path.isfile(path):
+            found.append((path, DEFAULT_COLLECTION))
+        elif os.path.isdir(path) and entry not in RESERVED_FOLDERS:
+            collection = normalize_name(entry)
+            found.extend((os.path.join(path, f), collection) for f in sorted(os.listdir(path)) if f.endswith(".pdf"))
+    return found
+
+
+def collection_for(path: str, data_dir: str = "data"):
+    """The collection a PDF under data_dir belongs to (same rules as discover), None if it isn't ingested."""
+    parts = os.path.relpath(path, data_dir).split(os.sep)
+    if not parts[-1].endswith(".pdf") or parts[0] in (os.pardir, *RESERVED_FOLDERS):
+        return None
+    if len(parts) == 1:
+        return DEFAULT_COLLECTION
+    return normalize_name(parts[0]) if len(parts) == 2 else None
+
+
+def has_bm25(conn) -> bool:
+    return conn.execute("SELECT EXISTS(SELECT 1 FROM pg_extension WHERE extname = 'pg_search')").fetchone()[0]
+
+
+def bm25_index_sql(partition: str, schema: str = None) -> sql.Composed:
+    """The BM25 index of one partition, BM25 indexes can't be declared on the partitioned parent."""
+    table = sql.Identifier(schema, partition) if schema else sql.Identifier(partition)
+    return sql.SQL("CREATE INDEX {} ON {} USING bm25 (id, content, filename) WITH (key_field = 'id')").format(
+        sql.Identifier(f"{partition}_bm25"), table)
+
+
+def ensure_collection(name: str, keywords: list = None) -> str:
+    """Registers the collection and creates its partition (plus BM25 index) if missing. Returns the normalized name."""
+    name = normalize_name(name)
+    partition = partition_name(name)
+    with get_pool().connection() as conn:
+        with conn.transaction():
+            # Two ingest workers can meet the same new collection
+            conn.execute("SELECT pg_advisory_xact_lock(hashtext('doc_chunks_partitions'))")
+            conn.execute("INSERT INTO collections (name, keywords) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING",
+                         (name, keywords or []))
+            if keywords is not None:
+                conn.execute("UPDATE collections SET keywords = %s WHERE name = %s", (keywords, name))
+            if conn.execute("SELECT to_regclass(%s) IS NULL", (partition,)).fetchone()[0]:
+                # Indexes defined on doc_chunks itself (HNSW, compact, filename) are created on the partition too
+                conn.execute(sql.SQL("CREATE TABLE {} PARTITION OF doc_chunks FOR VALUES IN ({})").format(
+                    sql.Identifier(partition), sql.Literal(name)))
+                if has_bm25(conn):
+                    conn.execute(bm25_index_sql(partition))
+                logger.info(f"Created collection {name} ({partition})")
+    return name
+
+
+def list_collections() -> dict:
+    """{name: keywords} for every registered collection."""
+    with get_pool().connection() as conn:
+        return dict(conn.execute("SELECT name, keywords FROM collections ORDER BY name").fetchall())
+
+
+def partitions(conn, table: str = "doc_chunks") -> list:
+    """Leaf partitions of `table`; empty when it isn't partitioned."""
+    return [r[0] for r in conn.execute("""
+        SELECT relid::regclass::text FROM pg_partition_tree(%s::regclass) WHERE isleaf AND level > 0 ORDER BY 1
+        """, (table,))]
+
+
+class CollectionRouter:
+    """
+    Picks the collection an unscoped question is about: the one collection whose keywords (by default
+    the words of its name) appear in the question. None when no collection, or more than one, matches,
+    and the question searches everything.
+    """
+    def __init__(self, refresh: float = COLLECTION_REFRESH, loader=None, enabled: bool = COLLECTION_ROUTING):
+        self.refresh = refresh
+        self.loader = loader or list_collections
+        self.enabled = enabled
+        self._patterns = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _pattern(keywords):
+        words = sorted({w.strip().lower() for w in keywords if w.strip()}, key=len, reverse=True)
+        if not words:
+            return None
+        return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(w) for w in words) + r")(?!\w)")
+
+    def _current(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded_at is None or now - self._loaded_at > self.refresh:
+                try:
+                    collections = self.loader()
+                except Exception as e:
+                    # Schema without collections (or DB down): don't retry on every question
+                    logger.warning(f"Could not load collections, questions search everything: {e}")
+                    collections = {}
+                patterns = {name: self._pattern(words or default_keywords(name)) for name, words in collections.items()}
+                self._patterns = {name: p for name, p in patterns.items() if p is not None}
+                self._loaded_at = now
+            return self._patterns
+
+    def route(self, query: str):
+        """[collection] when exactly one collection matches the question, else None."""
+        if not self.enabled:
+            return None
+        patterns = self._current()
+        if len(patterns) < 2:
+            return None
+        text = query.lower()
+        matched = [name for name, pattern in patterns.items() if pattern.search(text)]
+        return matched if len(matched) == 1 else None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage document collections (doc_chunks partitions).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="create a collection, or replace its routing keywords")
+    add.add_argument("name")
+    add.add_argument("--keywords", nargs="*", help="words that route a question here (default: the words of the name)")
+    commands.add_parser("list", help="collections with their rows, size and keywords")
+    args = parser.parse_args()
+    if args.command == "add":
+        ensure_collection(args.name, args.keywords)
+    else:
+        with get_pool().connection() as conn:
+            for name, keywords in list_collections().items():
+                partition = partition_name(name)
+                rows, size = conn.execute(sql.SQL("SELECT count(*), pg_total_relation_size(%s::regclass) FROM {}")
+                                          .format(sql.Identifier(partition)), (partition,)).fetchone()
+                print(f"{name:<24}{rows:>10} rows{size / 2**20:>10.1f} MB  {', '.join(keywords or default_keywords(name))}")
@@ -0,0 +1,126 @@
+import os
+import logging
+import xxhash
+from src.db import EMBEDDING_MODEL, bump_corpus_generation, own_corpus_change
+from src.embeddings import get_provider
+from src.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+_READ_SIZE = 1 << 20
+
+
+def hash_file(path: str) -> str:
+    h = xxhash.xxh3_128()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_chunk(text: str) -> str:
+    return xxhash.xxh3_128_hexdigest(text.encode("utf-8"))
+
+
+def file_versions(filename: str, file_hash: str, collection: str = None):
+    """Returns (rows already at this file_hash, rows from any other/unknown version), within `collection` if given."""
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT count(*) FILTER (WHERE file_hash = %s),
+                       count(*) FILTER (WHERE file_hash IS DISTINCT FROM %s)
+                FROM doc_chunks WHERE filename = %s""" + (" AND collection = %s" if collection else ""),
+                (file_hash, file_hash, filename) + ((collection,) if collection else ()))
+            current, stale = cur.fetchone()
+            return current, stale
+
+
+def completed_chunks(filename: str, file_hash: str, collection: str):
+    """Chunk count the last finished ingest of this version recorded, None if it never finished."""
+    with get_pool().connection() as conn:
+        row = conn.execute("""
+            SELECT chunks FROM ingested_files WHERE filename = %s AND collection = %s AND file_hash = %s
+            """, (filename, collection, file_hash)).fetchone()
+        return row[0] if row else None
+
+
+def mark_complete(filename: str, file_hash: str, collection: str, chunks: int):
+    """Records that every chunk of this version is in doc_chunks. Until then its rows count as a partial load."""
+    with get_pool().connection() as conn:
+        conn.execute("""
+            INSERT INTO ingested_files (filename, collection, file_hash, chunks) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (filename, collection) DO UPDATE
+            SET file_hash = EXCLUDED.file_hash, chunks = EXCLUDED.chunks, completed_at = now()
+            """, (filename, collection, file_hash, chunks))
+        generation = bump_corpus_generation(conn)
+    own_corpus_change(generation)
+
+
+def lookup_embeddings(chunk_hashes, model: str = None) -> dict:
+    """Returns {chunk_hash: vector} for every hash that was ever embedded with `model` (default: the provider's), from any file."""
+    if not chunk_hashes:
+        return {}
+    model = model or get_provider().name
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT chunk_hash, embedding FROM chunk_embeddings WHERE model = %s AND chunk_hash = ANY(%s)",
+                        (model, list(chunk_hashes)), prepare=True)
+            return dict(cur.fetchall())
+
+
+def save_embeddings(pairs, model: str = None) -> int:
+    """pairs: iterable of (chunk_hash, vector). Already known hashes are left alone."""
+    model = model or get_provider().name
+    rows = [(h, model, v) for h, v in pairs]
+    if not rows:
+        return 0
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.executemany("""
+                INSERT INTO chunk_embeddings (chunk_hash, model, embedding) VALUES (%s, %s, %s)
+                ON CONFLICT (chunk_hash, model) DO NOTHING
+                """, rows)
+    return len(rows)
+
+
+def backfill(data_dir: str = "data", model: str = EMBEDDING_MODEL):
+    """
+    One-off for rows ingested before hashing existed (so embedded by Voyage, hence the default model): fills chunk_hash, seeds chunk_embeddings
+    from them, and stamps file_hash for files still present in data_dir so they aren't re-ingested. Stamped files are
+    recorded in ingested_files too, without it their rows would count as a partial load.
+    """
+    updated = 0
+    with get_pool().connection() as conn:
+        with conn.cursor(name="backfill_scan") as scan, conn.cursor() as cur:
+            scan.execute("SELECT id, content FROM doc_chunks WHERE chunk_hash IS NULL")
+            while rows := scan.fetchmany(1000):
+                cur.executemany("UPDATE doc_chunks SET chunk_hash = %s WHERE id = %s",
+                                [(hash_chunk(content), row_id) for row_id, content in rows])
+                updated += len(rows)
+        conn.execute("""
+            INSERT INTO chunk_embeddings (chunk_hash, model, embedding)
+            SELECT DISTINCT ON (chunk_hash) chunk_hash, %s, embedding FROM doc_chunks
+            WHERE chunk_hash IS NOT NULL AND embedding IS NOT NULL
+            ON CONFLICT (chunk_hash, model) DO NOTHING
+            """, (model,))
+        for name in os.listdir(data_dir):
+            path = os.path.join(data_dir, name)
+            if name.endswith(".pdf") and os.path.isfile(path):
+                file_hash = hash_file(path)
+                stamped = conn.execute("UPDATE doc_chunks SET file_hash = %s WHERE filename = %s AND file_hash IS NULL",
+                                       (file_hash, name)).rowcount
+                if stamped:
+                    conn.execute("""
+                        INSERT INTO ingested_files (filename, collection, file_hash, chunks)
+                        SELECT filename, collection, file_hash, count(*) FROM doc_chunks
+                        WHERE filename = %s AND file_hash = %s GROUP BY filename, collection, file_hash
+                        ON CONFLICT (filename, collection) DO UPDATE
+                        SET file_hash = EXCLUDED.file_hash, chunks = EXCLUDED.chunks, completed_at = now()
+                        """, (name, file_hash))
+    logger.info(f"Backfilled chunk hashes for {updated} rows")
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    backfill()
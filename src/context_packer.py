@@ -0,0 +1,168 @@
+import os
+import re
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Prompt tokens left for context; num_ctx is 8192 and the instructions, question and answer need the rest
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "5000"))
+# Word 5-gram Jaccard similarity above which two chunks count as the same text
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_NEAR_DUPLICATE", "0.85"))
+# Shortest suffix/prefix match treated as chunk overlap (getChunks overlaps by 200 chars)
+MIN_OVERLAP_CHARS = 20
+_SHINGLE = 5
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    # Same conservative ~3 chars/token rule the embedding scheduler uses
+    return len(text) // 3 + 1
+
+
+def format_block(sources, text: str) -> str:
+    cited = "; ".join(f"{filename} p.{page}" for filename, page in sources)
+    return f"Source: {cited}\nContent: {text}"
+
+
+def merge_overlap(a: str, b: str, min_overlap: int = MIN_OVERLAP_CHARS):
+    """Joins b after a when a's tail is b's head (or one contains the other), else None."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    anchor = b[:min_overlap]
+    if len(anchor) < min_overlap:
+        return None
+    start = a.find(anchor, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return a + b[len(a) - start:]
+        start = a.find(anchor, start + 1)
+    return None
+
+
+def shingles(text: str) -> set:
+    words = _WORD.findall(text.casefold())
+    if len(words) <= _SHINGLE:
+        return {tuple(words)}
+    return {tuple(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class ContextBlock:
+    text: str
+    sources: list
+    rank: int
+    ids: list = field(default_factory=list)
+
+    def render(self) -> str:
+        return format_block(self.sources, self.text)
+
+
+@dataclass
+class PackedContext:
+    blocks: list
+    tokens: int
+    tokens_before: int
+    dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens
+
+    @property
+    def text(self) -> str:
+        return "\n".join(b.render() for b in self.blocks)
+
+    @property
+    def chunks(self) -> list:
+        return [b.text for b in self.blocks]
+
+    @property
+    def files(self) -> set:
+        return {filename for b in self.blocks for filename, _ in b.sources}
+
+
+class ContextPacker:
+    """
+    Turns reranked rows (content, filename, page_number, score, id) into prompt context.
+    Overlapping chunks of the same page are stitched back into one passage, near-duplicate
+    passages are collapsed into one that cites every source, and passages are added in rerank
+    order until the token budget is spent.
+    """
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD):
+        if token_budget <= 0:
+            raise ValueError("Token budget must be greater than 0.")
+        self.token_budget = token_budget
+        self.near_duplicate_threshold = near_duplicate_threshold
+
+    def merge_pages(self, rows) -> list:
+        """One or more blocks per (filename, page), ranked by their best chunk."""
+        pages = {}
+        for rank, row in enumerate(rows):
+            content, filename, page = row[0], row[1], row[2]
+            row_id = row[4] if len(row) > 4 else None
+            blocks = pages.setdefault((filename, page), [])
+            blocks.append(ContextBlock(content, [(filename, page)], rank, [row_id]))
+            # Keep stitching until nothing on this page overlaps anymore
+            merged = True
+            while merged:
+                merged = False
+                for i in range(len(blocks)):
+                    for j in range(i + 1, len(blocks)):
+                        a, b = blocks[i], blocks[j]
+                        text = merge_overlap(a.text, b.text) or merge_overlap(b.text, a.text)
+                        if text is not None:
+                            blocks[i] = ContextBlock(text, a.sources, min(a.rank, b.rank), a.ids + b.ids)
+                            del blocks[j]
+                            merged = True
+                            break
+                    if merged:
+                        break
+        return sorted((b for blocks in pages.values() for b in blocks), key=lambda b: b.rank)
+
+    def dedupe(self, blocks) -> list:
+        kept, kept_shingles = [], []
+        for block in blocks:
+            sh = shingles(block.text)
+            for other, other_sh in zip(kept, kept_shingles):
+                if jaccard(sh, other_sh) >= self.near_duplicate_threshold:
+                    # Same text on another page/file: keep the better ranked copy, cite both
+                    other.sources.extend(s for s in block.sources if s not in other.sources)
+                    other.ids.extend(block.ids)
+                    break
+            else:
+                kept.append(block)
+                kept_shingles.append(sh)
+        return kept
+
+    def pack(self, rows) -> PackedContext:
+        if not rows:
+            return PackedContext([], 0, 0)
+        tokens_before = estimate_tokens("\n".join(format_block([(r[1], r[2])], r[0]) for r in rows))
+        blocks = self.dedupe(self.merge_pages(rows))
+        packed, used, dropped = [], 0, 0
+        for block in blocks:
+            cost = estimate_tokens(block.render()) + 1
+            if used + cost > self.token_budget:
+                if packed:
+                    dropped += 1
+                    continue
+                # Never send an empty context: the best passage is cut down to fit
+                keep = max(0, (self.token_budget - estimate_tokens(format_block(block.sources, ""))) * 3)
+                block = ContextBlock(block.text[:keep], block.sources, block.rank, block.ids)
+                cost = estimate_tokens(block.render()) + 1
+            packed.append(block)
+            used += cost
+        result = PackedContext(packed, estimate_tokens("\n".join(b.render() for b in packed)), tokens_before, dropped)
+        logger.info(f"Context packed {len(rows)} chunks into {len(packed)} passages, "
+                    f"{result.tokens}/{self.token_budget} tokens ({result.tokens_saved} saved, {dropped} dropped)")
+        return result
@@ -1,15 +1,103 @@
 import os
-import voyageai
-import psycopg
+import time
 import logging
+import threading
+from collections import deque
 from dotenv import load_dotenv
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+#Voyage defaults; the model actually in use is get_provider().name / .dimension (src/embeddings.py)
 EMBEDDING_MODEL = "voyage-code-3"
+EMBEDDING_DIMENSION = 1024
 
-vo = voyageai.Client(api_key=os.getenv("VOYAGE_API"), timeout=120)
+_voyage_client = None
+_voyage_lock = threading.Lock()
+
+def get_voyage_client():
+    """Built on first use: importing voyageai alone costs most of a second, and it needs the API key."""
+    global _voyage_client
+    if _voyage_client is None:
+        with _voyage_lock:
+            if _voyage_client is None:
+                import voyageai
+                _voyage_client = voyageai.Client(api_key=os.getenv("VOYAGE_API"), timeout=120)
+    return _voyage_client
+
+# Callbacks run as callback(filename, action) whenever doc_chunks changes ("ingested" / "deleted")
+_corpus_listeners = []
+
+def on_corpus_change(callback):
+    _corpus_listeners.append(callback)
+
+def notify_corpus_change(filename: str, action: str):
+    for callback in _corpus_listeners:
+        try:
+            callback(filename, action)
+        except Exception as e:
+            logger.error(f"Corpus change listener failed for {filename}: {e}")
+
+# Listeners above only hear about this process. Every doc_chunks change (StreamingLoader batches, completed
+# ingests, deletes, rebuild and reembed swaps) also bumps corpus_generation in its own transaction,
+# so a server notices what src.rebuild, src.reembed or a src.ingest run in another process did
+CORPUS_GENERATION_CHECK_SECONDS = float(os.getenv("CORPUS_GENERATION_CHECK_SECONDS", "2"))
+
+# Bumps this process committed itself: its listeners were told directly, CorpusWatcher skips them
+_own_generations = deque(maxlen=1024)
+
+def bump_corpus_generation(conn) -> int:
+    """
+    Run inside the transaction that changes doc_chunks, other processes see the bump once it commits.
+    Returns the new generation, for own_corpus_change once the transaction has committed.
+    """
+    return conn.execute("UPDATE corpus_generation SET generation = generation + 1 RETURNING generation").fetchone()[0]
+
+def own_corpus_change(generation: int):
+    #Only after the commit: a rolled back bump's number gets handed out again, possibly to another process
+    _own_generations.append(generation)
+
+def read_corpus_generation(conn=None) -> int:
+    if conn is not None:
+        return conn.execute("SELECT generation FROM corpus_generation", prepare=True).fetchone()[0]
+    from src.pool import get_pool
+    with get_pool().connection() as conn:
+        return read_corpus_generation(conn)
+
+class CorpusWatcher:
+    """
+    Re-reads corpus_generation at most every `interval` seconds. When another process bumped it,
+    listeners get notify_corpus_change(None, "changed"): which files changed is unknown.
+    Bumps this process made (own_corpus_change) are only recorded as seen.
+    """
+    def __init__(self, interval: float = CORPUS_GENERATION_CHECK_SECONDS, reader=read_corpus_generation):
+        self.interval = interval
+        self._reader = reader
+        self._seen = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """Returns whether the corpus changed since the last check. Cheap to call before every cache lookup."""
+        if time.monotonic() - self._checked < self.interval:
+            return False
+        with self._lock:
+            if time.monotonic() - self._checked < self.interval:
+                return False
+            self._checked = time.monotonic()
+            try:
+                generation = self._reader()
+            except Exception as e:
+                logger.debug(f"Could not read corpus_generation: {e}")
+                return False
+            changed = False
+            if self._seen is not None and generation != self._seen:
+                own = set(_own_generations)
+                changed = generation < self._seen or any(g not in own for g in range(self._seen + 1, generation + 1))
+            self._seen = generation
+        if changed:
+            notify_corpus_change(None, "changed")
+        return changed
 
 
 def get_connection_string():
@@ -28,40 +116,35 @@ def get_connection_string():
     
     return f"postgresql://{creds['user']}:{creds['pass']}@{creds['host']}:{creds['port']}/{creds['name']}"
 
-def file_exists(filename: str) -> bool:
-    try:
-        with psycopg.connect(get_connection_string()) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT EXISTS(SELECT 1 FROM doc_chunks WHERE filename = %s)", (filename,))
-                return cur.fetchone()[0] 
-    except psycopg.OperationalError as e:
-        logger.error(f"Database is unreachable. {e}")
-        raise ConnectionError("Database Down.")
-    except Exception as e:
-        logger.error(f"Database error while checking file: {e}")
-        return False
-
 def embed_text(texts: list, is_query: bool = False):
     """
-    Handles all embeddings for the app.
+    Handles all embeddings for the app, through the provider picked by EMBEDDING_PROVIDER (src/embeddings.py).
     is_query=True: Optimized for search questions.
     is_query=False: Optimized for document storage.
     """
-    input_type = "query" if is_query else "document"
+    from src.embeddings import get_provider
+    provider = get_provider()
     try:
-        res = vo.embed(texts, model=EMBEDDING_MODEL, input_type=input_type,output_dimension=1024)
-        return res.embeddings
+        return provider.embed(texts, is_query=is_query)
     except Exception as e:
-        logger.error(f"Embedding failure ({EMBEDDING_MODEL}): {e}")
+        logger.error(f"Embedding failure ({provider.name}): {e}")
         raise e
 
-def delete_file_from_db(filename: str):
+def delete_file_from_db(filename: str, collection: str = None):
+    from src.pool import get_pool
+    from src.collection import DEFAULT_COLLECTION
+    #The same filename can exist in several collections; filtering on it also prunes the delete to one partition
+    collection = collection or DEFAULT_COLLECTION
     try:
-        with psycopg.connect(get_connection_string()) as conn:
+        with get_pool().connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("DELETE FROM doc_chunks WHERE filename = %s", (filename,))
+                cur.execute("DELETE FROM doc_chunks WHERE filename = %s AND collection = %s", (filename, collection))
+                cur.execute("DELETE FROM ingested_files WHERE filename = %s AND collection = %s", (filename, collection))
+                generation = bump_corpus_generation(cur)
                 conn.commit()
-                logger.info(f"Deleted chunks for: {filename}")
+                own_corpus_change(generation)
+                logger.info(f"Deleted chunks for: {filename} ({collection})")
+        notify_corpus_change(filename, "deleted")
     except Exception as e:
         logger.error(f"Error deleting {filename}: {e}")
         
\ No newline at end of file
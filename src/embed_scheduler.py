@@ -0,0 +1,254 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.db import embed_text
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Provider limits, defaults are Voyage's free tier. Paid tiers should raise these in .env
+EMBED_RPM = float(os.getenv("EMBED_RPM", "3"))
+EMBED_TPM = float(os.getenv("EMBED_TPM", "10000"))
+# Hard per-request limits for voyage-code-3
+EMBED_MAX_BATCH_TEXTS = int(os.getenv("EMBED_MAX_BATCH_TEXTS", "1000"))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "120000"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "8"))
+# Texts handed to a local model per scheduler batch; it splits them into EMBEDDING_BATCH_SIZE forward passes
+LOCAL_MAX_BATCH_TEXTS = int(os.getenv("EMBED_LOCAL_MAX_BATCH_TEXTS", "512"))
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_CLOSE = object()
+
+
+def estimate_tokens(text: str) -> int:
+    # Technical text tokenizes densely; ~3 chars/token keeps us under the real count
+    return len(text) // 3 + 1
+
+
+def is_retryable(exc: Exception) -> bool:
+    try:
+        from voyageai import error as voyage_error
+        if isinstance(exc, (voyage_error.RateLimitError, voyage_error.ServiceUnavailableError,
+                            voyage_error.Timeout, voyage_error.APIConnectionError, voyage_error.TryAgain)):
+            return True
+    except ImportError:
+        pass
+    status = getattr(exc, "http_status", None) or getattr(exc, "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def is_rate_limit(exc: Exception) -> bool:
+    status = getattr(exc, "http_status", None) or getattr(exc, "status_code", None)
+    return status == 429 or type(exc).__name__ == "RateLimitError"
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    `capacity` is the largest burst allowed, by default one minute's worth.
+    """
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        if rate_per_minute <= 0:
+            raise ValueError("Rate must be greater than 0.")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Takes `amount` if available and returns 0, otherwise returns seconds to wait."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount: float = 1):
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    # Called after a 429 so everyone backs off, not just the request that got rejected
+    def drain(self):
+        with self._lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class EmbeddingScheduler:
+    """
+    Single queue of texts to embed, shared by every file being ingested.
+    A dispatcher thread packs queued texts into batches (by count and estimated tokens),
+    waits on the request and token buckets, then hands the batch to a pool of
+    `max_in_flight` workers. Each submitted text gets its own Future with its vector.
+    """
+    def __init__(self, embed_fn=embed_text, rpm: float = EMBED_RPM, tpm: float = EMBED_TPM,
+                 max_batch_texts: int = EMBED_MAX_BATCH_TEXTS, max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS,
+                 max_in_flight: int = EMBED_MAX_IN_FLIGHT, max_retries: int = EMBED_MAX_RETRIES,
+                 backoff_base: float = 2.0, backoff_cap: float = 120.0, linger: float = 0.05,
+                 burst_seconds: float = 60.0, token_estimator=estimate_tokens):
+        self.embed_fn = embed_fn
+        # Providers count per minute, so by default a full minute of budget may be spent at once
+        self.requests = TokenBucket(rpm, capacity=max(1.0, rpm * burst_seconds / 60))
+        self.token_bucket = TokenBucket(tpm, capacity=tpm * burst_seconds / 60)
+        self.max_batch_texts = max_batch_texts
+        # A batch can never need more tokens than the bucket can ever hold
+        self.max_batch_tokens = int(min(max_batch_tokens, self.token_bucket.capacity))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.linger = linger
+        self.estimate = token_estimator
+        self._queue = queue.Queue()
+        self._pending = None
+        self._slots = threading.Semaphore(max_in_flight)
+        self._workers = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+        self._closed = False
+        self.stats = {"batches": 0, "texts": 0, "tokens": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="embed-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, texts) -> list:
+        if self._closed:
+            raise RuntimeError("Scheduler is closed.")
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return futures
+
+    def embed(self, texts) -> list:
+        """Blocking helper: embeds `texts` through the shared queue and returns vectors in order."""
+        return [f.result() for f in self.submit(texts)]
+
+    def _next_item(self, timeout: float = None):
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _take_batch(self):
+        """Greedily packs queued texts into one request. Returns (None, 0) once closed."""
+        batch, tokens = [], 0
+        while True:
+            try:
+                # Block until the first text arrives, then keep packing while more arrive within `linger`
+                item = self._next_item(timeout=self.linger if batch else None)
+            except queue.Empty:
+                return batch, tokens
+            if item is _CLOSE:
+                if batch:
+                    self._pending = item
+                    return batch, tokens
+                return None, 0
+            text, future = item
+            cost = self.estimate(text)
+            if batch and (len(batch) >= self.max_batch_texts or tokens + cost > self.max_batch_tokens):
+                self._pending = item
+                return batch, tokens
+            if not future.set_running_or_notify_cancel():
+                continue
+            batch.append((text, future, cost))
+            tokens += cost
+
+    def _dispatch(self):
+        while True:
+            # Wait for a free slot and a request token before packing,
+            # so the batch includes everything that queued up meanwhile
+            self._slots.acquire()
+            self.requests.acquire()
+            batch, tokens = self._take_batch()
+            if batch is None:
+                self._slots.release()
+                return
+            self.token_bucket.acquire(tokens)
+            self._workers.submit(self._run_batch, batch, tokens)
+
+    def _run_batch(self, batch, tokens: int):
+        texts = [text for text, _, _ in batch]
+        span = telemetry.span("embed.batch", texts=len(texts), tokens=tokens).start()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    vectors = self.embed_fn(texts, is_query=False)
+                    span.set(retries=attempt).end()
+                    break
+                except Exception as e:
+                    if not is_retryable(e) or attempt == self.max_retries:
+                        raise
+                    if is_rate_limit(e):
+                        self.requests.drain()
+                        self._count("rate_limited")
+                    # Full jitter: random wait in [0, base * 2^attempt], capped
+                    delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                    self._count("retries")
+                    logger.warning(f"Embedding batch of {len(texts)} failed ({e}). Retry {attempt + 1} in {delay:.1f}s")
+                    time.sleep(delay)
+                    # A retry is a new request and spends the batch's tokens again
+                    self.requests.acquire()
+                    self.token_bucket.acquire(tokens)
+            #zip would leave the futures past a short response unresolved, and their callers waiting forever
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedding provider returned {len(vectors)} vectors for {len(batch)} texts")
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+            self._count("batches")
+            self._count("texts", len(batch))
+            self._count("tokens", tokens)
+        except Exception as e:
+            span.end(e)
+            self._count("failed", len(batch))
+            logger.error(f"Embedding batch of {len(texts)} failed permanently: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._dispatcher.join()
+        self._workers.shutdown(wait=True)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> EmbeddingScheduler:
+    """Process wide scheduler so every file being ingested shares one rate limit."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from src.embeddings import get_provider
+            _scheduler = make_scheduler(get_provider())
+        return _scheduler
+
+
+def make_scheduler(provider) -> EmbeddingScheduler:
+    if provider.remote:
+        return EmbeddingScheduler(provider)
+    # A local model has no rate limit; one batch at a time already keeps every core busy
+    return EmbeddingScheduler(provider, rpm=1e9, tpm=1e12, max_in_flight=1, max_batch_texts=LOCAL_MAX_BATCH_TEXTS)
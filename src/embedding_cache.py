@@ -0,0 +1,171 @@
+import os
+import time
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+import xxhash
+from src.db import embed_text
+from src.embeddings import get_provider
+from src.pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", str(7 * 24 * 3600)))
+# Set to 0 to keep the cache purely in memory
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "1") == "1"
+
+
+def normalize_query(query: str) -> str:
+    # Same question typed with different spacing/casing should hit the same entry
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Two tier cache for query embeddings: a bounded in-process LRU in front of
+    the query_embedding_cache table, which survives restarts.
+    Keys include model and dimension so switching either never returns a stale vector.
+    """
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 persistent: bool = QUERY_CACHE_PERSIST, model: str = None, dimension: int = None):
+        if max_entries <= 0:
+            raise ValueError("Cache size must be greater than 0.")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent = persistent
+        # None = whatever the configured provider uses, looked up on first key() so nothing loads at construction
+        self._model = model
+        self._dimension = dimension
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def model(self) -> str:
+        return self._model or get_provider().name
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension or get_provider().dimension
+
+    def key(self, query: str) -> str:
+        raw = f"{self.model}|{self.dimension}|{normalize_query(query)}"
+        return xxhash.xxh3_128_hexdigest(raw.encode("utf-8"))
+
+    def _get_memory(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def _put_memory(self, key: str, vector, stored_at: float = None):
+        with self._lock:
+            self._entries[key] = (vector, stored_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_persistent(self, key: str):
+        try:
+            with get_pool().connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT embedding::real[], extract(epoch FROM created_at)
+                        FROM query_embedding_cache
+                        WHERE cache_key = %s AND created_at > now() - make_interval(secs => %s)
+                        """, (key, self.ttl), prepare=True)
+                    row = cur.fetchone()
+                    return (row[0], float(row[1])) if row else None
+        except Exception as e:
+            # The cache is an optimization, a DB hiccup must never fail the query
+            logger.warning(f"Query cache lookup failed: {e}")
+            return None
+
+    def _put_persistent(self, key: str, vector):
+        try:
+            with get_pool().connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO query_embedding_cache (cache_key, model, dimension, embedding)
+                        VALUES (%s, %s, %s, %s::vector)
+                        ON CONFLICT (cache_key) DO UPDATE
+                        SET embedding = EXCLUDED.embedding, created_at = now()
+                        """, (key, self.model, self.dimension, list(vector)), prepare=True)
+        except Exception as e:
+            logger.warning(f"Query cache write failed: {e}")
+
+    def get(self, query: str):
+        key = self.key(query)
+        vector = self._get_memory(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+        if self.persistent:
+            found = self._get_persistent(key)
+            if found is not None:
+                vector, stored_at = found
+                self.persistent_hits += 1
+                self._put_memory(key, vector, stored_at)
+                return vector
+        self.misses += 1
+        return None
+
+    def put(self, query: str, vector):
+        key = self.key(query)
+        self._put_memory(key, vector)
+        if self.persistent:
+            self._put_persistent(key, vector)
+
+    def get_or_embed(self, query: str, embed_fn=embed_text):
+        vector = self.get(query)
+        if vector is None:
+            vector = embed_fn([query], is_query=True)[0]
+            self.put(query, vector)
+        return vector
+
+    def get_or_embed_many(self, queries, embed_fn=embed_text) -> list:
+        """Vectors for every query in order; all misses (each distinct text once) go out in a single embed call."""
+        vectors = [self.get(q) for q in queries]
+        missing = list(dict.fromkeys(q for q, v in zip(queries, vectors) if v is None))
+        if missing:
+            fresh = dict(zip(missing, embed_fn(missing, is_query=True)))
+            for query, vector in fresh.items():
+                self.put(query, vector)
+            vectors = [fresh[q] if v is None else v for q, v in zip(queries, vectors)]
+        return vectors
+
+    def prune(self) -> int:
+        """Drops expired rows from the persistent tier, returns how many were removed."""
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM query_embedding_cache WHERE created_at <= now() - make_interval(secs => %s)",
+                            (self.ttl,))
+                return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,237 @@
+import os
+import logging
+import threading
+from src.db import get_voyage_client, EMBEDDING_MODEL, EMBEDDING_DIMENSION
+
+logger = logging.getLogger(__name__)
+
+
+# Local models (embedder, reranker) read <PREFIX>_DEVICE and <PREFIX>_THREADS.
+# Device: auto picks cuda, then mps, then cpu. Threads: 0 = one intra-op thread per CPU this process may run on
+def device_setting(prefix: str) -> str:
+    return os.getenv(f"{prefix}_DEVICE", "auto")
+
+
+def threads_setting(prefix: str) -> int:
+    return int(os.getenv(f"{prefix}_THREADS", "0"))
+
+
+# voyage (remote API) or local (sentence-transformers in this process)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "voyage")
+EMBEDDING_LOCAL_MODEL = os.getenv("EMBEDDING_LOCAL_MODEL", "BAAI/bge-small-en-v1.5")
+EMBEDDING_DEVICE = device_setting("EMBEDDING")
+# Texts per forward pass; the scheduler may hand over more, they are split into batches of this size
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_THREADS = threads_setting("EMBEDDING")
+EMBEDDING_MAX_LENGTH = int(os.getenv("EMBEDDING_MAX_LENGTH", "512"))
+# Prepended to queries only; unset = the model's own "query" prompt if it ships one (bge, e5, ...)
+EMBEDDING_QUERY_PREFIX = os.getenv("EMBEDDING_QUERY_PREFIX")
+
+
+def select_device(preferred: str = "auto") -> str:
+    if preferred != "auto":
+        return preferred
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def default_threads() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def place_model(device: str, threads: int) -> str:
+    """Resolves `device`, sizing torch's intra-op pool when that is the CPU. Returns the device."""
+    import torch
+    device = select_device(device)
+    if device == "cpu":
+        torch.set_num_threads(threads or default_threads())
+    return device
+
+
+class EmbeddingMismatch(RuntimeError):
+    """Raised when doc_chunks was embedded by a different model than the configured provider."""
+
+
+class EmbeddingProvider:
+    """
+    Something that turns texts into vectors. `name` and `dimension` identify the vector space:
+    they are stored with every row and key every cache, so two spaces are never compared.
+    `remote` providers are rate limited by the embedding scheduler, local ones only batched.
+    """
+    name: str
+    remote: bool = True
+
+    @property
+    def dimension(self) -> int:
+        raise NotImplementedError
+
+    def embed(self, texts, is_query: bool = False) -> list:
+        raise NotImplementedError
+
+    def __call__(self, texts, is_query: bool = False) -> list:
+        return self.embed(texts, is_query=is_query)
+
+
+class VoyageProvider(EmbeddingProvider):
+    remote = True
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dimension: int = EMBEDDING_DIMENSION):
+        self.name = model
+        self._dimension = dimension
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    def embed(self, texts, is_query: bool = False) -> list:
+        input_type = "query" if is_query else "document"
+        res = get_voyage_client().embed(texts, model=self.name, input_type=input_type,
+                                        output_dimension=self._dimension)
+        return res.embeddings
+
+
+def model_dimension(model) -> int:
+    # Renamed in sentence-transformers 6, the old name still works but warns
+    getter = getattr(model, "get_embedding_dimension", None) or model.get_sentence_embedding_dimension
+    return getter()
+
+
+class LocalProvider(EmbeddingProvider):
+    """
+    sentence-transformers model run in process, batched, L2-normalized so cosine distance in
+    pgvector matches the model's similarity. Loaded on first use, or pass `model` directly.
+    """
+    remote = False
+
+    def __init__(self, model_name: str = EMBEDDING_LOCAL_MODEL, device: str = EMBEDDING_DEVICE,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS,
+                 max_length: int = EMBEDDING_MAX_LENGTH, query_prefix: str = EMBEDDING_QUERY_PREFIX, model=None):
+        if batch_size <= 0:
+            raise ValueError("Batch size must be greater than 0.")
+        self.name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.threads = threads
+        self.max_length = max_length
+        self.query_prefix = query_prefix
+        self._model = model
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        device = place_model(self.device, self.threads)
+        model = SentenceTransformer(self.name, device=device)
+        model.max_seq_length = self.max_length
+        if self.query_prefix is None:
+            self.query_prefix = getattr(model, "prompts", {}).get("query", "")
+        logger.info(f"Embedding model {self.name} loaded on {device} ({model_dimension(model)} dims)")
+        return model
+
+    @property
+    def dimension(self) -> int:
+        return model_dimension(self.model)
+
+    def embed(self, texts, is_query: bool = False) -> list:
+        model = self.model
+        if is_query and self.query_prefix:
+            texts = [self.query_prefix + t for t in texts]
+        vectors = model.encode(list(texts), batch_size=self.batch_size, normalize_embeddings=True,
+                               convert_to_numpy=True, show_progress_bar=False)
+        return list(vectors)
+
+
+def build_provider(name: str = EMBEDDING_PROVIDER, **kwargs) -> EmbeddingProvider:
+    if name == "voyage":
+        return VoyageProvider(**kwargs)
+    if name == "local":
+        return LocalProvider(**kwargs)
+    raise ValueError(f"Unknown embedding provider: {name} (expected voyage or local)")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> EmbeddingProvider:
+    """Process wide provider picked by EMBEDDING_PROVIDER."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider()
+    return _provider
+
+
+def corpus_models() -> list:
+    """(embedding_model, embedding_dim, rows) for every vector space present in doc_chunks."""
+    from src.pool import get_pool
+    with get_pool().connection() as conn:
+        return conn.execute("""
+            SELECT embedding_model, embedding_dim, count(*) FROM doc_chunks
+            GROUP BY embedding_model, embedding_dim ORDER BY count(*) DESC
+            """).fetchall()
+
+
+def column_dimension(conn) -> int:
+    """The dimension doc_chunks.embedding is declared with, None if the column has none."""
+    row = conn.execute("""
+        SELECT atttypmod FROM pg_attribute WHERE attrelid = 'doc_chunks'::regclass AND attname = 'embedding'
+        """).fetchone()
+    return row[0] if row and row[0] > 0 else None
+
+
+def fit_embedding_column(conn, dim: int) -> bool:
+    """
+    Resizes doc_chunks.embedding to `dim` if doc_chunks is empty: init.sql declares Voyage's 1024
+    dimensions, a fresh install with another provider would fail on its first COPY. Returns whether it did.
+    """
+    if column_dimension(conn) in (None, dim):
+        return False
+    from src.retrieval import VECTOR_STORAGE, COMPACT_STORAGE, compact_index_sql
+    with conn.transaction():
+        conn.execute("LOCK TABLE doc_chunks IN ACCESS EXCLUSIVE MODE")
+        if conn.execute("SELECT EXISTS (SELECT 1 FROM doc_chunks)").fetchone()[0]:
+            return False
+        #Rebuilds the HNSW index on every partition too, they're empty so it's instant
+        conn.execute(f"ALTER TABLE doc_chunks ALTER COLUMN embedding TYPE vector({int(dim)})")
+        #Compact indexes cast to the old dimension in their expression
+        for storage in COMPACT_STORAGE:
+            conn.execute(f"DROP INDEX IF EXISTS idx_embedding_{storage}")
+        if VECTOR_STORAGE != "full":
+            conn.execute(compact_index_sql(VECTOR_STORAGE, dim))
+    logger.info(f"doc_chunks is empty, resized its embedding column to {dim} dimensions")
+    return True
+
+
+def assert_corpus_matches(provider: EmbeddingProvider = None):
+    """
+    Never mix vector spaces: raises EmbeddingMismatch if doc_chunks holds vectors from any other model
+    than `provider`'s, such a corpus has to go through src.reembed first.
+    An empty doc_chunks gets its embedding column sized for `provider`.
+    """
+    provider = provider or get_provider()
+    models = corpus_models()
+    other = [(model, dim, rows) for model, dim, rows in models if model != provider.name]
+    if other:
+        found = ", ".join(f"{model} ({dim} dims, {rows} rows)" for model, dim, rows in other)
+        raise EmbeddingMismatch(f"doc_chunks holds embeddings from {found}, the configured provider is "
+                                f"{provider.name}. Run `python -m src.reembed` to rebuild them.")
+    if not models:
+        from src.pool import get_pool
+        with get_pool().connection() as conn:
+            fit_embedding_column(conn, provider.dimension)
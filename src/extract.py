@@ -0,0 +1,79 @@
+import os
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+
+logger = logging.getLogger(__name__)
+
+# Kept free of the rest of src/ on purpose: spawned workers import only this module and fitz
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+
+
+#Turns one page into markdown-ish text: big fonts become headings, bold spans get **
+def renderPage(page) -> str:
+    parts = []
+    for b in page.get_text("dict")["blocks"]:
+        if "lines" not in b: continue
+        for line in b["lines"]:
+            for span in line["spans"]:
+                text = span["text"].strip()
+                if not text: continue
+                size = span["size"]
+                if size > 14:
+                    parts.append(f"\n# {text}\n")
+                elif 12 < size <= 14:
+                    parts.append(f"\n## {text}\n")
+                elif span["flags"] & 2**4:
+                    parts.append(f" **{text}** ")
+                else:
+                    parts.append(f" {text} ")
+    return "".join(parts).replace('\x00', '').replace('\ufb01', 'fi').replace('\ufb02', 'fl')
+
+
+#Worker entry point, every process opens its own document handle
+def extractPageRange(filePath: str, start: int, stop: int) -> list:
+    with fitz.open(filePath) as doc:
+        return [(i + 1, renderPage(doc[i])) for i in range(start, stop)]
+
+
+def pageCount(filePath: str) -> int:
+    with fitz.open(filePath) as doc:
+        return doc.page_count
+
+
+def iterPagesFromPDF(filePath: str, workers: int = PDF_WORKERS, pagesPerTask: int = PAGES_PER_TASK):
+    """
+    Yields (page_number, text) in page order. Page ranges are spread over a process pool and
+    at most 2 ranges per worker are held at once, so memory doesn't grow with the page count.
+    """
+    if pagesPerTask <= 0:
+        raise ValueError("Pages per task must be greater than 0.")
+    total = pageCount(filePath)
+    ranges = [(start, min(start + pagesPerTask, total)) for start in range(0, total, pagesPerTask)]
+    logger.info(f"Parsing {os.path.basename(filePath)} ({total} pages, {min(workers, len(ranges))} workers).")
+    if workers <= 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            yield from extractPageRange(filePath, start, stop)
+        return
+    # spawn, not fork: ingestion runs next to the embedding threads and forking a threaded process is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        todo = iter(ranges)
+        try:
+            for start, stop in todo:
+                pending.append(pool.submit(extractPageRange, filePath, start, stop))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                pages = pending.popleft().result()
+                nxt = next(todo, None)
+                if nxt is not None:
+                    pending.append(pool.submit(extractPageRange, filePath, *nxt))
+                yield from pages
+        finally:
+            for future in pending:
+                future.cancel()
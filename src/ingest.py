@@ -1,9 +1,18 @@
-import fitz
-from src.db import get_connection_string, file_exists, embed_text
-import time
+from src.db import notify_corpus_change
+from src.loader import StreamingLoader
+from src.content_hash import (hash_file, hash_chunk, file_versions, completed_chunks, mark_complete, lookup_embeddings,
+                              save_embeddings)
+from src.embed_scheduler import EmbeddingScheduler, get_scheduler
+from src.embeddings import get_provider, assert_corpus_matches
+from src.checkpoint import CheckpointStore, CHECKPOINT_DIR
+from src.collection import DEFAULT_COLLECTION, discover, ensure_collection
+from src.extract import iterPagesFromPDF, PDF_WORKERS
+from src import telemetry
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+import numpy as np
+from itertools import islice
 import logging
-import voyageai
-import psycopg
 from dotenv import load_dotenv
 import pickle
 import os
@@ -11,33 +20,9 @@ import os
 
 logger = logging.getLogger(__name__)
 
-def getTextFromPDF(filePath: str):
-    doc = fitz.open(filePath)
-    pages_data = []
-    logger.info(f"Parsing {os.path.basename(filePath)}.")
-    for i, page in enumerate(doc):
-        blocks = page.get_text("dict")["blocks"]
-        md_text = ""
-        for b in blocks:
-            if "lines" not in b: continue
-            for line in b["lines"]:
-                for span in line["spans"]:
-                    text = span["text"].strip()
-                    if not text: continue
-                    size = span["size"]
-                    if size > 14:
-                        md_text += f"\n# {text}\n"
-                    elif 12 < size <= 14:
-                        md_text += f"\n## {text}\n"
-                    elif span["flags"] & 2**4:
-                        md_text += f" **{text}** "
-                    else:
-                        md_text += f" {text} "
-        clean_text = md_text.replace('\x00', '').replace('\ufb01', 'fi').replace('\ufb02', 'fl')
-        pages_data.append({"text": clean_text, "page": i + 1})
-        
-    doc.close()
-    return pages_data
+#Kept for callers that want the whole document at once; ingestion streams iterPagesFromPDF instead
+def getTextFromPDF(filePath: str, workers: int = PDF_WORKERS):
+    return [{"text": text, "page": page} for page, text in iterPagesFromPDF(filePath, workers)]
 
 #Split data into chunks of 1000 characters with an overlap of 200 characters (or changed if needed)
 def getChunks(data: str,chunkSize: int = 1000, overlap: int=200):
@@ -69,102 +54,177 @@ def makeBatches(chunks, batchSize: int = 128):
         
         
 load_dotenv()
-#Using voyage cuz free for a while
-vo = voyageai.Client(os.getenv("VOYAGE_API"))
+#Using voyage cuz free for a while. The client lives in src.db (get_voyage_client) and is built on first embed
+#Vectors are checkpointed every CHECKPOINT_EVERY chunks, with EMBED_LOOKAHEAD windows queued ahead
+CHECKPOINT_EVERY = 100
+EMBED_LOOKAHEAD = 20
+#Files parsed/embedded at once; they all feed the same embedding queue so the rate limit stays shared
+INGEST_FILE_WORKERS = int(os.getenv("INGEST_FILE_WORKERS", "2"))
+
+
+#Old pickle checkpoints get moved into the new store once so no embedding work is lost
+def importLegacyCheckpoint(store: CheckpointStore, pickle_path: str):
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+    store.write_plan((chunk, meta["page"]) for chunk, meta in zip(data["chunks"], data["metadata"]))
+    if data["vectors"]:
+        store.append(data["vectors"])
+    os.remove(pickle_path)
+    logger.info(f"Imported legacy checkpoint {pickle_path} ({store.committed}/{store.total} embedded)")
+
+#Looks every chunk of a window up by content hash first, only text never embedded before (by any file) is submitted.
+#`pending` maps hashes still being embedded to their future, so a chunk repeated in the lookahead isn't sent twice.
+def prepareWindow(window, scheduler: EmbeddingScheduler, pending: dict, parent=None):
+    with telemetry.span("ingest.lookup", parent, chunks=len(window)) as span:
+        hashes = [hash_chunk(text) for text, _ in window]
+        texts = {}
+        for (text, _), h in zip(window, hashes):
+            if h not in pending:
+                texts.setdefault(h, text)
+        known = lookup_embeddings(list(texts))
+        missing = [h for h in texts if h not in known]
+        span.set(known=len(known), missing=len(missing))
+    for h, future in zip(missing, scheduler.submit([texts[h] for h in missing])):
+        pending[h] = future
+    sources = [known[h] if h in known else pending[h] for h in hashes]
+    return window, hashes, sources, missing
 
+#Vectors are made durable in the checkpoint first, then loaded, so the DB never gets ahead of the checkpoint.
+#New embeddings are also saved by hash so later files and re-ingests can reuse them.
+#The commit span includes waiting on the window's embeddings, ingest.embed_wait is that part alone.
+def commitWindow(store: CheckpointStore, loader: StreamingLoader, prepared, pending: dict, progressive: bool = True,
+                 parent=None):
+    window, hashes, sources, missing = prepared
+    with telemetry.span("ingest.commit", parent, chunks=len(window), embedded=len(missing)):
+        with telemetry.span("ingest.embed_wait", parent, chunks=len(missing)):
+            vectors = np.asarray([s.result() if isinstance(s, Future) else s for s in sources], dtype=np.float32)
+        save_embeddings((h, pending[h].result()) for h in missing)
+        store.append(vectors)
+        for h in missing:
+            pending.pop(h, None)
+        if progressive:
+            loader.write_rows((text, page, vector, h) for (text, page), vector, h in zip(window, vectors, hashes))
+            logger.info(f"Progress: {store.committed}/{store.total} (loaded)")
+        else:
+            logger.info(f"Progress: {store.committed}/{store.total} (staged)")
+    return len(missing)
+
+#progress(committed, total) is called as chunks get embedded, e.g. by the ingestion daemon's status table
+def ingestPdf(filePath: str, scheduler: EmbeddingScheduler = None, collection: str = DEFAULT_COLLECTION,
+              progress=None) -> dict:
+    with telemetry.span("ingest.file", file=os.path.basename(filePath), collection=collection) as root:
+        result = _ingestPdf(filePath, scheduler, root, collection, progress)
+        root.set(status=result["status"], chunks=result["chunks"], embedded=result["embedded"], reused=result["reused"])
+        return result
 
-def ingestPdf(filePath: str):
+def _ingestPdf(filePath: str, scheduler: EmbeddingScheduler, root, collection: str = DEFAULT_COLLECTION,
+               progress=None) -> dict:
+    progress = progress or (lambda committed, total: None)
     filename = os.path.basename(filePath)
-    if (file_exists(filename)):
-        logger.info(f"Skipping {filename}: Already exists.")
-        return
+    provider = get_provider()
+    #The same filename can exist in two collections, they need their own checkpoints
+    checkpoint = filename if collection == DEFAULT_COLLECTION else f"{collection}__{filename}"
+    with telemetry.span("ingest.hash", root):
+        file_hash = hash_file(filePath)
     # i hate everything, 90k tokens gone
-    #This opens a pkl file, loading all the data if it exists so we dont have to embed it again from 0 but instead keep it there
-    checkpoint_path = f"data/checkpoints/checkpoint_{filename}.pkl" # 
-    if os.path.exists(checkpoint_path):
-        logger.info(f"Restarting ingestion for {filename}")
-        with open(checkpoint_path, "rb") as f:
-            data = pickle.load(f)
-            all_chunks = data["chunks"]
-            all_vectors = data["vectors"]
-            all_metadata = data["metadata"]     
-            start_idx = len(all_vectors)
+    #Every embedded window is appended to an on-disk checkpoint, so a crash only loses the windows still in flight
+    store = CheckpointStore(checkpoint, dim=provider.dimension, model=provider.name)
+    if store.has_plan() and store.source_hash not in (None, file_hash):
+        logger.info(f"{filename} changed since its checkpoint was written, starting over")
+        store.remove()
+        store = CheckpointStore(checkpoint, dim=provider.dimension, model=provider.name)
+    #Rows are tagged with the file's hash: all of a finished ingest's rows at this hash and no checkpoint means
+    #nothing to do, rows at any other hash mean the file changed and the old version gets swapped out
+    current, stale = file_versions(filename, file_hash, collection)
+    if current and not stale and not store.has_plan():
+        if completed_chunks(filename, file_hash, collection) == current:
+            logger.info(f"Skipping {filename}: Already exists.")
+            return {"file": filename, "collection": collection, "status": "unchanged", "chunks": current,
+                    "embedded": 0, "reused": 0}
+        #A load that crashed and lost its checkpoint: keep the partial rows searchable and replace them
+        logger.info(f"{filename} has {current} rows from an unfinished ingest, replacing them")
+        stale = current
+    #A fresh file is loaded window by window as before. A changed one keeps its old rows searchable
+    #and only replaces them, in one transaction, once every new vector is checkpointed.
+    progressive = not stale
+    legacy_path = os.path.join(CHECKPOINT_DIR, f"checkpoint_{filename}.pkl")
+    if not store.has_plan() and os.path.exists(legacy_path):
+        importLegacyCheckpoint(store, legacy_path)
+    if store.has_plan():
+        logger.info(f"Restarting ingestion for {filename} at {store.committed}/{store.total}")
     else:
-    #if pickle file doesnt exist we start from 0 and do the whole process, this is for the first time ingesting a file or if something went wrong and we need to start over
-        logger.info(f"Starting ingestion for {filename}")
-        pages_data = getTextFromPDF(filePath)
-        all_chunks = []
-        all_metadata = [] 
-        start_idx = 0
-        all_vectors = []
-        for page in pages_data:
-            page_chunks = getChunks(page["text"])
-            for chunk in page_chunks:
-                all_chunks.append(chunk)
-                all_metadata.append({"file": filename, "page": page["page"]})
+    #First time ingesting a file (or the plan was torn): parse in parallel and stream pages straight into the chunk plan
+        logger.info(f"Starting ingestion for {filename}" + ("" if progressive else f" (changed, replacing {stale} rows)"))
+        with telemetry.span("ingest.parse", root) as span:
+            store.write_plan(((chunk, page) for page, text in iterPagesFromPDF(filePath) for chunk in getChunks(text)),
+                             source_hash=file_hash)
+            span.set(chunks=store.total)
     #Embeds regardless of state, if there is none to embed it wont even get to this part, so its fine.
-    SMALL_BATCH_SIZE = 10 
-    REQUEST_INTERVAL = 20.5
-    logger.info(f"Embedding {len(all_chunks)} chunks...")
-    remaining_chunks = all_chunks[start_idx:]
-    for batch_idx, batch in enumerate(makeBatches(remaining_chunks, batchSize=SMALL_BATCH_SIZE)):
-        start_time = time.time()
-        current_global_idx = start_idx + (batch_idx * SMALL_BATCH_SIZE)
-        retry_delay = 5 
+    #Rate limiting, batching and retries all live in the shared scheduler. We keep EMBED_LOOKAHEAD
+    #windows queued so batches stay full, while memory stays bounded no matter how big the PDF is.
+    scheduler = scheduler or get_scheduler()
+    loader = StreamingLoader(filename, file_hash=file_hash, model=provider.name, collection=collection)
+    if progressive:
+        loaded = loader.loaded_rows()
+        if loaded < store.committed:
+            logger.info(f"Loading {store.committed - loaded} checkpointed chunks left from the last run")
+            loader.write_rows((t, p, v, hash_chunk(t)) for t, p, v in store.iter_rows(loaded))
+    todo = store.total - store.committed
+    logger.info(f"Embedding {todo} chunks...")
+    progress(store.committed, store.total)
+    records = store.iter_plan(store.committed)
+    in_flight = deque()
+    pending = {}
+    embedded = 0
+    try:
         while True:
-            try:
-                embeddings = embed_text(batch, is_query=False)
-                all_vectors.extend(embeddings)
-                total_done = current_global_idx + len(batch)
-                logger.info(f"Progress: {total_done}/{len(all_chunks)}")
-                elapsed = time.time() - start_time
-                sleep_needed = max(0, REQUEST_INTERVAL - elapsed)
-                if (batch_idx + 1) % 10 == 0:
-                    with open(checkpoint_path, "wb") as f:
-                        pickle.dump({
-                            "chunks": all_chunks,
-                            "vectors": all_vectors,
-                            "metadata": all_metadata,
-                            "last_index": total_done
-                        }, f)
-                    logger.info(f"checkpointed at {total_done}/{len(all_chunks)}")
-                logger.info(f"Batch took {elapsed:.2f}s. Sleeping for {sleep_needed:.2f}s")
-            
-                time.sleep(sleep_needed)
+            window = list(islice(records, CHECKPOINT_EVERY))
+            if not window:
                 break
-            except Exception as e:
-                    if "429" in str(e) or "limit" in str(e).lower():
-                        logger.warning(f"Rate limit reached. Retrying in {retry_delay}s")
-                        time.sleep(retry_delay)
-                        retry_delay *= 1.5
-                        if retry_delay > 120: raise e
-                    else:
-                        logger.error(f"Embedding error: {e}")
-                        raise e
-    conn_str = get_connection_string()
-    try:
-        with psycopg.connect(conn_str) as conn:
-            with conn.cursor() as cur:
-                sql = "COPY doc_chunks (content, embedding, filename, page_number) FROM STDIN"
-                with cur.copy(sql) as copy:
-                    for chunk, vector, meta in zip(all_chunks, all_vectors, all_metadata):
-                        vector_str = "[" + ",".join(map(str, vector)) + "]"
-                        copy.write_row((chunk, vector_str, meta["file"], meta["page"]))
-                        
-        logger.info(f"Successfully ingested {len(all_chunks)} chunks.")
+            in_flight.append(prepareWindow(window, scheduler, pending, root))
+            if len(in_flight) > EMBED_LOOKAHEAD:
+                embedded += commitWindow(store, loader, in_flight.popleft(), pending, progressive, root)
+                progress(store.committed, store.total)
+        while in_flight:
+            embedded += commitWindow(store, loader, in_flight.popleft(), pending, progressive, root)
+            progress(store.committed, store.total)
     except Exception as e:
-        logger.error(f"DB Error: {e}")
+        logger.error(f"Ingestion error for {filename}: {e}")
+        # Don't leave this file's chunks in the shared queue eating other files' rate limit
+        for f in pending.values():
+            f.cancel()
+        raise e
+    if not progressive:
+        with telemetry.span("ingest.replace", root, rows=store.total, stale=stale):
+            loader.replace_rows((t, p, v, hash_chunk(t)) for t, p, v in store.iter_rows())
+    logger.info(f"Successfully ingested {store.total} chunks ({embedded} embedded, {todo - embedded} reused).")
+    #Before the checkpoint goes: a crash in between resumes from it and marks the file again
+    mark_complete(filename, file_hash, collection, store.total)
+    store.remove()
+    notify_corpus_change(filename, "ingested")
+    return {"file": filename, "collection": collection, "status": "ingested" if progressive else "replaced",
+            "chunks": store.total, "embedded": embedded, "reused": todo - embedded}
         
 def run_ingest():
     if not os.path.exists("data"):
         os.makedirs("data")
         os.makedirs("data/checkpoints", exist_ok=True)
     else:
-        files = [f for f in os.listdir("data") if f.endswith(".pdf")]
+        #data/*.pdf go to the default collection, data/<collection>/*.pdf to <collection>
+        files = discover("data")
         if not files:
             print("no pdf")
         else:
-            for file in files:
-                path = os.path.join("data", file)
-                ingestPdf(path)        
+            assert_corpus_matches()
+            #Partitions are created before any worker starts loading into them
+            for collection in sorted({c for _, c in files}):
+                ensure_collection(collection)
+            scheduler = get_scheduler()
+            with ThreadPoolExecutor(max_workers=INGEST_FILE_WORKERS, thread_name_prefix="ingest") as executor:
+                jobs = [executor.submit(ingestPdf, path, scheduler, collection) for path, collection in files]
+                results = [job.result() for job in jobs]
+            reused = sum(r["reused"] for r in results)
+            logger.info(f"Content hashing saved {reused} of {reused + sum(r['embedded'] for r in results)} embeddings, "
+                        f"{sum(r['status'] == 'unchanged' for r in results)} files unchanged")
+            logger.info(f"Embedding stats: {scheduler.stats}")        
   
\ No newline at end of file
@@ -0,0 +1,294 @@
+"""
+Watched-folder ingestion that runs next to the server instead of in front of it. PDFs under data/
+(laid out as src.collection.discover expects) are queued in the ingest_queue table at startup and
+whenever watchfiles sees one added or changed, and INGEST_FILE_WORKERS threads ingest them through
+the shared embedding scheduler. A new file's chunks are searchable window by window while it embeds,
+a changed file keeps its old version searchable until its new one is complete.
+
+The queue outlives the process: files that were running when it stopped are queued again on the next
+start and resume from their checkpoint. One daemon per database.
+
+    python -m src.ingest_daemon           # ingest and watch, without the UI
+    python -m src.ingest_daemon status    # per-file progress
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+from psycopg.rows import dict_row
+from src.pool import get_pool
+from src.ingest import ingestPdf, INGEST_FILE_WORKERS
+from src.embed_scheduler import get_scheduler
+from src.embeddings import assert_corpus_matches, EmbeddingMismatch
+from src.collection import discover, collection_for, ensure_collection
+from src.checkpoint import CHECKPOINT_DIR
+
+logger = logging.getLogger(__name__)
+
+# 0 = ingest what is in data/ at startup, then stop looking
+INGEST_WATCH = os.getenv("INGEST_WATCH", "1") == "1"
+# A file is only picked up once it has stopped changing for this long, so half-copied PDFs aren't parsed
+INGEST_SETTLE_SECONDS = float(os.getenv("INGEST_SETTLE_SECONDS", "5"))
+# Failed files are retried after INGEST_RETRY_SECONDS, doubling each time, until INGEST_MAX_ATTEMPTS
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_RETRY_SECONDS = float(os.getenv("INGEST_RETRY_SECONDS", "30"))
+# Longest an idle worker sleeps before looking at the queue again
+INGEST_POLL_SECONDS = 5.0
+# Seconds between progress writes for a running file
+PROGRESS_EVERY = 2.0
+
+# Unchanged files (same size and mtime) that are done or already waiting are left alone;
+# a file changed while it is running is flagged and goes back to the queue when that run ends
+ENQUEUE_SQL = """
+INSERT INTO ingest_queue (path, collection, file_size, file_mtime, available_at)
+VALUES (%(path)s, %(collection)s, %(size)s, %(mtime)s, now() + make_interval(secs => %(settle)s))
+ON CONFLICT (path) DO UPDATE SET
+    collection = EXCLUDED.collection, file_size = EXCLUDED.file_size, file_mtime = EXCLUDED.file_mtime,
+    available_at = EXCLUDED.available_at, attempts = 0, error = NULL, updated_at = now(),
+    requeue = ingest_queue.status = 'running',
+    queued_at = CASE WHEN ingest_queue.status = 'queued' THEN ingest_queue.queued_at ELSE now() END,
+    status = CASE WHEN ingest_queue.status = 'running' THEN 'running' ELSE 'queued' END
+WHERE ingest_queue.status = 'failed'
+   OR ingest_queue.file_size IS DISTINCT FROM EXCLUDED.file_size
+   OR ingest_queue.file_mtime IS DISTINCT FROM EXCLUDED.file_mtime
+"""
+
+CLAIM_SQL = """
+UPDATE ingest_queue SET status = 'running', attempts = attempts + 1, started_at = now(), finished_at = NULL,
+    chunks_done = NULL, chunks_total = NULL, updated_at = now()
+WHERE path = (SELECT path FROM ingest_queue WHERE status = 'queued' AND available_at <= now()
+              ORDER BY queued_at LIMIT 1 FOR UPDATE SKIP LOCKED)
+RETURNING path, collection, attempts
+"""
+
+NEXT_SQL = "SELECT extract(epoch FROM min(available_at) - now()) FROM ingest_queue WHERE status = 'queued'"
+
+PROGRESS_SQL = """
+UPDATE ingest_queue SET chunks_done = %s, chunks_total = %s, updated_at = now() WHERE path = %s AND status = 'running'
+"""
+
+FINISH_SQL = """
+UPDATE ingest_queue SET
+    status = CASE WHEN requeue THEN 'queued' ELSE %(status)s END,
+    attempts = CASE WHEN requeue THEN 0 ELSE attempts END,
+    available_at = CASE WHEN requeue THEN available_at ELSE now() + make_interval(secs => %(delay)s) END,
+    queued_at = CASE WHEN requeue OR %(status)s = 'queued' THEN now() ELSE queued_at END,
+    requeue = false, error = %(error)s, result = %(result)s, finished_at = now(), updated_at = now()
+WHERE path = %(path)s AND status = 'running'
+"""
+
+# Whatever was running when the last process died goes back to the queue, unless it already used up its attempts
+RECOVER_SQL = """
+UPDATE ingest_queue SET
+    status = CASE WHEN attempts >= %(max)s THEN 'failed' ELSE 'queued' END,
+    error = CASE WHEN attempts >= %(max)s THEN 'interrupted ' || attempts || ' times' ELSE error END,
+    requeue = false, available_at = now(), updated_at = now()
+WHERE status = 'running'
+"""
+
+STATUS_SQL = """
+SELECT path, collection, status, chunks_done, chunks_total, attempts, error, queued_at, started_at, finished_at
+FROM ingest_queue
+ORDER BY CASE status WHEN 'running' THEN 0 WHEN 'queued' THEN 1 WHEN 'failed' THEN 2 ELSE 3 END, queued_at, path
+"""
+
+
+def _execute(query: str, params=None):
+    with get_pool().connection() as conn:
+        return conn.execute(query, params)
+
+
+def enqueue(path: str, collection: str, data_dir: str = "data", settle: float = INGEST_SETTLE_SECONDS) -> bool:
+    """Queues the PDF at `path` unless it is unchanged since it was last queued. True if it was (re)queued."""
+    stat = os.stat(path)
+    with get_pool().connection() as conn:
+        cur = conn.execute(ENQUEUE_SQL, {"path": _key(path, data_dir), "collection": collection, "size": stat.st_size,
+                                         "mtime": stat.st_mtime, "settle": settle})
+        return cur.rowcount > 0
+
+
+def forget(path: str, data_dir: str = "data"):
+    """Drops a deleted file's queue entry. Its chunks stay searchable, src.db.delete_file_from_db removes them."""
+    _execute("DELETE FROM ingest_queue WHERE path = %s AND status <> 'running'", (_key(path, data_dir),))
+
+
+def status() -> list:
+    """Every queued, running, done and failed file, running ones first."""
+    with get_pool().connection() as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            return cur.execute(STATUS_SQL).fetchall()
+
+
+def _key(path: str, data_dir: str) -> str:
+    return os.path.relpath(path, data_dir).replace(os.sep, "/")
+
+
+class IngestDaemon:
+    """Keeps ingest_queue in step with data/ and drains it with `workers` threads."""
+    def __init__(self, data_dir: str = "data", workers: int = INGEST_FILE_WORKERS, watch: bool = INGEST_WATCH,
+                 scheduler=None, ingest=ingestPdf):
+        self.data_dir = data_dir
+        self.workers = workers
+        self.watch = watch
+        self.scheduler = scheduler
+        self.ingest = ingest
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads = []
+
+    def start(self) -> "IngestDaemon":
+        thread = threading.Thread(target=self._run, name="ingest-daemon", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stops after the files being ingested finish their current window; unfinished ones resume next start."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        #The database may still be starting: keep trying, serving doesn't wait for us
+        while not self._stop.is_set():
+            try:
+                self._prepare()
+                break
+            except EmbeddingMismatch as e:
+                logger.error(f"Ingestion disabled: {e}")
+                return
+            except Exception as e:
+                logger.error(f"Ingestion daemon could not start: {e}. Retrying in 10s...")
+                self._stop.wait(10)
+        self.scheduler = self.scheduler or get_scheduler()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.watch:
+            self._watch()
+
+    def _prepare(self):
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        assert_corpus_matches()
+        recovered = _execute(RECOVER_SQL, {"max": INGEST_MAX_ATTEMPTS}).rowcount
+        queued = sum(enqueue(path, collection, self.data_dir, settle=0) for path, collection in discover(self.data_dir))
+        logger.info(f"Ingestion daemon started: {queued} files queued, {recovered} resumed from the last run")
+
+    def _watch(self):
+        from watchfiles import watch, Change
+        for changes in watch(self.data_dir, watch_filter=lambda change, path: path.endswith(".pdf"),
+                             stop_event=self._stop):
+            for change, path in changes:
+                try:
+                    collection = collection_for(path, self.data_dir)
+                    if collection is None:
+                        continue
+                    if change == Change.deleted:
+                        forget(path, self.data_dir)
+                    elif os.path.isfile(path) and enqueue(path, collection, self.data_dir):
+                        logger.info(f"Queued {_key(path, self.data_dir)} ({collection})")
+                except Exception as e:
+                    logger.error(f"Could not queue {path}: {e}")
+            self._wake.set()
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                with get_pool().connection() as conn:
+                    job = conn.execute(CLAIM_SQL).fetchone()
+                    wait = None if job else conn.execute(NEXT_SQL).fetchone()[0]
+            except Exception as e:
+                logger.error(f"Could not read the ingest queue: {e}")
+                job, wait = None, INGEST_POLL_SECONDS
+            if job:
+                self._process(*job)
+                continue
+            wait = INGEST_POLL_SECONDS if wait is None else min(max(float(wait), 0.05), INGEST_POLL_SECONDS)
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def _process(self, key: str, collection: str, attempts: int):
+        path = os.path.join(self.data_dir, key)
+        if not os.path.isfile(path):
+            _execute("DELETE FROM ingest_queue WHERE path = %s", (key,))
+            return
+        try:
+            ensure_collection(collection)
+            result = self.ingest(path, self.scheduler, collection, progress=self._progress(key))
+            self._finish(key, "done", result=result)
+        except Exception as e:
+            retry = attempts < INGEST_MAX_ATTEMPTS
+            delay = INGEST_RETRY_SECONDS * 2 ** (attempts - 1)
+            logger.error(f"Ingesting {key} failed (attempt {attempts}/{INGEST_MAX_ATTEMPTS}): {e}"
+                         + (f". Retrying in {delay:.0f}s" if retry else ""))
+            self._finish(key, "queued" if retry else "failed", error=str(e), delay=delay if retry else 0)
+
+    def _finish(self, key: str, state: str, result: dict = None, error: str = None, delay: float = 0):
+        try:
+            _execute(FINISH_SQL, {"path": key, "status": state, "error": error, "delay": delay,
+                                  "result": json.dumps(result) if result else None})
+        except Exception as e:
+            #Left 'running': the next start queues it again
+            logger.error(f"Could not record {key} as {state}: {e}")
+
+    @staticmethod
+    def _progress(key: str):
+        last = 0.0
+
+        def report(done: int, total: int):
+            nonlocal last
+            now = time.monotonic()
+            if done < total and now - last < PROGRESS_EVERY:
+                return
+            last = now
+            try:
+                _execute(PROGRESS_SQL, (done, total, key))
+            except Exception as e:
+                logger.warning(f"Could not record progress of {key}: {e}")
+        return report
+
+
+_daemon = None
+_daemon_lock = threading.Lock()
+
+
+def start_ingest_daemon(data_dir: str = "data") -> IngestDaemon:
+    """Starts the process-wide daemon once; later calls return it."""
+    global _daemon
+    if _daemon is None:
+        with _daemon_lock:
+            if _daemon is None:
+                _daemon = IngestDaemon(data_dir).start()
+    return _daemon
+
+
+def format_status(rows: list) -> str:
+    lines = []
+    for r in rows:
+        progress = f"{r['chunks_done']}/{r['chunks_total']}" if r["chunks_total"] else ""
+        line = f"{r['status']:<8}{progress:>14}  {r['path']}"
+        if r["status"] == "failed" or (r["error"] and r["status"] == "queued"):
+            line += f"  ({r['attempts']} attempts: {r['error']})"
+        lines.append(line)
+    return "\n".join(lines) or "Nothing queued yet."
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Watched-folder ingestion of data/.")
+    parser.add_argument("command", nargs="?", choices=["run", "status"], default="run")
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+    if args.command == "status":
+        print(format_status(status()))
+    else:
+        daemon = start_ingest_daemon(args.data_dir)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            daemon.stop()
@@ -0,0 +1,268 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import subprocess
+from collections import deque
+from dataclasses import dataclass
+import orjson
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+# num_ctx must stay the same on every request, changing it makes Ollama reload the model
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# How long Ollama keeps the model (and its KV cache) loaded after a request
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Keep-alive connections held open to Ollama, about one per concurrent answer
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+OLLAMA_PORT = 11434
+
+# Query independent, so it is sent as `system` ahead of everything else: every request starts with
+# the exact same tokens and Ollama only has to prefill the context and question
+SYSTEM_PROMPT = """You are a Technical Support Engineer.
+Your goal is to provide high-precision answers based ONLY on the provided context.
+<instructions>
+STRICT RULES:
+1. Use ONLY information from the Context. If missing, say: "Information not found in provided documents."
+2. Cite sources in parentheses: (Source: filename, p. XX).
+3. DE-DUPLICATION: If multiple sources provide the same fact, combine them into one sentence and list all sources at the end, e.g., (Source: file1, p. 10; file2, p. 55).
+4. Formatting: Use `code blocks` for Code/SQL/parameters. Do NOT use LaTeX for version numbers or simple integers.
+</instructions>"""
+
+
+def build_prompt(query: str, context: str) -> str:
+    return f"<context>\n{context}\n</context>\n\n<question>\n{query}\n</question>"
+
+
+_endpoint = None
+_endpoint_lock = threading.Lock()
+
+
+def resolve_endpoint() -> str:
+    """
+    OLLAMA_BASE_URL if set, otherwise the default gateway (Ollama on the Windows host when running
+    under WSL/Docker) and finally localhost. Looked up once per process.
+    """
+    global _endpoint
+    if _endpoint is None:
+        with _endpoint_lock:
+            if _endpoint is None:
+                _endpoint = os.getenv("OLLAMA_BASE_URL") or _default_gateway_endpoint()
+    return _endpoint
+
+
+def _default_gateway_endpoint() -> str:
+    try:
+        out = subprocess.run(["ip", "route", "show", "default"], capture_output=True, text=True, timeout=2).stdout
+        fields = out.split()
+        if "via" in fields:
+            return f"http://{fields[fields.index('via') + 1]}:{OLLAMA_PORT}"
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return f"http://localhost:{OLLAMA_PORT}"
+
+
+class LLMTimeout(TimeoutError):
+    """Raised when the model doesn't start or stops producing tokens in time."""
+
+
+@dataclass
+class GenerationStats:
+    ttft: float = None
+    total: float = 0.0
+    tokens: int = 0
+    tokens_per_sec: float = 0.0
+    prompt_tokens: int = 0
+    prompt_eval_ms: float = 0.0
+    load_ms: float = 0.0
+
+
+class _Meter:
+    """Times one streamed generation; Ollama's own counters win over wall clock when it sends them."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.stats = GenerationStats()
+
+    def token(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+            self.stats.ttft = self.first - self.start
+        self.stats.tokens += 1
+
+    def finish(self, final: dict = None):
+        now = time.perf_counter()
+        stats = self.stats
+        stats.total = now - self.start
+        final = final or {}
+        if final.get("eval_count") and final.get("eval_duration"):
+            stats.tokens = final["eval_count"]
+            stats.tokens_per_sec = final["eval_count"] / (final["eval_duration"] / 1e9)
+        elif self.first is not None and stats.tokens > 1:
+            stats.tokens_per_sec = (stats.tokens - 1) / max(now - self.first, 1e-9)
+        stats.prompt_tokens = final.get("prompt_eval_count", 0)
+        stats.prompt_eval_ms = final.get("prompt_eval_duration", 0) / 1e6
+        stats.load_ms = final.get("load_duration", 0) / 1e6
+        return stats
+
+
+class OllamaClient:
+    """
+    Streaming /api/generate client. Sync calls share one requests.Session and async calls one
+    httpx.AsyncClient, so connections are kept alive between answers instead of reopened.
+    Each request asks Ollama to keep the model loaded, and warm() loads it ahead of the first user.
+    """
+    def __init__(self, base_url: str = None, model: str = OLLAMA_MODEL, num_ctx: int = OLLAMA_NUM_CTX,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, pool_size: int = OLLAMA_POOL_SIZE, timeout: float = 60.0,
+                 first_token_timeout: float = 60.0, idle_timeout: float = 30.0, resolver=resolve_endpoint):
+        self._base_url = base_url
+        self._resolver = resolver
+        self.model = model
+        self.num_ctx = num_ctx
+        self.keep_alive = keep_alive
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.first_token_timeout = first_token_timeout
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._http = None
+        self.last_stats = None
+        self._history = deque(maxlen=256)
+
+    @property
+    def base_url(self) -> str:
+        if self._base_url is None:
+            with self._lock:
+                if self._base_url is None:
+                    self._base_url = self._resolver()
+        return self._base_url
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/api/generate"
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def payload(self, prompt: str) -> dict:
+        return {"model": self.model, "system": SYSTEM_PROMPT, "prompt": prompt, "stream": True,
+                "keep_alive": self.keep_alive, "options": {"num_ctx": self.num_ctx}}
+
+    def _record(self, meter: _Meter, final: dict = None, span=telemetry.NOOP):
+        stats = meter.finish(final)
+        self.last_stats = stats
+        self._history.append(stats)
+        span.set(model=self.model, tokens=stats.tokens, prompt_tokens=stats.prompt_tokens,
+                 tokens_per_sec=round(stats.tokens_per_sec, 2), prompt_eval_ms=stats.prompt_eval_ms, load_ms=stats.load_ms)
+        if stats.ttft is not None:
+            span.set(ttft_ms=stats.ttft * 1000)
+            telemetry.observe("llm.ttft", stats.ttft * 1000, model=self.model)
+            logger.info(f"LLM: first token {stats.ttft * 1000:.0f} ms, {stats.tokens} tokens at "
+                        f"{stats.tokens_per_sec:.1f} tok/s, prompt {stats.prompt_tokens} tokens in {stats.prompt_eval_ms:.0f} ms")
+
+    def stream(self, prompt: str, span=telemetry.NOOP):
+        """Yields response tokens as they arrive; token counts and TTFT end up on `span`."""
+        meter = _Meter()
+        final = None
+        with self.session.post(self.url, data=orjson.dumps(self.payload(prompt)), stream=True,
+                               headers={"Content-Type": "application/json"}, timeout=(10, self.timeout)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    meter.token()
+                    yield token
+                # No break on done: reading to the end of the body lets the connection go back to the pool
+                if chunk.get("done"):
+                    final = chunk
+        self._record(meter, final, span)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size)
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(self.idle_timeout, connect=10.0), limits=limits)
+        return self._http
+
+    async def astream(self, prompt: str, span=telemetry.NOOP):
+        """Async twin of stream(); closing the generator (user disconnect) closes the HTTP stream."""
+        meter = _Meter()
+        final = None
+        async with self._async_client().stream("POST", self.url, content=orjson.dumps(self.payload(prompt)),
+                                               headers={"Content-Type": "application/json"}) as response:
+            response.raise_for_status()
+            lines = response.aiter_lines()
+            wait = self.first_token_timeout
+            while True:
+                try:
+                    async with asyncio.timeout(wait):
+                        line = await anext(lines)
+                except StopAsyncIteration:
+                    break
+                except TimeoutError:
+                    raise LLMTimeout(f"LLM produced no token for {wait}s")
+                wait = self.idle_timeout
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    meter.token()
+                    yield token
+                if chunk.get("done"):
+                    final = chunk
+        self._record(meter, final, span)
+
+    def warm(self) -> bool:
+        """Empty prompt: Ollama loads the model and keeps it for keep_alive without generating."""
+        try:
+            payload = {"model": self.model, "prompt": "", "keep_alive": self.keep_alive,
+                       "options": {"num_ctx": self.num_ctx}}
+            with self.session.post(self.url, data=orjson.dumps(payload), headers={"Content-Type": "application/json"},
+                                   stream=True, timeout=(10, self.timeout)) as response:
+                response.raise_for_status()
+                for _ in response.iter_lines():
+                    pass
+            return True
+        except requests.RequestException as e:
+            logger.warning(f"Could not warm {self.model} at {self.base_url}: {e}")
+            return False
+
+    def metrics(self) -> dict:
+        history = [s for s in self._history if s.ttft is not None]
+        if not history:
+            return {"requests": 0}
+        ttfts = sorted(s.ttft for s in history)
+        return {"requests": len(history),
+                "ttft_p50_ms": ttfts[len(ttfts) // 2] * 1000,
+                "ttft_p95_ms": ttfts[min(len(ttfts) - 1, int(0.95 * len(ttfts)))] * 1000,
+                "tokens_per_sec": sum(s.tokens_per_sec for s in history) / len(history)}
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self.close()
@@ -0,0 +1,106 @@
+import logging
+from psycopg import sql
+from src.pool import get_pool
+from src.db import bump_corpus_generation, own_corpus_change
+
+logger = logging.getLogger(__name__)
+
+COPY_SQL = "COPY {} ({}) FROM STDIN WITH (FORMAT BINARY)"
+COPY_COLUMNS = [("content", "text"), ("embedding", "vector"), ("filename", "text"), ("page_number", "int4")]
+HASH_COLUMNS = [("chunk_hash", "text"), ("file_hash", "text")]
+MODEL_COLUMNS = [("embedding_model", "text"), ("embedding_dim", "int4")]
+COLLECTION_COLUMNS = [("collection", "text")]
+
+
+class StreamingLoader:
+    """
+    Loads one file's chunks into doc_chunks in committed increments while embedding is still running.
+    Rows go through binary COPY with pgvector's adapter, so numpy vectors are sent as raw float32
+    instead of being formatted float by float.
+    Each write_rows call is its own transaction: rows become searchable as soon as it returns,
+    and a crash loses at most the batch being written.
+    With a file_hash, rows carry their chunk_hash as a 4th element and are stamped with both hashes.
+    With a model, rows are stamped with the embedding model and vector dimension.
+    With a collection, rows go to that collection's partition and only its rows count as this file's.
+    Writes to the live doc_chunks bump corpus_generation in the same transaction, so other processes'
+    caches see a progressive load batch by batch, not only once the file is complete.
+    """
+    def __init__(self, filename: str, pool=None, table: str = "doc_chunks", file_hash: str = None, model: str = None,
+                 collection: str = None):
+        self.filename = filename
+        self.pool = pool or get_pool()
+        #"schema.table" is allowed, e.g. src.rebuild's staging table
+        self.table = sql.Identifier(*table.split("."))
+        #A staging table isn't searched until it's swapped in, the swap bumps the generation
+        self.live = table == "doc_chunks"
+        self.file_hash = file_hash
+        self.model = model
+        self.collection = collection
+        self.columns = (COPY_COLUMNS + (HASH_COLUMNS if file_hash is not None else []) + (MODEL_COLUMNS if model else [])
+                        + (COLLECTION_COLUMNS if collection else []))
+        self.rows_written = 0
+
+    def loaded_rows(self) -> int:
+        # Batches are committed in order, so the row count is exactly how far a previous run got
+        query = "SELECT count(*) FROM {} WHERE filename = %s" + self._collection_filter()
+        params = [self.filename] + ([self.collection] if self.collection else [])
+        if self.file_hash is not None:
+            query += " AND file_hash = %s"
+            params.append(self.file_hash)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL(query).format(self.table), params)
+                return cur.fetchone()[0]
+
+    def _collection_filter(self) -> str:
+        return " AND collection = %s" if self.collection else ""
+
+    def _copy(self, cur, rows) -> int:
+        count = 0
+        names = sql.SQL(", ").join(sql.Identifier(name) for name, _ in self.columns)
+        with cur.copy(sql.SQL(COPY_SQL).format(self.table, names)) as copy:
+            copy.set_types([kind for _, kind in self.columns])
+            for row in rows:
+                content, page, vector = row[:3]
+                values = (content, vector, self.filename, page)
+                if self.file_hash is not None:
+                    values += (row[3], self.file_hash)
+                if self.model:
+                    values += (self.model, len(vector))
+                if self.collection:
+                    values += (self.collection,)
+                copy.write_row(values)
+                count += 1
+        return count
+
+    @staticmethod
+    def _committed(generation):
+        if generation is not None:
+            own_corpus_change(generation)
+
+    def write_rows(self, rows) -> int:
+        """rows: iterable of (content, page_number, vector[, chunk_hash]). Returns how many were written."""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                count = self._copy(cur, rows)
+                generation = bump_corpus_generation(cur) if self.live else None
+        self._committed(generation)
+        self.rows_written += count
+        return count
+
+    def replace_rows(self, rows) -> int:
+        """
+        Swaps every existing row of the file for `rows` in a single transaction, so searches see
+        either the old version or the new one and never a mix or a gap.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("DELETE FROM {} WHERE filename = %s" + self._collection_filter()).format(self.table),
+                            [self.filename] + ([self.collection] if self.collection else []))
+                removed = cur.rowcount
+                count = self._copy(cur, rows)
+                generation = bump_corpus_generation(cur) if self.live else None
+        self._committed(generation)
+        logger.info(f"Replaced {removed} rows of {self.filename} with {count}")
+        self.rows_written += count
+        return count
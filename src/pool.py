@@ -0,0 +1,117 @@
+import os
+import asyncio
+import threading
+import logging
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
+from pgvector.psycopg import register_vector, register_vector_async
+from src.db import get_connection_string
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing, can be overridden from the .env file
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+# Statements run this many times on a connection get prepared server side
+PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "1"))
+
+_pool = None
+_async_pool = None
+_lock = threading.Lock()
+_async_lock = asyncio.Lock()
+
+
+# Every pooled connection knows the vector type, so numpy arrays go over the wire in binary
+def _configure(conn):
+    conn.prepare_threshold = PREPARE_THRESHOLD
+    register_vector(conn)
+    # The type lookup opens a transaction, pooled connections must be handed out idle
+    conn.commit()
+
+
+async def _aconfigure(conn):
+    conn.prepare_threshold = PREPARE_THRESHOLD
+    await register_vector_async(conn)
+    await conn.commit()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Shared sync pool used by the query path and ingestion.
+    Created on first use so importing this module never touches the database.
+    """
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_connection_string(),
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_idle=POOL_MAX_IDLE,
+                    max_lifetime=POOL_MAX_LIFETIME,
+                    configure=_configure,
+                    check=ConnectionPool.check_connection,
+                    name="rag-sync",
+                    open=True,
+                )
+                logger.info(f"Opened DB pool (min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE})")
+    return _pool
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """Async twin of get_pool for code running on the event loop."""
+    global _async_pool
+    if _async_pool is None:
+        # Concurrent first calls wait here instead of each opening a pool of their own
+        async with _async_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    get_connection_string(),
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_idle=POOL_MAX_IDLE,
+                    max_lifetime=POOL_MAX_LIFETIME,
+                    configure=_aconfigure,
+                    check=AsyncConnectionPool.check_connection,
+                    name="rag-async",
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+                logger.info(f"Opened async DB pool (min={POOL_MIN_SIZE}, max={POOL_MAX_SIZE})")
+    return _async_pool
+
+
+def pool_stats() -> dict:
+    """
+    Wait/usage counters for both pools (requests_num, requests_wait_ms, pool_size, pool_available...).
+    Missing pools are simply left out.
+    """
+    stats = {}
+    if _pool is not None:
+        stats["sync"] = _pool.get_stats()
+    if _async_pool is not None:
+        stats["async"] = _async_pool.get_stats()
+    return stats
+
+
+def close_pools():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+async def aclose_pools():
+    global _async_pool, _async_lock
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+    # The lock binds to the loop it was first contended on, the next pool may live on another one
+    _async_lock = asyncio.Lock()
@@ -0,0 +1,120 @@
+"""
+Builds (or drops) the compact HNSW index behind VECTOR_STORAGE=halfvec|binary on an existing corpus:
+
+    python -m src.quantize halfvec                     # build idx_embedding_halfvec next to the full index
+    python -m src.quantize binary --drop-full-index    # and drop idx_embedding_hnsw once it's built
+    python -m src.quantize full                        # back: rebuild the full index, drop compact ones
+
+Indexes are built CONCURRENTLY, searches and ingestion keep running; on the partitioned doc_chunks
+that happens partition by partition, each index is then attached to one on the parent (which new
+collections inherit). Dropping an index of a partitioned table can't be concurrent, it locks briefly.
+Full-precision vectors stay in
+doc_chunks.embedding, they are what the candidates are re-scored against. Needs pgvector 0.7+.
+Set VECTOR_STORAGE to match and restart the app once the index exists.
+"""
+import os
+import time
+import logging
+import argparse
+from src.pool import get_pool
+from src.retrieval import COMPACT_STORAGE, compact_index_sql
+from src.collection import partitions
+
+logger = logging.getLogger(__name__)
+
+QUANTIZE_MAINTENANCE_WORK_MEM = os.getenv("QUANTIZE_MAINTENANCE_WORK_MEM", "1GB")
+FULL_INDEX_SQL = """CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {only}{table}
+    USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"""
+
+
+def pgvector_version(conn) -> tuple:
+    row = conn.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'").fetchone()
+    if row is None:
+        raise RuntimeError("pgvector is not installed.")
+    return tuple(int(p) for p in row[0].split(".")[:3])
+
+
+def corpus_dimension(conn) -> int:
+    dims = [r[0] for r in conn.execute("SELECT DISTINCT vector_dims(embedding) FROM doc_chunks WHERE embedding IS NOT NULL")]
+    if len(dims) != 1:
+        raise RuntimeError(f"Expected one embedding dimension in doc_chunks, found {dims or 'none'}.")
+    return dims[0]
+
+
+def index_sizes(conn) -> dict:
+    """{relation: bytes} for doc_chunks (heap + TOAST) and each of its indexes, summed over partitions."""
+    sizes = {"doc_chunks": int(conn.execute("""
+        SELECT coalesce((SELECT sum(pg_table_size(relid)) FROM pg_partition_tree('doc_chunks')), pg_table_size('doc_chunks'))
+        """).fetchone()[0])}
+    for name, size in conn.execute("""
+            SELECT indexrelid::regclass::text,
+                   coalesce((SELECT sum(pg_relation_size(relid)) FROM pg_partition_tree(indexrelid)), pg_relation_size(indexrelid))
+            FROM pg_index WHERE indrelid = 'doc_chunks'::regclass ORDER BY 1"""):
+        sizes[name] = int(size)
+    return sizes
+
+
+def create_index(conn, make_sql, name: str, suffix: str):
+    """
+    make_sql(name, table, concurrently, only) returns the CREATE INDEX statement. CONCURRENTLY isn't
+    allowed on a partitioned table: each partition's index (<partition>_<suffix>) is built concurrently
+    instead and attached to an index made ON ONLY the parent, which is valid once all are attached.
+    """
+    parts = partitions(conn)
+    if not parts:
+        conn.execute(make_sql(name, "doc_chunks", True, False))
+        return
+    if conn.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (name,)).fetchone() == (True,):
+        return
+    conn.execute(make_sql(name, "doc_chunks", False, True))
+    for part in parts:
+        # Index names can't be schema qualified, they're created next to their table anyway
+        child = f"{part.rsplit('.', 1)[-1]}_{suffix}"
+        conn.execute(make_sql(child, part, True, False))
+        conn.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def drop_index(conn, name: str):
+    concurrently = "" if partitions(conn) else "CONCURRENTLY "
+    conn.execute(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+def full_index_sql(name: str, table: str, concurrently: bool, only: bool) -> str:
+    return FULL_INDEX_SQL.format(name=name, table=table, concurrently="CONCURRENTLY " if concurrently else "",
+                                 only="ONLY " if only else "")
+
+
+def build(storage: str, drop_full_index: bool = False):
+    with get_pool().connection() as conn:
+        # CREATE/DROP INDEX CONCURRENTLY can't run inside a transaction block
+        conn.autocommit = True
+        try:
+            if storage != "full" and pgvector_version(conn) < (0, 7, 0):
+                raise RuntimeError("halfvec and binary_quantize need pgvector 0.7 or newer.")
+            conn.execute("SELECT set_config('maintenance_work_mem', %s, false)", (QUANTIZE_MAINTENANCE_WORK_MEM,))
+            start = time.perf_counter()
+            if storage == "full":
+                create_index(conn, full_index_sql, "idx_embedding_hnsw", "hnsw")
+                for other in COMPACT_STORAGE:
+                    drop_index(conn, f"idx_embedding_{other}")
+            else:
+                dim = corpus_dimension(conn)
+                create_index(conn, lambda name, table, concurrently, only: compact_index_sql(
+                    storage, dim, name, concurrently, table, only), f"idx_embedding_{storage}", storage)
+                if drop_full_index:
+                    drop_index(conn, "idx_embedding_hnsw")
+            logger.info(f"{storage} index ready in {time.perf_counter() - start:.1f}s")
+            for name, size in index_sizes(conn).items():
+                logger.info(f"{name:<32}{size / 2**20:>10.1f} MB")
+        finally:
+            conn.autocommit = False
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the ANN index for a vector storage mode.")
+    parser.add_argument("storage", choices=["full", *COMPACT_STORAGE])
+    parser.add_argument("--drop-full-index", action="store_true",
+                        help="drop the float32 HNSW index once the compact one is built (that's where the memory goes)")
+    args = parser.parse_args()
+    build(args.storage, args.drop_full_index)
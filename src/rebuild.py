@@ -0,0 +1,271 @@
+"""
+Rebuilds doc_chunks from the PDFs in data/ without taking search down:
+
+    python -m src.rebuild                 # load, index, swap
+    python -m src.rebuild --keep-old      # keep the replaced tables in the doc_chunks_retired schema
+
+1. load: every file's chunks go into a staging copy of doc_chunks in the doc_chunks_rebuild schema,
+   one UNLOGGED partition per collection and no indexes, by binary COPY. Vectors already in
+   chunk_embeddings are reused, only new text is embedded.
+2. set logged: each partition is written to the WAL once, in one pass, so the table survives a crash.
+3. index: the live table's indexes (primary key, HNSW, filename, compact VECTOR_STORAGE ones) and
+   each partition's BM25 index are built once over the full table, with REBUILD_PARALLEL_WORKERS
+   parallel maintenance workers.
+4. swap: one short transaction moves the live tables to doc_chunks_retired and the staging ones in
+   their place. Searches run against the old table up to that point.
+
+Don't add files to data/ while it runs: the ingestion daemon would load them into the old table, and
+those rows are not carried over. The swap bumps corpus_generation, so a running app drops its cached
+answers within CORPUS_GENERATION_CHECK_SECONDS.
+"""
+import os
+import re
+import time
+import logging
+import argparse
+import numpy as np
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from psycopg import sql, errors
+from src.db import bump_corpus_generation, read_corpus_generation
+from src.pool import get_pool
+from src.loader import StreamingLoader
+from src.embeddings import get_provider, assert_corpus_matches
+from src.embed_scheduler import get_scheduler
+from src.content_hash import hash_file, hash_chunk, lookup_embeddings, save_embeddings
+from src.collection import DEFAULT_COLLECTION, discover, partition_name, partitions, has_bm25, bm25_index_sql
+from src.extract import iterPagesFromPDF
+from src.ingest import getChunks, INGEST_FILE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+STAGING_SCHEMA = "doc_chunks_rebuild"
+RETIRED_SCHEMA = "doc_chunks_retired"
+# Chunks looked up, embedded and copied per round trip
+REBUILD_BATCH = int(os.getenv("REBUILD_BATCH", "1000"))
+# Workers per index build (capped by the server's max_worker_processes / max_parallel_workers)
+REBUILD_PARALLEL_WORKERS = int(os.getenv("REBUILD_PARALLEL_WORKERS", "4"))
+REBUILD_MAINTENANCE_WORK_MEM = os.getenv("REBUILD_MAINTENANCE_WORK_MEM", "1GB")
+# The swap waits this long for running searches to let go of doc_chunks, then backs off and tries again
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 5
+
+
+def live_schema(conn) -> str:
+    return conn.execute("SELECT relnamespace::regnamespace::text FROM pg_class WHERE oid = 'doc_chunks'::regclass").fetchone()[0]
+
+
+def ingestion_busy(conn) -> int:
+    """Files the ingestion daemon has queued or is loading into the live table."""
+    if conn.execute("SELECT to_regclass('ingest_queue') IS NULL").fetchone()[0]:
+        return 0
+    return conn.execute("SELECT count(*) FROM ingest_queue WHERE status IN ('queued', 'running')").fetchone()[0]
+
+
+def create_staging(conn, collections, dim: int):
+    """Empty, unindexed copy of doc_chunks with an UNLOGGED partition per collection. Ids come from the live sequence."""
+    if not partitions(conn):
+        raise RuntimeError("doc_chunks isn't partitioned, apply architecture/migrations/006_collections.sql first.")
+    conn.execute(f"DROP SCHEMA IF EXISTS {STAGING_SCHEMA} CASCADE")
+    conn.execute(f"CREATE SCHEMA {STAGING_SCHEMA}")
+    conn.execute(f"CREATE TABLE {STAGING_SCHEMA}.doc_chunks (LIKE doc_chunks INCLUDING DEFAULTS) PARTITION BY LIST (collection)")
+    conn.execute(f"ALTER TABLE {STAGING_SCHEMA}.doc_chunks ALTER COLUMN embedding TYPE vector({int(dim)})")
+    for name in collections:
+        conn.execute(sql.SQL("CREATE UNLOGGED TABLE {} PARTITION OF {} FOR VALUES IN ({})").format(
+            sql.Identifier(STAGING_SCHEMA, partition_name(name)), sql.Identifier(STAGING_SCHEMA, "doc_chunks"),
+            sql.Literal(name)))
+    conn.commit()
+
+
+def load_file(path: str, collection: str, scheduler, model: str, batch: int = REBUILD_BATCH) -> tuple:
+    """
+    Parses, embeds (only text chunk_embeddings doesn't have) and copies one PDF into the staging table.
+    Returns its ingested_files row: (filename, collection, file_hash, rows).
+    """
+    filename = os.path.basename(path)
+    file_hash = hash_file(path)
+    loader = StreamingLoader(filename, table=f"{STAGING_SCHEMA}.doc_chunks", file_hash=file_hash, model=model,
+                             collection=collection)
+    records = ((chunk, page) for page, text in iterPagesFromPDF(path) for chunk in getChunks(text))
+    while True:
+        window = list(islice(records, batch))
+        if not window:
+            break
+        hashes = [hash_chunk(text) for text, _ in window]
+        texts = dict(zip(hashes, (text for text, _ in window)))
+        known = lookup_embeddings(list(texts), model=model)
+        missing = [h for h in texts if h not in known]
+        fresh = dict(zip(missing, scheduler.embed([texts[h] for h in missing])))
+        save_embeddings(fresh.items(), model=model)
+        known.update(fresh)
+        loader.write_rows((text, page, np.asarray(known[h], dtype=np.float32), h) for (text, page), h in zip(window, hashes))
+    logger.info(f"Staged {loader.rows_written} rows of {filename} ({collection})")
+    return filename, collection, file_hash, loader.rows_written
+
+
+def set_logged(conn, collections):
+    for name in collections:
+        conn.execute(sql.SQL("ALTER TABLE {} SET LOGGED").format(sql.Identifier(STAGING_SCHEMA, partition_name(name))))
+    conn.commit()
+
+
+def index_statements(conn, collections, dim: int = None) -> list:
+    """
+    [(name, statement)]: the live parent's valid indexes and constraints re-targeted at the staging table, then BM25.
+    dim: the staging table's vector dimension when it differs from the live one (src.reembed).
+    """
+    staging = f"{STAGING_SCHEMA}.doc_chunks"
+    statements = [(name, f"ALTER TABLE {staging} ADD CONSTRAINT {name} {definition}") for name, definition in conn.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = 'doc_chunks'::regclass AND contype IN ('p', 'u') ORDER BY conname""")]
+    for name, definition in conn.execute("""
+            SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = 'doc_chunks'::regclass AND i.indisvalid
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)
+            ORDER BY c.relname"""):
+        # Indexes of a partitioned table print as ON ONLY; without it the build recurses into every partition
+        definition = re.sub(r" ON (ONLY )?\S+ USING ", f" ON {staging} USING ", definition, count=1)
+        if dim:
+            # Compact VECTOR_STORAGE indexes cast to the dimension in their expression
+            definition = re.sub(r"::(halfvec|bit)\(\d+\)", rf"::\1({int(dim)})", definition)
+        statements.append((name, definition))
+    if has_bm25(conn):
+        statements += [(f"{partition_name(name)}_bm25", bm25_index_sql(partition_name(name), STAGING_SCHEMA))
+                       for name in collections]
+    return statements
+
+
+def build_indexes(conn, collections, workers: int = REBUILD_PARALLEL_WORKERS,
+                  work_mem: str = REBUILD_MAINTENANCE_WORK_MEM, dim: int = None) -> list:
+    """Builds every index on the filled staging table, returns [(index, seconds)]."""
+    conn.execute("SELECT set_config('maintenance_work_mem', %s, false)", (work_mem,))
+    conn.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false)", (str(workers),))
+    timings = []
+    for name, statement in index_statements(conn, collections, dim):
+        start = time.perf_counter()
+        conn.execute(statement)
+        conn.commit()
+        timings.append((name, time.perf_counter() - start))
+        logger.info(f"Built {name} in {timings[-1][1]:.1f}s")
+    conn.execute("RESET maintenance_work_mem")
+    conn.execute("RESET max_parallel_maintenance_workers")
+    conn.commit()
+    return timings
+
+
+def swap(conn, collections, keep_old: bool = False, completed: list = None, generation: int = None) -> float:
+    """
+    Puts the staging tables in place of the live ones in one transaction. Returns how long doc_chunks was locked.
+    completed: load_file's results, they replace ingested_files in the same transaction.
+    generation: corpus_generation when the staging table was copied from the live one; the swap refuses if
+    doc_chunks changed since.
+    """
+    live = live_schema(conn)
+    conn.commit()
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        start = time.perf_counter()
+        try:
+            with conn.transaction():
+                conn.execute("SELECT set_config('lock_timeout', %s, true)", (SWAP_LOCK_TIMEOUT,))
+                # Parent first, in the order searches take their locks, so the swap can't deadlock with one
+                conn.execute("LOCK TABLE doc_chunks IN ACCESS EXCLUSIVE MODE")
+                if ingestion_busy(conn):
+                    raise RuntimeError("The ingestion daemon has work in progress, stop it and try again.")
+                if generation is not None and read_corpus_generation(conn) != generation:
+                    raise RuntimeError(f"doc_chunks changed while the staging table was built, it's left in "
+                                       f"{STAGING_SCHEMA}; run again.")
+                # The sequence stays put: ids keep counting up from the staging rows
+                sequence = conn.execute("SELECT pg_get_serial_sequence('doc_chunks', 'id')").fetchone()[0]
+                conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+                conn.execute(f"DROP SCHEMA IF EXISTS {RETIRED_SCHEMA} CASCADE")
+                conn.execute(f"CREATE SCHEMA {RETIRED_SCHEMA}")
+                for part in partitions(conn):
+                    conn.execute(f"ALTER TABLE {part} SET SCHEMA {RETIRED_SCHEMA}")
+                conn.execute(f"ALTER TABLE doc_chunks SET SCHEMA {RETIRED_SCHEMA}")
+                for name in collections:
+                    conn.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(
+                        sql.Identifier(STAGING_SCHEMA, partition_name(name)), sql.Identifier(live)))
+                conn.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(
+                    sql.Identifier(STAGING_SCHEMA, "doc_chunks"), sql.Identifier(live)))
+                conn.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}").format(
+                    sql.SQL(sequence), sql.Identifier(live, "doc_chunks", "id")))
+                conn.cursor().executemany("INSERT INTO collections (name) VALUES (%s) ON CONFLICT (name) DO NOTHING",
+                                          [(name,) for name in collections])
+                if completed is not None:
+                    conn.execute("DELETE FROM ingested_files")
+                    conn.cursor().executemany("""
+                        INSERT INTO ingested_files (filename, collection, file_hash, chunks) VALUES (%s, %s, %s, %s)
+                        """, completed)
+                conn.execute(f"DROP SCHEMA {STAGING_SCHEMA}")
+                bump_corpus_generation(conn)
+            seconds = time.perf_counter() - start
+            break
+        except errors.LockNotAvailable:
+            logger.warning(f"doc_chunks stayed busy for {SWAP_LOCK_TIMEOUT}, retrying the swap ({attempt}/{SWAP_ATTEMPTS})")
+            time.sleep(attempt)
+    else:
+        raise RuntimeError(f"Could not lock doc_chunks for the swap, the rebuilt table is left in {STAGING_SCHEMA}.")
+    if not keep_old:
+        conn.execute(f"DROP SCHEMA {RETIRED_SCHEMA} CASCADE")
+        conn.commit()
+    return seconds
+
+
+def rebuild(data_dir: str = "data", keep_old: bool = False, workers: int = INGEST_FILE_WORKERS,
+            parallel: int = REBUILD_PARALLEL_WORKERS) -> dict:
+    provider = get_provider()
+    files = discover(data_dir)
+    report = {"files": len(files)}
+    with get_pool().connection() as conn:
+        assert_corpus_matches(provider)
+        if ingestion_busy(conn):
+            raise RuntimeError("The ingestion daemon has work in progress, stop it before rebuilding.")
+        registered = [r[0] for r in conn.execute("SELECT name FROM collections")]
+        collections = sorted({DEFAULT_COLLECTION, *registered, *(c for _, c in files)})
+        create_staging(conn, collections, provider.dimension)
+
+        start = time.perf_counter()
+        scheduler = get_scheduler()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rebuild") as executor:
+            jobs = [executor.submit(load_file, path, collection, scheduler, provider.name) for path, collection in files]
+            completed = [job.result() for job in jobs]
+        report["rows"] = sum(rows for *_, rows in completed)
+        report["load_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        set_logged(conn, collections)
+        report["set_logged_s"] = time.perf_counter() - start
+
+        report["indexes"] = build_indexes(conn, collections, parallel)
+        report["index_s"] = sum(seconds for _, seconds in report["indexes"])
+
+        start = time.perf_counter()
+        conn.execute(f"ANALYZE {STAGING_SCHEMA}.doc_chunks")
+        conn.commit()
+        report["analyze_s"] = time.perf_counter() - start
+
+        report["swap_s"] = swap(conn, collections, keep_old, completed)
+    return report
+
+
+def print_report(report: dict):
+    print(f"\nRebuilt doc_chunks: {report['files']} files, {report['rows']} rows")
+    print(f"{'load (unlogged, no indexes)':<40}{report['load_s']:>9.2f}s{report['rows'] / max(report['load_s'], 1e-9):>12.0f} rows/s")
+    print(f"{'set logged':<40}{report['set_logged_s']:>9.2f}s")
+    for name, seconds in report["indexes"]:
+        print(f"{'index ' + name:<40}{seconds:>9.2f}s")
+    print(f"{'indexes total':<40}{report['index_s']:>9.2f}s")
+    print(f"{'analyze':<40}{report['analyze_s']:>9.2f}s")
+    print(f"{'swap (doc_chunks locked)':<40}{report['swap_s']:>9.3f}s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild doc_chunks from data/ in a staging table, then swap it in.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--keep-old", action="store_true", help=f"keep the replaced tables in the {RETIRED_SCHEMA} schema")
+    parser.add_argument("--workers", type=int, default=INGEST_FILE_WORKERS, help="files parsed and loaded at once")
+    parser.add_argument("--parallel", type=int, default=REBUILD_PARALLEL_WORKERS,
+                        help="parallel maintenance workers per index build")
+    args = parser.parse_args()
+    print_report(rebuild(args.data_dir, args.keep_old, args.workers, args.parallel))
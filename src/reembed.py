@@ -0,0 +1,150 @@
+"""
+Rebuilds doc_chunks.embedding with another embedding provider, in bulk:
+
+    EMBEDDING_PROVIDER=local python -m src.reembed            # embed, then swap
+    EMBEDDING_PROVIDER=local python -m src.reembed --embed-only
+
+1. embed (online, resumable): every chunk's new vector is written to the reembed_vectors side
+   table with binary COPY. Text already embedded by the new model (chunk_embeddings) is reused,
+   and each distinct text is embedded once. The old vectors keep serving searches meanwhile.
+2. stage (online): doc_chunks is copied into src.rebuild's staging tables with the side vectors
+   in place of the old ones, stamped with the new embedding_model/embedding_dim, and every index
+   (HNSW, the VECTOR_STORAGE compact one, BM25, ...) is built there at the new dimension.
+3. swap (short): src.rebuild.swap puts the staging tables in place of the live ones. doc_chunks is
+   only locked for that, and the swap refuses if doc_chunks changed since it was copied.
+
+Stop ingestion before the swap, and restart the app with the new EMBEDDING_PROVIDER afterwards:
+query vectors from the old model can't be compared with the new corpus.
+"""
+import os
+import time
+import logging
+import argparse
+import numpy as np
+from src.pool import get_pool
+from src.embeddings import build_provider, EMBEDDING_PROVIDER
+from src.embed_scheduler import make_scheduler
+from src.content_hash import hash_chunk, lookup_embeddings, save_embeddings
+from src.collection import DEFAULT_COLLECTION
+from src.db import read_corpus_generation
+from src import rebuild
+
+logger = logging.getLogger(__name__)
+
+REEMBED_BATCH = int(os.getenv("REEMBED_BATCH", "1000"))
+# Memory for the HNSW rebuild; the graph builds much faster when it fits
+REEMBED_MAINTENANCE_WORK_MEM = os.getenv("REEMBED_MAINTENANCE_WORK_MEM", "1GB")
+# doc_chunks columns copied as they are; embedding and its model/dim stamps come from reembed_vectors
+COLUMNS = "id, content, filename, page_number, chunk_hash, file_hash, collection"
+
+
+def prepare(conn, model: str):
+    conn.execute("CREATE TABLE IF NOT EXISTS reembed_vectors (id INTEGER PRIMARY KEY, model TEXT NOT NULL, embedding vector NOT NULL)")
+    # Left over from an interrupted run with another model
+    stale = conn.execute("DELETE FROM reembed_vectors WHERE model <> %s", (model,)).rowcount
+    conn.commit()
+    if stale:
+        logger.info(f"Dropped {stale} side vectors from another model")
+
+
+def embed_missing(conn, provider, scheduler, batch: int = REEMBED_BATCH) -> dict:
+    """Fills reembed_vectors for every chunk that has no new vector yet. Commits once per batch."""
+    stats = {"rows": 0, "embedded": 0, "reused": 0}
+    last_id = 0
+    start = time.perf_counter()
+    while True:
+        rows = conn.execute("""
+            SELECT c.id, c.content, c.chunk_hash FROM doc_chunks c
+            LEFT JOIN reembed_vectors r ON r.id = c.id
+            WHERE c.id > %s AND r.id IS NULL
+            ORDER BY c.id LIMIT %s
+            """, (last_id, batch)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        hashes = [h or hash_chunk(content) for _, content, h in rows]
+        texts = dict(zip(hashes, (content for _, content, _ in rows)))
+        known = lookup_embeddings(list(texts), model=provider.name)
+        missing = [h for h in texts if h not in known]
+        fresh = dict(zip(missing, scheduler.embed([texts[h] for h in missing])))
+        save_embeddings(fresh.items(), model=provider.name)
+        known.update(fresh)
+        with conn.cursor() as cur:
+            with cur.copy("COPY reembed_vectors (id, model, embedding) FROM STDIN WITH (FORMAT BINARY)") as copy:
+                copy.set_types(["int4", "text", "vector"])
+                for (row_id, _, _), h in zip(rows, hashes):
+                    copy.write_row((row_id, provider.name, np.asarray(known[h], dtype=np.float32)))
+        conn.commit()
+        stats["rows"] += len(rows)
+        stats["embedded"] += len(missing)
+        stats["reused"] += len(rows) - len(missing)
+        logger.info(f"Re-embedded {stats['rows']} rows ({stats['embedded']} embedded, {stats['reused']} reused, "
+                    f"{stats['rows'] / (time.perf_counter() - start):.0f} rows/s)")
+    return stats
+
+
+def stage(conn, provider, collections) -> int:
+    """
+    Copies doc_chunks into the staging table with the side vectors and builds its indexes, searches keep
+    using the live table. Returns the corpus_generation the copy was taken at.
+    """
+    dim = provider.dimension
+    # Read before the copy: any change committed after this bumps it, and the swap refuses
+    generation = read_corpus_generation(conn)
+    missing = conn.execute("""
+        SELECT count(*) FROM doc_chunks c LEFT JOIN reembed_vectors r ON r.id = c.id WHERE r.id IS NULL
+        """).fetchone()[0]
+    conn.commit()
+    if missing:
+        raise RuntimeError(f"{missing} rows have no new vector (ingested during the run?), run src.reembed again")
+    rebuild.create_staging(conn, collections, dim)
+    start = time.perf_counter()
+    rows = conn.execute(f"""
+        INSERT INTO {rebuild.STAGING_SCHEMA}.doc_chunks ({COLUMNS}, embedding, embedding_model, embedding_dim)
+        SELECT {", ".join(f"c.{column}" for column in COLUMNS.split(", "))}, r.embedding, r.model, %s
+        FROM doc_chunks c JOIN reembed_vectors r ON r.id = c.id
+        """, (dim,)).rowcount
+    conn.commit()
+    logger.info(f"Staged {rows} rows in {time.perf_counter() - start:.1f}s")
+    rebuild.set_logged(conn, collections)
+    rebuild.build_indexes(conn, collections, work_mem=REEMBED_MAINTENANCE_WORK_MEM, dim=dim)
+    conn.execute(f"ANALYZE {rebuild.STAGING_SCHEMA}.doc_chunks")
+    conn.commit()
+    return generation
+
+
+def swap(conn, provider):
+    """Stages the re-embedded table, then swaps it in. doc_chunks is only locked for the swap itself."""
+    registered = [r[0] for r in conn.execute("SELECT name FROM collections")]
+    collections = sorted({DEFAULT_COLLECTION, *registered})
+    conn.commit()
+    generation = stage(conn, provider, collections)
+    seconds = rebuild.swap(conn, collections, generation=generation)
+    conn.execute("DROP TABLE reembed_vectors")
+    conn.commit()
+    logger.info(f"doc_chunks now holds {provider.name} vectors ({provider.dimension} dims), "
+                f"locked for {seconds:.3f}s by the swap")
+
+
+def reembed(provider_name: str = EMBEDDING_PROVIDER, embed_only: bool = False, batch: int = REEMBED_BATCH):
+    provider = build_provider(provider_name)
+    scheduler = make_scheduler(provider)
+    try:
+        with get_pool().connection() as conn:
+            prepare(conn, provider.name)
+            stats = embed_missing(conn, provider, scheduler, batch)
+            if not embed_only:
+                swap(conn, provider)
+    finally:
+        scheduler.close()
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild doc_chunks.embedding with another embedding provider.")
+    parser.add_argument("--provider", default=EMBEDDING_PROVIDER, help="voyage or local (default EMBEDDING_PROVIDER)")
+    parser.add_argument("--batch", type=int, default=REEMBED_BATCH, help="rows per committed batch")
+    parser.add_argument("--embed-only", action="store_true", help="fill the side table but leave doc_chunks alone")
+    args = parser.parse_args()
+    reembed(args.provider, args.embed_only, args.batch)
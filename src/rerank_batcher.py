@@ -0,0 +1,172 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from src import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Pairs per merged batch, several requests' worth; the reranker still splits it into length buckets
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "128"))
+# How long the first request of a batch waits for company
+RERANK_MAX_WAIT_MS = float(os.getenv("RERANK_MAX_WAIT_MS", "5"))
+# Backpressure: queued pairs allowed before submit blocks, and how long it blocks before giving up
+RERANK_MAX_QUEUE = int(os.getenv("RERANK_MAX_QUEUE", "1024"))
+RERANK_ENQUEUE_TIMEOUT = float(os.getenv("RERANK_ENQUEUE_TIMEOUT", "5"))
+_CLOSE = object()
+
+
+class RerankOverloaded(Exception):
+    """Raised when the rerank queue stays full for longer than the enqueue timeout."""
+
+
+class RerankBatcher:
+    """
+    Shared cross-encoder worker. Concurrent requests submit their (query, text) pairs; one
+    dispatcher thread merges whole requests into a batch of up to `max_batch` pairs, waiting at
+    most `max_wait` after the first one, runs `predict_fn` once and hands each request its slice.
+    A request bigger than `max_batch` runs on its own rather than being split.
+    """
+    def __init__(self, predict_fn, max_batch: int = RERANK_MAX_BATCH, max_wait: float = RERANK_MAX_WAIT_MS / 1000,
+                 max_queue: int = RERANK_MAX_QUEUE, enqueue_timeout: float = RERANK_ENQUEUE_TIMEOUT):
+        if max_batch <= 0:
+            raise ValueError("Batch size must be greater than 0.")
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max(max_queue, max_batch)
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue()
+        self._pending = None
+        self._space = threading.Condition()
+        self.queued_pairs = 0
+        self._closed = False
+        self._fills = deque(maxlen=1000)
+        self.stats = {"requests": 0, "pairs": 0, "batches": 0, "rejected": 0, "failed": 0,
+                      "max_queue_depth": 0, "queue_wait_ms": 0.0}
+        self._stats_lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="rerank-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, pairs) -> Future:
+        """Queues one request's pairs, the Future resolves to their scores in order."""
+        if self._closed:
+            raise RuntimeError("Rerank batcher is closed.")
+        pairs = list(pairs)
+        future = Future()
+        if not pairs:
+            future.set_result([])
+            return future
+        # A request larger than the whole queue would never fit, it only has to wait for an empty one
+        need = min(len(pairs), self.max_queue)
+        with self._space:
+            if not self._space.wait_for(lambda: self.queued_pairs + need <= self.max_queue, self.enqueue_timeout):
+                self._count("rejected")
+                raise RerankOverloaded(f"Rerank queue full ({self.queued_pairs} pairs waiting)")
+            self.queued_pairs += len(pairs)
+            depth = self.queued_pairs
+        with self._stats_lock:
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+        self._queue.put((pairs, future, time.perf_counter()))
+        return future
+
+    def predict(self, pairs) -> list:
+        """Blocking helper: scores `pairs` in whatever batch they land in."""
+        return self.submit(pairs).result()
+
+    def _release(self, count: int):
+        with self._space:
+            self.queued_pairs -= count
+            self._space.notify_all()
+
+    def _next_item(self, timeout: float = None):
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _take_batch(self):
+        """Packs whole requests until max_batch pairs or max_wait passed. Returns None once closed."""
+        batch, size, deadline = [], 0, None
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                item = self._next_item(timeout=timeout)
+            except queue.Empty:
+                return batch
+            if item is _CLOSE:
+                if batch:
+                    self._pending = item
+                    return batch
+                return None
+            pairs, future, _ = item
+            if batch and size + len(pairs) > self.max_batch:
+                self._pending = item
+                return batch
+            if not future.set_running_or_notify_cancel():
+                self._release(len(pairs))
+                continue
+            batch.append(item)
+            size += len(pairs)
+            if size >= self.max_batch:
+                return batch
+            if deadline is None:
+                deadline = time.perf_counter() + self.max_wait
+
+    def _dispatch(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        pairs = [pair for request, _, _ in batch for pair in request]
+        started = time.perf_counter()
+        self._release(len(pairs))
+        try:
+            with telemetry.span("rerank.batch", requests=len(batch), pairs=len(pairs),
+                                fill=round(min(1.0, len(pairs) / self.max_batch), 3)):
+                scores = list(self.predict_fn(pairs))
+        except Exception as e:
+            self._count("failed", len(batch))
+            logger.error(f"Rerank batch of {len(pairs)} pairs failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for request, future, _ in batch:
+            future.set_result(scores[offset:offset + len(request)])
+            offset += len(request)
+        with self._stats_lock:
+            self.stats["requests"] += len(batch)
+            self.stats["pairs"] += len(pairs)
+            self.stats["batches"] += 1
+            self.stats["queue_wait_ms"] += sum((started - queued) * 1000 for _, _, queued in batch)
+            self._fills.append(min(1.0, len(pairs) / self.max_batch))
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def metrics(self) -> dict:
+        """Snapshot for dashboards: current queue depth, batch fill and per-request queue wait."""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            fills = list(self._fills)
+        requests = stats["requests"] or 1
+        stats["queue_depth"] = self.queued_pairs
+        stats["batch_fill"] = sum(fills) / len(fills) if fills else 0.0
+        stats["pairs_per_batch"] = stats["pairs"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_queue_wait_ms"] = stats.pop("queue_wait_ms") / requests
+        return stats
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._dispatcher.join()
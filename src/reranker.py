@@ -0,0 +1,216 @@
+import os
+import logging
+import importlib.util
+import threading
+from collections import OrderedDict, deque
+import xxhash
+from src.embeddings import device_setting, threads_setting, place_model
+from src.rerank_batcher import RerankBatcher
+
+logger = logging.getLogger(__name__)
+
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANKER_DEVICE = device_setting("RERANKER")
+# torch | quantized (int8 dynamic, CPU only) | onnx (needs optimum[onnxruntime]) | auto
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "auto")
+RERANKER_THREADS = threads_setting("RERANKER")
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "32"))
+# Rough token budget per forward pass; long chunks get smaller batches so padding doesn't blow up
+RERANKER_BATCH_TOKENS = int(os.getenv("RERANKER_BATCH_TOKENS", "4096"))
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_TOP_K = 10
+# Merge concurrent requests into shared cross-encoder batches (src/rerank_batcher.py)
+RERANK_MICROBATCH = os.getenv("RERANK_MICROBATCH", "1") == "1"
+
+
+def load_cross_encoder(model_name: str = RERANKER_MODEL, device: str = RERANKER_DEVICE,
+                       backend: str = RERANKER_BACKEND, threads: int = RERANKER_THREADS,
+                       max_length: int = RERANKER_MAX_LENGTH):
+    """Returns (model, device, backend) with the backend that actually got loaded."""
+    import torch
+    from sentence_transformers import CrossEncoder
+    device = place_model(device, threads)
+    if backend == "auto":
+        backend = "quantized" if device == "cpu" else "torch"
+    if backend == "onnx":
+        if all(importlib.util.find_spec(m) for m in ("onnxruntime", "optimum")):
+            model = CrossEncoder(model_name, device=device, backend="onnx", max_length=max_length)
+            logger.info(f"Reranker {model_name} loaded on {device} (onnx)")
+            return model, device, backend
+        logger.warning("ONNX backend needs optimum[onnxruntime], falling back to torch")
+        backend = "quantized" if device == "cpu" else "torch"
+    model = CrossEncoder(model_name, device=device, max_length=max_length)
+    if backend == "quantized":
+        if device != "cpu":
+            logger.warning(f"Int8 dynamic quantization only runs on CPU, keeping fp32 on {device}")
+            backend = "torch"
+        else:
+            # Linear layers are nearly all of a MiniLM forward pass; int8 weights roughly halve CPU latency
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    logger.info(f"Reranker {model_name} loaded on {device} ({backend})")
+    return model, device, backend
+
+
+def length_buckets(lengths, max_batch: int = RERANKER_BATCH_SIZE, max_tokens: int = RERANKER_BATCH_TOKENS):
+    """
+    Groups indices into batches of similar length: sorted longest first, each batch capped at
+    max_batch pairs and max_tokens (padded) tokens, so short pairs run in wide batches.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches, batch = [], []
+    for i in order:
+        # The first pair of a batch is its longest, so it sets the padded width
+        width = lengths[batch[0]] if batch else lengths[i]
+        if batch and (len(batch) >= max_batch or width * (len(batch) + 1) > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class ScoreCache:
+    """LRU of cross-encoder scores keyed by (query hash, chunk id)."""
+    def __init__(self, max_entries: int = RERANK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            score = self._entries.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key, score: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Reranker:
+    """
+    Cross-encoder scoring with per-(query, chunk) score caching and length-bucketed batches.
+    `model` can be anything with predict(pairs, batch_size=...); by default one is loaded for
+    the best available device.
+    Candidates are retrieval rows, (content, filename, page_number, score, id).
+    With batching on, cache misses from concurrent callers are scored together by one RerankBatcher.
+    """
+    def __init__(self, model=None, model_name: str = RERANKER_MODEL, device: str = RERANKER_DEVICE,
+                 backend: str = RERANKER_BACKEND, threads: int = RERANKER_THREADS,
+                 batch_size: int = RERANKER_BATCH_SIZE, batch_tokens: int = RERANKER_BATCH_TOKENS,
+                 cache_size: int = RERANK_CACHE_SIZE, batching: bool = RERANK_MICROBATCH):
+        if model is None:
+            model, device, backend = load_cross_encoder(model_name, device, backend, threads)
+        self.model = model
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.cache = ScoreCache(cache_size)
+        self.pairs_scored = 0
+        self.batcher = RerankBatcher(self.predict) if batching else None
+
+    def query_key(self, query: str) -> str:
+        return xxhash.xxh3_64_hexdigest(f"{self.model_name}|{query}".encode("utf-8"))
+
+    @staticmethod
+    def estimate_tokens(query: str, text: str) -> int:
+        return min(RERANKER_MAX_LENGTH, (len(query) + len(text)) // 4 + 3)
+
+    def predict(self, pairs) -> list:
+        """Scores pairs in length buckets and returns them in input order."""
+        scores = [0.0] * len(pairs)
+        lengths = [self.estimate_tokens(q, t) for q, t in pairs]
+        for batch in length_buckets(lengths, self.batch_size, self.batch_tokens):
+            out = self.model.predict([pairs[i] for i in batch], batch_size=len(batch))
+            for i, score in zip(batch, out):
+                scores[i] = float(score)
+        self.pairs_scored += len(pairs)
+        return scores
+
+    def score(self, query: str, candidates) -> list:
+        return self.score_many([query], [candidates])[0]
+
+    def score_many(self, queries, candidate_lists) -> list:
+        """Scores for several queries at once: every uncached pair goes through one predict call."""
+        keys = [self.query_key(q) for q in queries]
+        scores = [[self.cache.get((k, c[4])) for c in candidates] for k, candidates in zip(keys, candidate_lists)]
+        #A question asked twice in one batch is scored once
+        todo = {}
+        for q, row in enumerate(scores):
+            for i, s in enumerate(row):
+                if s is None:
+                    todo.setdefault((keys[q], candidate_lists[q][i][4]), (q, i))
+        if todo:
+            pairs = [(queries[q], candidate_lists[q][i][0]) for q, i in todo.values()]
+            if self.batcher and len(queries) > 1:
+                # A bulk job goes through in max_batch slices, so live requests still get batches in between.
+                # Only half the queue's worth is in flight at once: submitting every slice up front would
+                # fill the queue and turn a big job (or the live requests behind it) into RerankOverloaded.
+                step = self.batcher.max_batch
+                window = max(1, self.batcher.max_queue // step // 2)
+                in_flight, fresh = deque(), []
+                for i in range(0, len(pairs), step):
+                    if len(in_flight) >= window:
+                        fresh.extend(in_flight.popleft().result())
+                    in_flight.append(self.batcher.submit(pairs[i:i + step]))
+                while in_flight:
+                    fresh.extend(in_flight.popleft().result())
+            else:
+                fresh = self.batcher.predict(pairs) if self.batcher else self.predict(pairs)
+            fresh = dict(zip(todo, fresh))
+            for q, row in enumerate(scores):
+                for i, s in enumerate(row):
+                    if s is None:
+                        row[i] = fresh[(keys[q], candidate_lists[q][i][4])]
+            for key, s in fresh.items():
+                self.cache.put(key, s)
+        return scores
+
+    @staticmethod
+    def _top(candidates, scores, top_k: int):
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_k]]
+
+    def rerank(self, query: str, candidates, top_k: int = RERANK_TOP_K):
+        if not candidates:
+            return []
+        return self._top(candidates, self.score(query, candidates), top_k)
+
+    def rerank_many(self, queries, candidate_lists, top_k: int = RERANK_TOP_K) -> list:
+        scores = self.score_many(queries, candidate_lists)
+        return [self._top(c, s, top_k) for c, s in zip(candidate_lists, scores)]
+
+    @property
+    def stats(self) -> dict:
+        stats = {"device": self.device, "backend": self.backend, "pairs_scored": self.pairs_scored,
+                 "cache_hits": self.cache.hits, "cache_misses": self.cache.misses, "cache_entries": len(self.cache)}
+        if self.batcher:
+            stats["batcher"] = self.batcher.metrics()
+        return stats
+
+    def close(self):
+        if self.batcher:
+            self.batcher.close()
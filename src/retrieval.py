@@ -0,0 +1,289 @@
+import os
+import logging
+from functools import lru_cache
+from dataclasses import dataclass, field
+import numpy as np
+from src.pool import get_pool, get_async_pool
+
+logger = logging.getLogger(__name__)
+
+# full: HNSW on the float32 column. halfvec / binary: a much smaller HNSW index on a quantized
+# expression of the same column finds rescore_k candidates, which are re-ranked by exact distance
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+
+# {vector} / {text} are the query's vector and text: a parameter, or a column of the batch query below
+ANN_SQL = """
+        SELECT id, embedding <=> {vector}::vector AS distance
+        FROM doc_chunks{where}
+        ORDER BY embedding <=> {vector}::vector
+        LIMIT %(k_ann)s"""
+
+RESCORE_SQL = """
+        SELECT id, embedding <=> {vector}::vector AS distance
+        FROM (
+            SELECT id, embedding FROM doc_chunks{where}
+            ORDER BY {column} {operator} {query}
+            LIMIT %(k_rescore)s
+        ) coarse
+        ORDER BY distance
+        LIMIT %(k_ann)s"""
+
+# storage: (indexed expression, query expression, distance operator, operator class); {dim} is the vector size
+COMPACT_STORAGE = {
+    "halfvec": ("(embedding::halfvec({dim}))", "{vector}::halfvec({dim})", "<=>", "halfvec_cosine_ops"),
+    "binary": ("(binary_quantize(embedding)::bit({dim}))", "binary_quantize({vector}::vector)::bit({dim})",
+               "<~>", "bit_hamming_ops"),
+}
+
+BM25_SQL = """
+        SELECT id, paradedb.score(id) AS score
+        FROM doc_chunks
+        WHERE id @@@ paradedb.match('content', {text}){filter}
+        ORDER BY score DESC
+        LIMIT %(k_bm25)s"""
+
+# Both legs are separate ORDER BY ... LIMIT scans so each one can use its own index
+# (bm25 on content, hnsw on embedding). Fusion happens in Python on the returned ranks.
+CANDIDATES_TEMPLATE = """
+    WITH bm25 AS ({bm25}
+    ), ann AS ({ann}
+    ), ranked AS (
+        SELECT id, 'bm25' AS leg, row_number() OVER (ORDER BY score DESC) AS rank, score FROM bm25
+        UNION ALL
+        SELECT id, 'ann' AS leg, row_number() OVER (ORDER BY distance) AS rank, 1.0 - distance AS score FROM ann
+    )
+    SELECT r.id, r.leg, r.rank, r.score, c.content, c.filename, c.page_number
+    FROM ranked r
+    JOIN doc_chunks c ON c.id = r.id{join_filter}
+    """
+
+# Many questions in one round trip: the same two legs run once per row of the unnested arrays.
+# Rows come back tagged with the 1-based position of their question.
+BATCH_CANDIDATES_TEMPLATE = """
+    SELECT q.qid, r.id, r.leg, r.rank, r.score, c.content, c.filename, c.page_number
+    FROM unnest(%(queries)s::text[], %(vectors)s::vector[]) WITH ORDINALITY AS q(query, vector, qid)
+    CROSS JOIN LATERAL (
+        SELECT id, 'bm25' AS leg, row_number() OVER (ORDER BY score DESC) AS rank, score FROM ({bm25}
+        ) bm25
+        UNION ALL
+        SELECT id, 'ann' AS leg, row_number() OVER (ORDER BY distance) AS rank, 1.0 - distance AS score FROM ({ann}
+        ) ann
+    ) r
+    JOIN doc_chunks c ON c.id = r.id{join_filter}
+    ORDER BY q.qid
+    """
+
+# Optional scope of a search. Each leg and the final join repeat the filter, so on the partitioned
+# doc_chunks (one partition per collection, see src/collection.py) the planner prunes down to the
+# named collections' partitions and their indexes instead of scanning every one.
+# A files filter is applied after the HNSW scan, a very selective one can leave the ANN leg short.
+FILTERS = {
+    "collections": "{alias}collection = ANY(%(collections)s)",
+    "files": "{alias}filename = ANY(%(files)s)",
+}
+
+
+
+def filter_sql(filters=(), alias: str = "", keyword: str = " WHERE ") -> str:
+    if not filters:
+        return ""
+    return keyword + " AND ".join(FILTERS[name].format(alias=alias) for name in filters)
+
+
+def bm25_sql(filters=(), text: str = "%(query)s") -> str:
+    return BM25_SQL.format(text=text, filter=filter_sql(filters, keyword=" AND "))
+
+
+def ann_sql(storage: str = "full", dim: int = None, filters=(), vector: str = "%(vector)s") -> str:
+    where = filter_sql(filters)
+    if storage == "full":
+        return ANN_SQL.format(where=where, vector=vector)
+    if storage not in COMPACT_STORAGE:
+        raise ValueError(f"Unknown vector storage: {storage} (expected full, halfvec or binary)")
+    column, query, operator, _ = COMPACT_STORAGE[storage]
+    # The expression has to match the index definition exactly, dimension included, for the planner to use it
+    return RESCORE_SQL.format(column=column.format(dim=int(dim)), operator=operator,
+                              query=query.format(dim=int(dim), vector=vector), where=where, vector=vector)
+
+
+def compact_index_sql(storage: str, dim: int, name: str = None, concurrently: bool = False,
+                      table: str = "doc_chunks", only: bool = False) -> str:
+    column, _, _, opclass = COMPACT_STORAGE[storage]
+    return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name or f'idx_embedding_{storage}'} "
+            f"ON {'ONLY ' if only else ''}{table} USING hnsw ({column.format(dim=int(dim))} {opclass}) "
+            f"WITH (m = 16, ef_construction = 64)")
+
+
+@lru_cache(maxsize=32)
+def candidates_sql(storage: str = "full", dim: int = None, filters: tuple = ()) -> str:
+    """filters: names from FILTERS, in that order, each bound as a text[] parameter of the same name."""
+    return CANDIDATES_TEMPLATE.format(ann=ann_sql(storage, dim, filters), bm25=bm25_sql(filters),
+                                      join_filter=filter_sql(filters, "c.", " AND "))
+
+
+@lru_cache(maxsize=32)
+def batch_candidates_sql(storage: str = "full", dim: int = None, filters: tuple = ()) -> str:
+    return BATCH_CANDIDATES_TEMPLATE.format(ann=ann_sql(storage, dim, filters, "q.vector"),
+                                            bm25=bm25_sql(filters, "q.query"),
+                                            join_filter=filter_sql(filters, "c.", " AND "))
+
+
+CANDIDATES_SQL = candidates_sql()
+
+SETTINGS_SQL = "SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true)"
+
+
+@dataclass
+class RetrievalConfig:
+    k_bm25: int = int(os.getenv("RETRIEVAL_K_BM25", "50"))
+    k_ann: int = int(os.getenv("RETRIEVAL_K_ANN", "50"))
+    limit: int = int(os.getenv("RETRIEVAL_LIMIT", "20"))
+    ef_search: int = int(os.getenv("HNSW_EF_SEARCH", "80"))
+    # Only used when the embedding index is IVFFlat instead of HNSW
+    ivfflat_probes: int = int(os.getenv("IVFFLAT_PROBES", "10"))
+    # full | halfvec | binary, see VECTOR_STORAGE. Compact modes re-score rescore_k candidates exactly
+    storage: str = VECTOR_STORAGE
+    rescore_k: int = int(os.getenv("RETRIEVAL_RESCORE_K", "200"))
+    # "rrf" (reciprocal rank fusion) or "weighted" (normalized score blend)
+    fusion: str = os.getenv("RETRIEVAL_FUSION", "rrf")
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    weights: dict = field(default_factory=lambda: {
+        "bm25": float(os.getenv("RETRIEVAL_WEIGHT_BM25", "1.0")),
+        "ann": float(os.getenv("RETRIEVAL_WEIGHT_ANN", "1.0")),
+    })
+
+
+def reciprocal_rank_fusion(legs: dict, k: int = 60, weights: dict = None) -> dict:
+    """
+    legs: {"bm25": [(id, rank, score), ...], "ann": [...]}
+    Returns {id: fused_score}; a chunk found by both legs gets both contributions.
+    """
+    fused = {}
+    for leg, rows in legs.items():
+        w = (weights or {}).get(leg, 1.0)
+        for chunk_id, rank, _ in rows:
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + w / (k + rank)
+    return fused
+
+
+def weighted_fusion(legs: dict, weights: dict = None) -> dict:
+    """
+    Min-max normalizes each leg's raw scores to [0, 1] then blends them with the given weights.
+    BM25 scores are unbounded so they can't be added to cosine similarity directly.
+    """
+    fused = {}
+    for leg, rows in legs.items():
+        if not rows:
+            continue
+        w = (weights or {}).get(leg, 1.0)
+        scores = [s for _, _, s in rows]
+        lo, hi = min(scores), max(scores)
+        span = hi - lo
+        for chunk_id, _, score in rows:
+            norm = (score - lo) / span if span > 0 else 1.0
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + w * norm
+    return fused
+
+
+def fuse(rows, config: RetrievalConfig):
+    """
+    rows: (id, leg, rank, score, content, filename, page_number) as returned by CANDIDATES_SQL.
+    Returns (content, filename, page_number, fused_score, id) ordered best first.
+    """
+    legs = {"bm25": [], "ann": []}
+    docs = {}
+    for chunk_id, leg, rank, score, content, filename, page_number in rows:
+        legs[leg].append((chunk_id, rank, float(score)))
+        docs[chunk_id] = (content, filename, page_number)
+    if config.fusion == "weighted":
+        fused = weighted_fusion(legs, config.weights)
+    elif config.fusion == "rrf":
+        fused = reciprocal_rank_fusion(legs, config.rrf_k, config.weights)
+    else:
+        raise ValueError(f"Unknown fusion method: {config.fusion}")
+    best = sorted(fused.items(), key=lambda x: x[1], reverse=True)[:config.limit]
+    return [(*docs[chunk_id], score, chunk_id) for chunk_id, score in best]
+
+
+def _scope(collections=None, files=None):
+    """(filter names, their parameters) for an optional collections/files scope; empty lists count as unset."""
+    scope = {name: list(values) for name, values in (("collections", collections), ("files", files)) if values}
+    return tuple(scope), scope
+
+
+def _params(query_vector, query: str, config: RetrievalConfig, scope: dict = None):
+    return {
+        "query": query,
+        "vector": query_vector,
+        "k_bm25": config.k_bm25,
+        "k_ann": config.k_ann,
+        "k_rescore": max(config.rescore_k, config.k_ann),
+        **(scope or {}),
+    }
+
+
+def _settings(config: RetrievalConfig):
+    # An HNSW scan returns at most ef_search rows, the coarse pass needs rescore_k of them
+    ef_search = config.ef_search if config.storage == "full" else max(config.ef_search, config.rescore_k)
+    return str(ef_search), str(config.ivfflat_probes)
+
+
+def fetch_candidates(cur, query_vector, query: str, config: RetrievalConfig, collections=None, files=None):
+    filters, scope = _scope(collections, files)
+    # SET LOCAL only lasts for the current transaction, so pooled connections don't leak settings
+    cur.execute(SETTINGS_SQL, _settings(config), prepare=True)
+    # Scoped queries are planned with their actual collections: a generic prepared plan can't prune
+    # partitions on `= ANY($1)` and would scan every collection's indexes again
+    cur.execute(candidates_sql(config.storage, len(query_vector), filters), _params(query_vector, query, config, scope),
+                prepare=not filters)
+    return cur.fetchall()
+
+
+async def afetch_candidates(cur, query_vector, query: str, config: RetrievalConfig, collections=None, files=None):
+    filters, scope = _scope(collections, files)
+    await cur.execute(SETTINGS_SQL, _settings(config), prepare=True)
+    await cur.execute(candidates_sql(config.storage, len(query_vector), filters),
+                      _params(query_vector, query, config, scope), prepare=not filters)
+    return await cur.fetchall()
+
+
+def fetch_candidates_many(cur, query_vectors, queries, config: RetrievalConfig, collections=None, files=None):
+    """Candidate rows of many questions from one statement, as one list per question in input order."""
+    filters, scope = _scope(collections, files)
+    params = _params(None, None, config, scope)
+    params.update(queries=list(queries), vectors=[np.asarray(v, dtype=np.float32) for v in query_vectors])
+    cur.execute(SETTINGS_SQL, _settings(config), prepare=True)
+    cur.execute(batch_candidates_sql(config.storage, len(query_vectors[0]), filters), params, prepare=not filters)
+    grouped = [[] for _ in params["queries"]]
+    for qid, *row in cur.fetchall():
+        grouped[qid - 1].append(tuple(row))
+    return grouped
+
+
+def hybrid_search_many(query_vectors, queries, config: RetrievalConfig = None, collections=None, files=None):
+    """hybrid_search for a list of questions sharing one scope, in a single round trip."""
+    config = config or RetrievalConfig()
+    if not queries:
+        return []
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            grouped = fetch_candidates_many(cur, query_vectors, queries, config, collections, files)
+    return [fuse(rows, config) for rows in grouped]
+
+
+def hybrid_search(query_vector, query: str, config: RetrievalConfig = None, collections=None, files=None):
+    """collections / files optionally restrict the search to those collections and filenames."""
+    config = config or RetrievalConfig()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            rows = fetch_candidates(cur, query_vector, query, config, collections, files)
+    return fuse(rows, config)
+
+
+async def ahybrid_search(query_vector, query: str, config: RetrievalConfig = None, collections=None, files=None):
+    config = config or RetrievalConfig()
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            rows = await afetch_candidates(cur, query_vector, query, config, collections, files)
+    return fuse(rows, config)
@@ -1,14 +1,13 @@
-
 from dotenv import load_dotenv
-from sentence_transformers import CrossEncoder
 import chainlit as cl
 import logging
 from pathlib import Path
-from src.db import embed_text
-from RAGService import RagService
+from src.RAGService import get_rag_service
+from src.ingest_daemon import status, format_status
 
 logger = logging.getLogger(__name__)
-rag_service = RagService()
+#Shared with app.py's warmup thread; nothing heavy happens here
+rag_service = get_rag_service()
 
 @cl.on_chat_start
 async def start():
@@ -16,20 +15,27 @@ async def start():
 
 @cl.on_message
 async def main(message: cl.Message):
+    #Per-file ingestion progress instead of an answer
+    if message.content.strip() == "/status":
+        try:
+            rows = await cl.make_async(status)()
+            await cl.Message(content=f"```\n{format_status(rows)}\n```").send()
+        except Exception as e:
+            await cl.Message(content=f"Could not read the ingestion status: {e}").send()
+        return
     msg = cl.Message(content="")
     await msg.send()
     try:
-        # Get RAG response and stream it back to the user if not empty
-        response = rag_service.get_response(message.content)
-        if isinstance(response, str):
-            msg.content = response 
-            await msg.update()               
-        else:
-            for token in response:
-                await msg.stream_token(token)
+        # Stream the RAG response without blocking the event loop for other users.
+        # Chainlit cancels this task on stop/disconnect, which closes the pipeline mid-stream.
+        async for token in rag_service.aget_response(message.content):
+            await msg.stream_token(token)
     except Exception as e:
         logger.error(f"Error in main loop: {e}")
         msg.content = f"An error occurred: {str(e)}"
         await msg.update()
     await msg.update()
-            
\ No newline at end of file
+
+@cl.on_stop
+async def stop():
+    logger.info("User stopped the current answer.")
@@ -0,0 +1,243 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# Off by default. When off, span() hands back one shared no-op object and OpenTelemetry is never imported
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "0") == "1"
+# otlp: traces and metrics to a collector over OTLP/HTTP (OTEL_EXPORTER_OTLP_ENDPOINT, default localhost:4318)
+# console: printed to stdout. local: only the in-process timings behind snapshot()
+TELEMETRY_EXPORTER = os.getenv("TELEMETRY_EXPORTER", "otlp")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "rag-chatbot")
+# Histogram bucket edges (ms): sub-ms cache hits up to multi-second generations
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Recent durations kept per stage for snapshot()
+LOCAL_WINDOW = 1024
+# Ending a stream early (user disconnect, cancelled task) is not an error
+_CANCELLED = (GeneratorExit, asyncio.CancelledError)
+
+
+def _attribute(value):
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        return self
+
+    def start(self):
+        return self
+
+    def end(self, exc: BaseException = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    One pipeline stage. Spans are never attached to the ambient context: children name their
+    parent explicitly, which keeps them correct across threads, generators and the event loop.
+    """
+    __slots__ = ("telemetry", "name", "parent", "attributes", "started", "_span")
+
+    def __init__(self, telemetry, name: str, parent=None, attributes: dict = None):
+        self.telemetry = telemetry
+        self.name = name
+        self.parent = parent
+        self.attributes = {k: v for k, v in (attributes or {}).items() if v is not None}
+        self.started = None
+        self._span = None
+
+    def set(self, **attributes):
+        attributes = {k: _attribute(v) for k, v in attributes.items() if v is not None}
+        self.attributes.update(attributes)
+        if self._span is not None:
+            self._span.set_attributes(attributes)
+        return self
+
+    def start(self):
+        if self.started is None:
+            self.started = time.perf_counter()
+            self._span = self.telemetry._start_span(self)
+        return self
+
+    def end(self, exc: BaseException = None):
+        if self.started is not None:
+            self.telemetry._finish(self, time.perf_counter() - self.started, exc)
+            self.started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc)
+        return False
+
+
+class Telemetry:
+    """
+    Spans and latency histograms for the query and ingest pipelines. Every finished span records
+    its duration in `rag.stage.duration` (attribute `stage`), observe() feeds other histograms
+    such as `rag.llm.ttft`. The exporters are built on the first span, not at import.
+    """
+    def __init__(self, enabled: bool = TELEMETRY_ENABLED, exporter: str = TELEMETRY_EXPORTER):
+        self.enabled = enabled
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self._ready = False
+        self._tracer = None
+        self._meter = None
+        self._providers = []
+        self._histograms = {}
+        self._durations = defaultdict(lambda: deque(maxlen=LOCAL_WINDOW))
+
+    def _setup(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if self.exporter != "local":
+                try:
+                    tracer_provider, meter_provider = build_providers(self.exporter)
+                    self._providers = [tracer_provider, meter_provider]
+                    self._tracer = tracer_provider.get_tracer(__name__)
+                    self._meter = meter_provider.get_meter(__name__)
+                except ImportError as e:
+                    logger.warning(f"OpenTelemetry is not installed ({e}), stage timings stay in process")
+            self._ready = True
+
+    def _histogram(self, name: str):
+        histogram = self._histograms.get(name)
+        if histogram is None and self._meter is not None:
+            with self._lock:
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._meter.create_histogram(
+                        f"rag.{name}", unit="ms", explicit_bucket_boundaries_advisory=LATENCY_BUCKETS_MS)
+                    self._histograms[name] = histogram
+        return histogram
+
+    def span(self, name: str, parent=None, **attributes):
+        if not self.enabled:
+            return NOOP
+        self._setup()
+        return Span(self, name, parent, attributes)
+
+    def _start_span(self, span: Span):
+        if self._tracer is None:
+            return None
+        from opentelemetry import trace
+        context = None
+        if isinstance(span.parent, Span) and span.parent._span is not None:
+            context = trace.set_span_in_context(span.parent._span)
+        return self._tracer.start_span(span.name, context=context,
+                                       attributes={k: _attribute(v) for k, v in span.attributes.items()})
+
+    def _finish(self, span: Span, seconds: float, exc: BaseException = None):
+        ms = seconds * 1000
+        failed = exc is not None and not isinstance(exc, _CANCELLED)
+        if exc is not None and not failed:
+            span.set(cancelled=True)
+        self._durations[span.name].append(ms)
+        histogram = self._histogram("stage.duration")
+        if histogram is not None:
+            histogram.record(ms, {"stage": span.name, "error": failed})
+        if span._span is not None:
+            if failed:
+                from opentelemetry.trace import Status, StatusCode
+                span._span.record_exception(exc)
+                span._span.set_status(Status(StatusCode.ERROR, str(exc)))
+            span._span.end()
+
+    def observe(self, name: str, ms: float, **attributes):
+        if not self.enabled:
+            return
+        self._setup()
+        self._durations[name].append(ms)
+        histogram = self._histogram(name)
+        if histogram is not None:
+            histogram.record(ms, {k: _attribute(v) for k, v in attributes.items()})
+
+    def snapshot(self) -> dict:
+        """Recent per-stage latencies: {stage: {count, p50_ms, p95_ms, max_ms}}."""
+        result = {}
+        for name, durations in list(self._durations.items()):
+            values = sorted(durations)
+            if values:
+                result[name] = {"count": len(values), "p50_ms": values[len(values) // 2],
+                                "p95_ms": values[min(len(values) - 1, int(0.95 * len(values)))], "max_ms": values[-1]}
+        return result
+
+    def shutdown(self):
+        """Flushes and stops the exporters."""
+        for provider in self._providers:
+            provider.shutdown()
+        self._providers = []
+
+
+def build_providers(exporter: str):
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader, ConsoleMetricExporter
+    if exporter == "console":
+        span_exporter, metric_exporter = ConsoleSpanExporter(), ConsoleMetricExporter()
+    else:
+        # Endpoint, headers and export interval come from the standard OTEL_* env vars
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+        span_exporter, metric_exporter = OTLPSpanExporter(), OTLPMetricExporter()
+    resource = Resource.create({"service.name": SERVICE_NAME})
+    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    meter_provider = MeterProvider(resource=resource, metric_readers=[PeriodicExportingMetricReader(metric_exporter)])
+    return tracer_provider, meter_provider
+
+
+_telemetry = Telemetry()
+
+
+def configure(enabled: bool = True, exporter: str = TELEMETRY_EXPORTER) -> Telemetry:
+    """Replaces the process wide instance, e.g. to turn telemetry on from code or in tests."""
+    global _telemetry
+    _telemetry.shutdown()
+    _telemetry = Telemetry(enabled, exporter)
+    return _telemetry
+
+
+def get_telemetry() -> Telemetry:
+    return _telemetry
+
+
+def span(name: str, parent=None, **attributes):
+    """Context manager timing one stage; `parent` is the enclosing stage's span."""
+    if not _telemetry.enabled:
+        return NOOP
+    return _telemetry.span(name, parent, **attributes)
+
+
+def observe(name: str, ms: float, **attributes):
+    if _telemetry.enabled:
+        _telemetry.observe(name, ms, **attributes)
+
+
+def snapshot() -> dict:
+    return _telemetry.snapshot()
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+import src.RAGService as rag
+from src.RAGService import RagService
+from src.embedding_cache import QueryEmbeddingCache
+from benchmarks.stub_ollama import StubOllama
+
+TOKENS = ["Use", " uuidv7()", " (Source:", " release.pdf,", " p. 9)"]
+CANDIDATES = [("uuidv7() generates timestamp-ordered UUIDs", "release.pdf", 9, 0.9, 1),
+              ("gen_random_uuid() returns a version 4 UUID", "func.pdf", 20, 0.5, 2)]
+
+
+class CountingModel:
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs, batch_size=32):
+        self.pairs += len(pairs)
+        return [float(len(text)) for _, text in pairs]
+
+
+def make_service(stub_url, monkeypatch, embed_calls, searches):
+    def embed(texts, is_query=False):
+        embed_calls.append(list(texts))
+        # One orthogonal direction per question, so the answer cache never mixes two of them up
+        return [np.eye(16, dtype=np.float32)[hash(t) % 16] for t in texts]
+
+    def search_many(vectors, queries, **scope):
+        searches.append((list(queries), scope))
+        return [[] if "nothing" in q else CANDIDATES for q in queries]
+
+    monkeypatch.setattr(rag, "embed_text", embed)
+    model = CountingModel()
+    service = RagService(ollama_base=stub_url, reranker=model)
+    service.embedding_cache = QueryEmbeddingCache(persistent=False)
+    service.search_database_many = search_many
+    service.router.route = lambda query: None
+    return service, model
+
+
+def test_answer_many_batches_each_stage(monkeypatch):
+    embed_calls, searches = [], []
+    queries = ["uuid v7?", "uuid ordering?", "nothing here", "uuid v7?"]
+    with StubOllama(tokens=TOKENS) as stub:
+        service, model = make_service(stub.url, monkeypatch, embed_calls, searches)
+        results = list(service.answer_many(queries, collections=["postgresql-18"]))
+        # Second run of the same questions is served from the answer cache without new work
+        again = list(service.answer_many(queries[:2], collections=["postgresql-18"]))
+        service.reranker.close()
+    assert embed_calls == [["uuid v7?", "uuid ordering?", "nothing here"]]
+    assert searches == [(queries, {"collections": ["postgresql-18"]})]
+    assert model.pairs == 2 * len(CANDIDATES)
+    by_index = {r["index"]: r for r in results}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[2]["answer"] is None and by_index[2]["context"] == []
+    assert by_index[0]["answer"] == "".join(TOKENS) and by_index[0]["context"]
+    assert all(r["cached"] and r["answer"] == "".join(TOKENS) for r in again)
+
+def test_answer_many_generates_concurrently(monkeypatch):
+    queries = [f"uuid question {i}" for i in range(4)]
+    with StubOllama(tokens=TOKENS, token_delay=0.05) as stub:
+        service, _ = make_service(stub.url, monkeypatch, [], [])
+        start = time.perf_counter()
+        results = list(service.answer_many(queries, concurrency=4))
+        elapsed = time.perf_counter() - start
+        service.reranker.close()
+    # One answer takes ~0.25s, four in a row would take ~1s
+    assert len(results) == 4 and all(r["error"] is None for r in results)
+    assert elapsed < 0.7
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import pytest
+from src.RAGService import RagService, StageTimeout
+from benchmarks.stub_ollama import StubOllama
+
+TOKENS = ["Use", " io_uring", " (Source:", " manual.pdf,", " p. 10)"]
+CANDIDATES = [("chunk text", "manual.pdf", 10, 0.9, 1)]
+
+
+class FakeReranker:
+    def predict(self, pairs, batch_size=32):
+        time.sleep(0.05)
+        return [1.0] * len(pairs)
+
+
+def make_service(stub_url):
+    service = RagService(ollama_base=stub_url, reranker=FakeReranker())
+    service.embedding_cache.get_or_embed = lambda query, embed_fn: [float(len(query))] * 8
+    # Every simulated user asks something different, the answer cache must not short circuit
+    service.answer_cache.threshold = 2.0
+
+    async def fake_search(query_vector, query):
+        await asyncio.sleep(0.02)
+        return CANDIDATES
+    service.asearch_database = fake_search
+    return service
+
+
+async def answer(service, query):
+    return "".join([t async for t in service.aget_response(query)])
+
+
+@pytest.mark.asyncio
+async def test_aget_response_streams_tokens():
+    with StubOllama(tokens=TOKENS) as stub:
+        service = make_service(stub.url)
+        assert await answer(service, "io method?") == "".join(TOKENS)
+        await service.aclose()
+
+@pytest.mark.asyncio
+async def test_concurrent_users_scale():
+    users = 8
+    with StubOllama(tokens=TOKENS, token_delay=0.05) as stub:
+        service = make_service(stub.url)
+        start = time.perf_counter()
+        await answer(service, "warm up")
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[answer(service, f"question {i}") for i in range(users)])
+        concurrent = time.perf_counter() - start
+        await service.aclose()
+
+    assert all(r == "".join(TOKENS) for r in results)
+    # Serial handling would take users * single; overlapping users should finish in a fraction of that
+    assert concurrent < single * users / 2
+
+@pytest.mark.asyncio
+async def test_event_loop_not_blocked():
+    with StubOllama(tokens=TOKENS, token_delay=0.05) as stub:
+        service = make_service(stub.url)
+        ticks = 0
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        beat = asyncio.create_task(heartbeat())
+        await answer(service, "anything")
+        beat.cancel()
+        await service.aclose()
+    # ~0.3s of work, a blocked loop would barely tick
+    assert ticks > 10
+
+@pytest.mark.asyncio
+async def test_cancellation_stops_stream():
+    with StubOllama(tokens=TOKENS * 20, token_delay=0.05) as stub:
+        service = make_service(stub.url)
+        received = []
+        async def consume():
+            async for token in service.aget_response("long answer"):
+                received.append(token)
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await service.aclose()
+    assert 0 < len(received) < len(TOKENS) * 20
+    assert service.answer_cache.stats()["stores"] == 0
+
+@pytest.mark.asyncio
+async def test_first_token_timeout(monkeypatch):
+    monkeypatch.setattr("src.RAGService.FIRST_TOKEN_TIMEOUT", 0.1)
+    with StubOllama(tokens=TOKENS, first_token_delay=0.5) as stub:
+        service = make_service(stub.url)
+        with pytest.raises(StageTimeout):
+            await answer(service, "slow model")
+        await service.aclose()
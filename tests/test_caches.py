@@ -0,0 +1,98 @@
+from collections import deque
+import numpy as np
+import pytest
+import src.db as db
+from src.answer_cache import SemanticAnswerCache
+
+
+def unit(seed, dim=16):
+    v = np.random.default_rng(seed).normal(size=dim)
+    return v / np.linalg.norm(v)
+
+
+def test_answer_cache_hits_near_duplicate():
+    cache = SemanticAnswerCache(threshold=0.95)
+    v = unit(0)
+    cache.store("q", v, ["Hello", " world"], ["ctx"], {"manual.pdf"}, cache.generation)
+
+    hit = cache.lookup(v + 0.001 * unit(1))
+    assert hit is not None
+    assert "".join(hit.replay()) == "Hello world"
+    assert hit.context == ["ctx"]
+    assert cache.lookup(unit(2)) is None
+
+def test_answer_cache_invalidated_by_cited_file():
+    cache = SemanticAnswerCache()
+    cache.store("q1", unit(0), ["a"], [], {"manual.pdf"}, cache.generation)
+    cache.store("q2", unit(1), ["b"], [], {"python.pdf"}, cache.generation)
+
+    cache.on_corpus_change("manual.pdf", "deleted")
+
+    assert cache.lookup(unit(0)) is None
+    assert cache.lookup(unit(1)) is not None
+
+def test_answer_cache_rejects_answer_generated_across_a_delete():
+    cache = SemanticAnswerCache()
+    generation = cache.generation
+    cache.on_corpus_change("manual.pdf", "deleted")
+
+    # Retrieved before the delete, so it may cite the deleted file
+    cache.store("q", unit(0), ["a"], [], {"manual.pdf"}, generation)
+    assert cache.stats()["size"] == 0
+
+def test_answer_cache_ingest_bumps_generation():
+    cache = SemanticAnswerCache()
+    generation = cache.generation
+    cache.store("q", unit(0), ["a"], [], {"manual.pdf"}, generation)
+    cache.on_corpus_change("new.pdf", "ingested")
+
+    assert cache.lookup(unit(0)) is None
+    # An answer generated before the change must not be stored afterwards
+    cache.store("q", unit(0), ["a"], [], {"manual.pdf"}, generation)
+    assert cache.stats()["size"] == 0
+
+def test_corpus_change_in_another_process_clears_answers(monkeypatch):
+    monkeypatch.setattr(db, "_corpus_listeners", [])
+    cache = SemanticAnswerCache()
+    db.on_corpus_change(cache.on_corpus_change)
+    reads = []
+    watcher = db.CorpusWatcher(interval=0, reader=lambda: reads.append(1) or [7, 7, 8][len(reads) - 1])
+    cache.store("q", unit(0), ["a"], [], {"manual.pdf"}, cache.generation)
+    # The first read only learns the current generation
+    assert not watcher.check() and not watcher.check()
+    assert cache.lookup(unit(0)) is not None
+    # e.g. a src.rebuild swap committed in between
+    assert watcher.check()
+    assert cache.lookup(unit(0)) is None and cache.stats()["size"] == 0
+    # Throttled: nothing is read again inside the interval
+    watcher.interval = 60
+    assert not watcher.check() and len(reads) == 3
+
+def test_corpus_watcher_skips_this_process_own_bumps(monkeypatch):
+    monkeypatch.setattr(db, "_corpus_listeners", [])
+    monkeypatch.setattr(db, "_own_generations", deque(maxlen=8))
+    heard = []
+    db.on_corpus_change(lambda filename, action: heard.append(action))
+    generation = [3]
+    watcher = db.CorpusWatcher(interval=0, reader=lambda: generation[0])
+    watcher.check()
+    # This process ingested two files, its listeners were told already
+    for g in (4, 5):
+        db.own_corpus_change(g)
+    generation[0] = 5
+    assert not watcher.check() and heard == []
+    # One of these two came from another process
+    db.own_corpus_change(6)
+    generation[0] = 7
+    assert watcher.check() and heard == ["changed"]
+
+def test_answer_cache_size_limit():
+    cache = SemanticAnswerCache(max_entries=2)
+    for i in range(3):
+        cache.store(f"q{i}", unit(i), ["a"], [], set(), cache.generation)
+    assert cache.stats()["size"] == 2
+    assert cache.lookup(unit(0)) is None
+
+def test_answer_cache_rejects_bad_size():
+    with pytest.raises(ValueError, match="Cache size must be greater than 0"):
+        SemanticAnswerCache(max_entries=0)
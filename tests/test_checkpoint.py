@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import pytest
+from src.checkpoint import CheckpointStore
+
+DIM = 8
+
+
+def plan(n):
+    return [(f"chunk {i}", i // 3 + 1) for i in range(n)]
+
+
+def batch(start, n):
+    return np.arange(start * DIM, (start + n) * DIM, dtype=np.float32).reshape(n, DIM)
+
+
+def test_append_and_resume(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    assert store.write_plan(plan(10)) == 10
+    store.append(batch(0, 4))
+    store.append(batch(4, 3))
+
+    reopened = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    assert reopened.total == 10
+    assert reopened.committed == 7
+    assert not reopened.complete
+    assert [t for t, _ in reopened.iter_plan(reopened.committed)] == [f"chunk {i}" for i in range(7, 10)]
+    np.testing.assert_array_equal(reopened.vectors(), batch(0, 7))
+
+def test_iter_rows_uses_memmap(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(5))
+    store.append(batch(0, 5))
+
+    rows = list(store.iter_rows())
+    assert store.complete
+    assert [(t, p) for t, p, _ in rows] == plan(5)
+    assert isinstance(store.vectors(), np.memmap)
+    np.testing.assert_array_equal(rows[3][2], batch(3, 1)[0])
+
+def test_torn_vector_write_is_truncated(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(10))
+    store.append(batch(0, 4))
+    # Crash after half of the next batch hit the disk but before its commit record
+    with open(store.vec_path, "ab") as f:
+        f.write(batch(4, 3).tobytes()[:50])
+
+    reopened = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    assert reopened.committed == 4
+    assert os.path.getsize(reopened.vec_path) == 4 * DIM * 4
+    reopened.append(batch(4, 6))
+    np.testing.assert_array_equal(reopened.vectors(), batch(0, 10))
+
+def test_torn_commit_record_is_dropped(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(10))
+    store.append(batch(0, 4))
+    store.append(batch(4, 2))
+    with open(store.log_path, "r+b") as f:
+        f.truncate(os.path.getsize(store.log_path) - 5)
+
+    reopened = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    assert reopened.committed == 4
+
+def test_corrupted_rows_fail_crc(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(10))
+    store.append(batch(0, 4))
+    store.append(batch(4, 2))
+    with open(store.vec_path, "r+b") as f:
+        f.seek(5 * DIM * 4)
+        f.write(b"\xff" * 4)
+
+    assert CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM).committed == 4
+
+def test_plan_without_meta_is_ignored(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(3))
+    os.remove(store.meta_path)
+    assert not CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM).has_plan()
+
+def test_rejects_wrong_shape(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(3))
+    with pytest.raises(ValueError, match="Expected vectors of shape"):
+        store.append(np.zeros((2, DIM + 1)))
+
+def test_remove(tmp_path):
+    store = CheckpointStore("manual.pdf", directory=tmp_path, dim=DIM)
+    store.write_plan(plan(3))
+    store.append(batch(0, 3))
+    store.remove()
+    assert os.listdir(tmp_path) == []
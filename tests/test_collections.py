@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from src.answer_cache import SemanticAnswerCache
+from src.collection import CollectionRouter, DEFAULT_COLLECTION, discover, normalize_name, partition_name
+from src.retrieval import candidates_sql, _scope
+
+
+def test_router_only_routes_to_a_single_match():
+    router = CollectionRouter(loader=lambda: {"default": [], "python-3.12": ["python", "py3"], "postgresql-18": []})
+    assert router.route("How does asyncio work in Python?") == ["python-3.12"]
+    assert router.route("autovacuum in PostgreSQL") == ["postgresql-18"]
+    assert router.route("python driver for postgresql") is None
+    # "default" has no keywords, and "pythonic" is not the word python
+    assert router.route("what is the default, pythonic way?") is None
+
+def test_router_survives_missing_collections_table():
+    def broken():
+        raise RuntimeError("relation collections does not exist")
+    assert CollectionRouter(loader=broken).route("python") is None
+
+def test_names_and_partitions(tmp_path):
+    assert normalize_name(" Python-3.12 ") == "python-3.12"
+    with pytest.raises(ValueError):
+        normalize_name("drop table; --")
+    assert partition_name("default") == "doc_chunks_default"
+    assert partition_name("python-3.12") != partition_name("python_3_12")
+    (tmp_path / "a.pdf").touch()
+    (tmp_path / "python-3.12").mkdir()
+    (tmp_path / "python-3.12" / "b.pdf").touch()
+    (tmp_path / "checkpoints").mkdir()
+    (tmp_path / "checkpoints" / "c.pdf").touch()
+    assert [(p.rsplit("/", 1)[-1], c) for p, c in discover(str(tmp_path))] == [("a.pdf", DEFAULT_COLLECTION),
+                                                                                ("b.pdf", "python-3.12")]
+
+def test_scope_filters_every_leg():
+    filters, params = _scope(["python-3.12"], [])
+    assert filters == ("collections",) and params == {"collections": ["python-3.12"]}
+    sql = candidates_sql("full", 384, filters)
+    # bm25 leg, ann leg and the join back to doc_chunks, so each one is pruned to the partition
+    assert sql.count("collection = ANY(%(collections)s)") == 3
+    assert "collection" not in candidates_sql("full", 384)
+
+def test_answer_cache_is_per_scope():
+    cache = SemanticAnswerCache()
+    vector = np.ones(4, dtype=np.float32)
+    cache.store("q", vector, ["a"], [], set(), cache.generation, scope=(("collections", ("python-3.12",)),))
+    assert cache.lookup(vector) is None
+    assert cache.lookup(vector, (("collections", ("python-3.12",)),)).tokens == ["a"]
@@ -0,0 +1,143 @@
+from concurrent.futures import Future
+from contextlib import nullcontext
+import numpy as np
+import xxhash
+import src.ingest as ingest
+import src.content_hash as content_hash
+from src.checkpoint import CheckpointStore
+from src.content_hash import hash_chunk, hash_file
+
+
+class RecordingScheduler:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, texts):
+        self.submitted.extend(texts)
+        futures = []
+        for text in texts:
+            f = Future()
+            f.set_result(np.full(4, len(text), dtype=np.float32))
+            futures.append(f)
+        return futures
+
+
+def test_hash_file_matches_one_shot_digest(tmp_path):
+    path = tmp_path / "doc.pdf"
+    data = bytes(range(256)) * 9000  # spans several read blocks
+    path.write_bytes(data)
+    assert hash_file(str(path)) == xxhash.xxh3_128_hexdigest(data)
+    assert hash_chunk("é") == xxhash.xxh3_128_hexdigest("é".encode("utf-8"))
+
+def test_window_only_embeds_unknown_chunks(monkeypatch):
+    known = {hash_chunk("old"): np.zeros(4, dtype=np.float32)}
+    monkeypatch.setattr(ingest, "lookup_embeddings", lambda hashes: {h: known[h] for h in hashes if h in known})
+    scheduler = RecordingScheduler()
+    pending = {}
+    window = [("old", 1), ("new", 1), ("new", 2), ("other", 2)]
+    _, hashes, sources, missing = ingest.prepareWindow(window, scheduler, pending)
+    assert scheduler.submitted == ["new", "other"]
+    assert missing == [hash_chunk("new"), hash_chunk("other")]
+    assert sources[1] is sources[2]
+    # A chunk still being embedded for an earlier window is shared, not submitted again
+    _, _, later, later_missing = ingest.prepareWindow([("other", 3)], scheduler, pending)
+    assert scheduler.submitted == ["new", "other"]
+    assert later_missing == [] and later[0] is pending[hash_chunk("other")]
+
+def test_commit_window_saves_new_embeddings(monkeypatch, tmp_path):
+    saved = []
+    monkeypatch.setattr(ingest, "lookup_embeddings", lambda hashes: {})
+    monkeypatch.setattr(ingest, "save_embeddings", lambda pairs: saved.extend(pairs))
+    store = CheckpointStore("a.pdf", directory=tmp_path, dim=4)
+    store.write_plan([("x", 1), ("x", 1), ("yy", 2)], source_hash="abc")
+    pending = {}
+    prepared = ingest.prepareWindow(list(store.iter_plan()), RecordingScheduler(), pending)
+    assert ingest.commitWindow(store, None, prepared, pending, progressive=False) == 2
+    assert [h for h, _ in saved] == [hash_chunk("x"), hash_chunk("yy")]
+    assert pending == {}
+    assert store.vectors()[:, 0].tolist() == [1, 1, 2]
+    assert CheckpointStore("a.pdf", directory=tmp_path, dim=4).source_hash == "abc"
+
+class RecordingLoader:
+    def __init__(self, filename, **kwargs):
+        self.written, self.replaced = [], []
+
+    def loaded_rows(self):
+        return 0
+
+    def write_rows(self, rows):
+        self.written.extend(rows)
+
+    def replace_rows(self, rows):
+        self.replaced.extend(rows)
+
+def test_rows_of_an_unfinished_ingest_are_replaced(monkeypatch, tmp_path):
+    class Provider:
+        name, dimension = "stub", 4
+    loaders, marked = [], []
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF")
+    monkeypatch.setattr(ingest, "CHECKPOINT_DIR", str(tmp_path))
+    monkeypatch.setattr(ingest, "CheckpointStore", lambda name, **kw: CheckpointStore(name, directory=tmp_path, **kw))
+    monkeypatch.setattr(ingest, "get_provider", lambda: Provider())
+    monkeypatch.setattr(ingest, "iterPagesFromPDF", lambda path: iter([(1, "x" * 1500)]))
+    monkeypatch.setattr(ingest, "StreamingLoader", lambda *a, **kw: loaders.append(RecordingLoader(*a, **kw)) or loaders[-1])
+    monkeypatch.setattr(ingest, "lookup_embeddings", lambda hashes: {})
+    monkeypatch.setattr(ingest, "save_embeddings", lambda pairs: list(pairs))
+    monkeypatch.setattr(ingest, "notify_corpus_change", lambda *a: None)
+    monkeypatch.setattr(ingest, "mark_complete", lambda *a: marked.append(a))
+    # Five rows at this hash but no checkpoint and no completion record: a load that crashed
+    monkeypatch.setattr(ingest, "file_versions", lambda *a: (5, 0))
+    monkeypatch.setattr(ingest, "completed_chunks", lambda *a: None)
+    result = ingest._ingestPdf(str(path), RecordingScheduler(), None)
+    assert result["status"] == "replaced" and result["chunks"] == 2
+    assert len(loaders[0].replaced) == 2 and loaders[0].written == []
+    assert marked == [("a.pdf", hash_file(str(path)), "default", 2)]
+    # Once the finished count is recorded, the same rows are skipped
+    monkeypatch.setattr(ingest, "completed_chunks", lambda *a: 5)
+    assert ingest._ingestPdf(str(path), RecordingScheduler(), None)["status"] == "unchanged"
+
+def test_backfill_records_stamped_files_as_complete(monkeypatch, tmp_path):
+    class Result:
+        def __init__(self, rowcount=0):
+            self.rowcount = rowcount
+
+    class Cursor:
+        def __init__(self, rows=()):
+            self.rows = list(rows)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def execute(self, query, params=None):
+            pass
+
+        def fetchmany(self, size):
+            rows, self.rows = self.rows, []
+            return rows
+
+        def executemany(self, query, params):
+            pass
+
+    class Conn:
+        def __init__(self):
+            self.statements = []
+
+        def cursor(self, name=None):
+            return Cursor([(1, "text")] if name else [])
+
+        def execute(self, query, params=None):
+            self.statements.append((" ".join(query.split()), params))
+            # Only old.pdf has rows without a file_hash
+            return Result(3 if query.startswith("UPDATE") and params[1] == "old.pdf" else 0)
+
+    conn = Conn()
+    monkeypatch.setattr(content_hash, "get_pool", lambda: type("Pool", (), {"connection": lambda _: nullcontext(conn)})())
+    (tmp_path / "old.pdf").write_bytes(b"%PDF old")
+    (tmp_path / "new.pdf").write_bytes(b"%PDF new")
+    content_hash.backfill(str(tmp_path))
+    recorded = [params for query, params in conn.statements if query.startswith("INSERT INTO ingested_files")]
+    assert recorded == [("old.pdf", hash_file(str(tmp_path / "old.pdf")))]
@@ -0,0 +1,61 @@
+import pytest
+from src.context_packer import ContextPacker, estimate_tokens, merge_overlap
+from src.ingest import getChunks
+
+PAGE = " ".join(f"Sentence {i} explains how checkpoint_timeout interacts with max_wal_size." for i in range(60))
+
+
+def rows_for(chunks, filename="manual.pdf", page=3, first_id=1):
+    return [(c, filename, page, 0.0, first_id + i) for i, c in enumerate(chunks)]
+
+
+def test_overlapping_chunks_are_stitched_back_together():
+    chunks = getChunks(PAGE)
+    assert len(chunks) >= 4
+    # Rerank order is not document order
+    ranked = rows_for(chunks)[::-1]
+    packed = ContextPacker(token_budget=100000).pack(ranked)
+    assert packed.chunks == [PAGE]
+    assert packed.blocks[0].sources == [("manual.pdf", 3)]
+    assert sorted(packed.blocks[0].ids) == list(range(1, len(chunks) + 1))
+    assert packed.tokens_saved > 0
+    assert packed.text.startswith("Source: manual.pdf p.3\nContent: Sentence 0")
+
+def test_gap_between_chunks_keeps_both_passages():
+    chunks = getChunks(PAGE)
+    packed = ContextPacker(token_budget=100000).pack(rows_for([chunks[0], chunks[2]]))
+    assert packed.chunks == [chunks[0], chunks[2]]
+
+def test_same_text_elsewhere_is_cited_not_repeated():
+    text = getChunks(PAGE)[1]
+    rows = [(text, "a.pdf", 10, 0.0, 1),
+            ("Completely different passage about autovacuum workers and their naptime.", "a.pdf", 11, 0.0, 2),
+            (text.replace("Sentence", "sentence"), "b.pdf", 55, 0.0, 3)]
+    packed = ContextPacker(token_budget=100000).pack(rows)
+    assert len(packed.blocks) == 2
+    assert packed.blocks[0].sources == [("a.pdf", 10), ("b.pdf", 55)]
+    assert "Source: a.pdf p.10; b.pdf p.55" in packed.text
+    assert packed.files == {"a.pdf", "b.pdf"}
+
+def test_budget_is_filled_in_rerank_order():
+    rows = [(f"passage {i} " + "x" * 600, f"f{i}.pdf", 1, 0.0, i) for i in range(10)]
+    packer = ContextPacker(token_budget=700)
+    packed = packer.pack(rows)
+    assert packed.tokens <= 700
+    assert [b.sources[0][0] for b in packed.blocks] == ["f0.pdf", "f1.pdf", "f2.pdf"]
+    assert packed.dropped == 7
+
+def test_top_passage_is_truncated_rather_than_dropped():
+    packed = ContextPacker(token_budget=50).pack([("y" * 3000, "big.pdf", 2, 0.0, 1)])
+    assert len(packed.blocks) == 1 and packed.tokens <= 50
+    assert packed.blocks[0].sources == [("big.pdf", 2)]
+
+def test_merge_overlap_edges():
+    assert merge_overlap("abc" * 20, "abc" * 5) == "abc" * 20
+    assert merge_overlap("short", "other") is None
+    head, tail = "a" * 30 + "OVERLAP-SECTION-XYZ-1234", "OVERLAP-SECTION-XYZ-1234" + "b" * 30
+    assert merge_overlap(head, tail) == "a" * 30 + "OVERLAP-SECTION-XYZ-1234" + "b" * 30
+    assert ContextPacker().pack([]).text == ""
+    with pytest.raises(ValueError):
+        ContextPacker(token_budget=0)
+    assert estimate_tokens("abcdef") == 3
@@ -0,0 +1,155 @@
+import time
+import threading
+from collections import deque
+import pytest
+from src.embed_scheduler import EmbeddingScheduler, TokenBucket, estimate_tokens
+
+
+class RateLimited(Exception):
+    http_status = 429
+
+
+class BadRequest(Exception):
+    http_status = 400
+
+
+class FakeEmbeddingEndpoint:
+    """
+    Local stand-in for the embedding API. Rejects calls with a 429 once more than
+    `max_requests` requests or `max_tokens` tokens land inside a rolling `window` seconds.
+    Vectors encode the text so tests can check every future got its own result.
+    """
+    def __init__(self, max_requests: int, max_tokens: int = 10**9, window: float = 1.0, latency: float = 0.0):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.window = window
+        self.latency = latency
+        self.calls = deque()
+        self.batches = []
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, is_query=False):
+        tokens = sum(estimate_tokens(t) for t in texts)
+        with self._lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0][0] > self.window:
+                self.calls.popleft()
+            if len(self.calls) >= self.max_requests or sum(c[1] for c in self.calls) + tokens > self.max_tokens:
+                self.rejected += 1
+                raise RateLimited("429 Too Many Requests")
+            self.calls.append((now, tokens))
+            self.batches.append(list(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        return [[float(len(t)), float(hash(t) % 1000)] for t in texts]
+
+
+def expected(text):
+    return [float(len(text)), float(hash(text) % 1000)]
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate_per_minute=600, capacity=5)  # 10/s after a burst of 5
+    start = time.monotonic()
+    for _ in range(15):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.9
+
+def test_scheduler_stays_under_provider_limits():
+    # 10 req/s with a 1s burst allowance; the endpoint tolerates burst + one window of refill
+    endpoint = FakeEmbeddingEndpoint(max_requests=20, window=1.0)
+    scheduler = EmbeddingScheduler(embed_fn=endpoint, rpm=600, tpm=10**7, max_batch_texts=5,
+                                   burst_seconds=1, backoff_base=0.05)
+    texts = [f"chunk {i}" for i in range(100)]
+    vectors = scheduler.embed(texts)
+    scheduler.close()
+
+    assert vectors == [expected(t) for t in texts]
+    assert endpoint.rejected == 0
+    assert all(len(b) <= 5 for b in endpoint.batches)
+
+def test_scheduler_retries_rate_limits():
+    endpoint = FakeEmbeddingEndpoint(max_requests=3, window=0.3)
+    scheduler = EmbeddingScheduler(embed_fn=endpoint, rpm=60000, tpm=10**8, max_batch_texts=2,
+                                   backoff_base=0.05, backoff_cap=0.3, max_retries=20)
+    texts = [f"chunk {i}" for i in range(30)]
+    vectors = scheduler.embed(texts)
+    scheduler.close()
+
+    assert vectors == [expected(t) for t in texts]
+    assert endpoint.rejected > 0
+    assert scheduler.stats["rate_limited"] == endpoint.rejected
+
+def test_batches_sized_by_tokens():
+    endpoint = FakeEmbeddingEndpoint(max_requests=10**6)
+    scheduler = EmbeddingScheduler(embed_fn=endpoint, rpm=60000, tpm=10**8, max_batch_tokens=1000)
+    texts = ["x" * 300] * 40  # ~101 tokens each
+    scheduler.embed(texts)
+    scheduler.close()
+
+    assert all(sum(estimate_tokens(t) for t in b) <= 1000 for b in endpoint.batches)
+    assert max(len(b) for b in endpoint.batches) > 1
+
+def test_requests_run_concurrently():
+    endpoint = FakeEmbeddingEndpoint(max_requests=10**6, latency=0.1)
+    scheduler = EmbeddingScheduler(embed_fn=endpoint, rpm=60000, tpm=10**8, max_batch_texts=1, max_in_flight=4)
+    scheduler.embed([f"chunk {i}" for i in range(12)])
+    scheduler.close()
+
+    assert endpoint.max_in_flight > 1
+    assert endpoint.max_in_flight <= 4
+
+def test_queue_shared_across_files():
+    endpoint = FakeEmbeddingEndpoint(max_requests=10**6, latency=0.01)
+    scheduler = EmbeddingScheduler(embed_fn=endpoint, rpm=60000, tpm=10**8, max_batch_texts=8)
+    results = {}
+    def ingest(name):
+        texts = [f"{name} chunk {i}" for i in range(25)]
+        results[name] = (texts, scheduler.embed(texts))
+    threads = [threading.Thread(target=ingest, args=(f"file{i}.pdf",)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    scheduler.close()
+
+    for texts, vectors in results.values():
+        assert vectors == [expected(t) for t in texts]
+
+def test_non_retryable_error_fails_futures():
+    def broken(texts, is_query=False):
+        raise BadRequest("400 bad input")
+    scheduler = EmbeddingScheduler(embed_fn=broken, rpm=60000, tpm=10**8)
+    futures = scheduler.submit(["a", "b"])
+    with pytest.raises(BadRequest):
+        futures[0].result(timeout=5)
+    scheduler.close()
+    assert scheduler.stats["retries"] == 0
+
+def test_short_response_fails_every_future():
+    scheduler = EmbeddingScheduler(embed_fn=lambda texts, is_query=False: [[0.0]] * (len(texts) - 1),
+                                   rpm=60000, tpm=10**8, linger=0.2)
+    futures = scheduler.submit(["a", "b", "c"])
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    scheduler.close()
+    assert scheduler.stats["failed"] == 3
+
+def test_retries_spend_tokens_again():
+    endpoint = FakeEmbeddingEndpoint(max_requests=1, window=0.2)
+    scheduler = EmbeddingScheduler(embed_fn=endpoint, rpm=60000, tpm=10**8, max_batch_texts=1,
+                                   backoff_base=0.05, backoff_cap=0.1, max_retries=20)
+    spent = []
+    acquire = scheduler.token_bucket.acquire
+    scheduler.token_bucket.acquire = lambda amount=1: spent.append(amount) or acquire(amount)
+    scheduler.embed([f"chunk {i}" for i in range(4)])
+    scheduler.close()
+    assert endpoint.rejected > 0
+    assert len(spent) == 4 + scheduler.stats["retries"]
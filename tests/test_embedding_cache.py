@@ -0,0 +1,53 @@
+from src.embedding_cache import QueryEmbeddingCache
+
+
+def test_query_cache_normalizes_and_counts():
+    cache = QueryEmbeddingCache(max_entries=2, persistent=False)
+    calls = []
+    def fake_embed(texts, is_query=False):
+        calls.append(texts)
+        return [[0.1, 0.2]]
+
+    cache.get_or_embed("What is  io_uring?", fake_embed)
+    cache.get_or_embed("what is io_uring?", fake_embed)
+
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_query_cache_lru_eviction():
+    cache = QueryEmbeddingCache(max_entries=2, persistent=False)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert cache.stats()["evictions"] == 1
+
+def test_query_cache_key_includes_model():
+    a = QueryEmbeddingCache(persistent=False, model="voyage-code-3")
+    b = QueryEmbeddingCache(persistent=False, model="other-model")
+    assert a.key("same question") != b.key("same question")
+
+def test_query_cache_ttl():
+    cache = QueryEmbeddingCache(persistent=False, ttl=-1)
+    cache.put("a", [1.0])
+    assert cache.get("a") is None
+
+
+def test_query_cache_get_or_embed_many_batches_misses():
+    cache = QueryEmbeddingCache(persistent=False)
+    cache.put("cached", [0.0])
+    calls = []
+    def fake_embed(texts, is_query=False):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    vectors = cache.get_or_embed_many(["alpha", "cached", "be", "alpha"], fake_embed)
+
+    # Every miss goes out in one call, each distinct text once
+    assert calls == [["alpha", "be"]]
+    assert vectors == [[5.0], [0.0], [2.0], [5.0]]
+    assert cache.get("be") == [2.0]
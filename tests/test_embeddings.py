@@ -0,0 +1,106 @@
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import pytest
+import src.embeddings as embeddings
+from src.checkpoint import CheckpointStore
+from src.embed_scheduler import make_scheduler
+from src.embeddings import LocalProvider, VoyageProvider, EmbeddingMismatch, build_provider, assert_corpus_matches, select_device
+
+
+class FakeSentenceTransformer:
+    prompts = {"query": "query: "}
+
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.calls = []
+
+    def get_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, convert_to_numpy=True, show_progress_bar=True):
+        self.calls.append((texts, batch_size, normalize_embeddings))
+        return np.ones((len(texts), self.dim), dtype=np.float32) / 2
+
+
+def test_build_provider():
+    assert isinstance(build_provider("voyage"), VoyageProvider)
+    local = build_provider("local", model_name="some/model")
+    assert isinstance(local, LocalProvider) and not local.remote and local._model is None
+    with pytest.raises(ValueError):
+        build_provider("openai")
+
+def test_local_provider_batches_and_prefixes_queries():
+    model = FakeSentenceTransformer()
+    provider = LocalProvider(model_name="fake", batch_size=16, query_prefix="query: ", model=model)
+    assert len(provider.embed(["a", "b", "c"])) == 3
+    provider.embed(["how?"], is_query=True)
+    assert model.calls == [(["a", "b", "c"], 16, True), (["query: how?"], 16, True)]
+    assert provider.dimension == 4
+
+def test_local_scheduler_is_not_rate_limited():
+    provider = LocalProvider(model_name="fake", model=FakeSentenceTransformer())
+    scheduler = make_scheduler(provider)
+    try:
+        vectors = scheduler.embed([f"chunk {i}" for i in range(300)])
+    finally:
+        scheduler.close()
+    assert len(vectors) == 300 and scheduler.stats["rate_limited"] == 0
+    assert scheduler.requests.rate > 1000
+
+def test_checkpoint_from_another_model_keeps_only_its_plan(tmp_path):
+    store = CheckpointStore("a.pdf", directory=tmp_path, dim=4, model="voyage-code-3")
+    store.write_plan([("one", 1), ("two", 1)], source_hash="abc")
+    store.append(np.zeros((2, 4), dtype=np.float32))
+    reopened = CheckpointStore("a.pdf", directory=tmp_path, dim=3, model="bge-small")
+    assert reopened.total == 2 and reopened.committed == 0 and reopened.source_hash == "abc"
+    assert list(reopened.iter_plan()) == [("one", 1), ("two", 1)]
+
+def test_assert_corpus_matches_refuses_other_vector_space(monkeypatch):
+    provider = LocalProvider(model_name="bge-small", model=FakeSentenceTransformer())
+    monkeypatch.setattr(embeddings, "corpus_models", lambda: [("bge-small", 4, 10)])
+    assert_corpus_matches(provider)
+    monkeypatch.setattr(embeddings, "corpus_models", lambda: [("bge-small", 4, 10), ("voyage-code-3", 1024, 5)])
+    with pytest.raises(EmbeddingMismatch, match="voyage-code-3"):
+        assert_corpus_matches(provider)
+
+class ColumnConn:
+    """doc_chunks with an embedding column of `dim` dimensions and `rows` rows; records every statement."""
+    def __init__(self, dim, rows=0):
+        self.dim, self.rows = dim, rows
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append(query)
+        answer = self.dim if "atttypmod" in query else self.rows > 0
+        return type("Cursor", (), {"fetchone": lambda _: (answer,)})()
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+def test_empty_corpus_is_sized_for_a_local_provider(monkeypatch):
+    provider = LocalProvider(model_name="bge-small", model=FakeSentenceTransformer(dim=384))
+    conn = ColumnConn(dim=1024)
+    monkeypatch.setattr(embeddings, "corpus_models", lambda: [])
+    monkeypatch.setattr("src.pool.get_pool", lambda: type("Pool", (), {"connection": lambda _: nullcontext(conn)})())
+    assert_corpus_matches(provider)
+    assert "ALTER TABLE doc_chunks ALTER COLUMN embedding TYPE vector(384)" in conn.statements
+    # Already the right size, or rows arrived before the lock: left alone
+    assert not embeddings.fit_embedding_column(ColumnConn(dim=384), 384)
+    busy = ColumnConn(dim=1024, rows=1)
+    assert not embeddings.fit_embedding_column(busy, 384)
+    assert not [q for q in busy.statements if q.startswith("ALTER")]
+
+def test_explicit_device_is_respected():
+    assert select_device("cpu") == "cpu"
+    assert select_device("auto") in ("cuda", "mps", "cpu")
+
+def test_device_and_threads_settings_per_prefix(monkeypatch):
+    monkeypatch.setenv("RERANKER_DEVICE", "cpu")
+    monkeypatch.setenv("RERANKER_THREADS", "2")
+    monkeypatch.delenv("EMBEDDING_DEVICE", raising=False)
+    monkeypatch.delenv("EMBEDDING_THREADS", raising=False)
+    assert embeddings.device_setting("RERANKER") == "cpu"
+    assert embeddings.threads_setting("RERANKER") == 2
+    assert embeddings.device_setting("EMBEDDING") == "auto"
+    assert embeddings.threads_setting("EMBEDDING") == 0
@@ -0,0 +1,79 @@
+import fitz
+import pytest
+from src.extract import iterPagesFromPDF, renderPage
+
+
+# The original serial getTextFromPDF, kept verbatim as the reference output
+def legacy_text_from_pdf(filePath):
+    doc = fitz.open(filePath)
+    pages_data = []
+    for i, page in enumerate(doc):
+        blocks = page.get_text("dict")["blocks"]
+        md_text = ""
+        for b in blocks:
+            if "lines" not in b: continue
+            for line in b["lines"]:
+                for span in line["spans"]:
+                    text = span["text"].strip()
+                    if not text: continue
+                    size = span["size"]
+                    if size > 14:
+                        md_text += f"\n# {text}\n"
+                    elif 12 < size <= 14:
+                        md_text += f"\n## {text}\n"
+                    elif span["flags"] & 2**4:
+                        md_text += f" **{text}** "
+                    else:
+                        md_text += f" {text} "
+        clean_text = md_text.replace('\x00', '').replace('\ufb01', 'fi').replace('\ufb02', 'fl')
+        pages_data.append({"text": clean_text, "page": i + 1})
+    doc.close()
+    return pages_data
+
+
+@pytest.fixture(scope="module")
+def synthetic_pdf(tmp_path_factory):
+    path = tmp_path_factory.mktemp("pdf") / "synthetic.pdf"
+    doc = fitz.open()
+    for n in range(23):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Chapter {n}", fontsize=20)
+        page.insert_text((72, 110), f"Section {n}.1 io_uring", fontsize=13)
+        page.insert_text((72, 140), "Important:", fontname="hebo", fontsize=11)
+        y = 160
+        for line in range(12):
+            page.insert_text((72, y), f"Line {line} of page {n}: SELECT * FROM pg_stat_io;", fontsize=10)
+            y += 14
+        if n % 7 == 3:
+            page.insert_text((72, y + 20), "   ", fontsize=10)
+    doc.new_page()  # blank page
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_parallel_matches_legacy_output(synthetic_pdf):
+    expected = [(p["page"], p["text"]) for p in legacy_text_from_pdf(synthetic_pdf)]
+    parallel = list(iterPagesFromPDF(synthetic_pdf, workers=3, pagesPerTask=4))
+    assert parallel == expected
+
+def test_serial_matches_legacy_output(synthetic_pdf):
+    expected = [(p["page"], p["text"]) for p in legacy_text_from_pdf(synthetic_pdf)]
+    assert list(iterPagesFromPDF(synthetic_pdf, workers=1)) == expected
+
+def test_render_page_markdown(synthetic_pdf):
+    with fitz.open(synthetic_pdf) as doc:
+        text = renderPage(doc[0])
+    assert "\n# Chapter 0\n" in text
+    assert "\n## Section 0.1 io_uring\n" in text
+    assert " **Important:** " in text
+    assert "pg_stat_io" in text
+
+def test_iter_pages_is_lazy(synthetic_pdf):
+    pages = iterPagesFromPDF(synthetic_pdf, workers=2, pagesPerTask=5)
+    assert next(pages)[0] == 1
+    pages.close()
+
+def test_rejects_bad_task_size(synthetic_pdf):
+    with pytest.raises(ValueError, match="Pages per task must be greater than 0"):
+        list(iterPagesFromPDF(synthetic_pdf, pagesPerTask=0))
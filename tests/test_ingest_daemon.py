@@ -0,0 +1,55 @@
+import pytest
+import src.ingest_daemon as daemon
+from src.collection import DEFAULT_COLLECTION, collection_for
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    """Records the queue statements instead of running them."""
+    calls = []
+    monkeypatch.setattr(daemon, "_execute", lambda query, params=None: calls.append((query, params)))
+    monkeypatch.setattr(daemon, "ensure_collection", lambda name: name)
+    return calls
+
+
+def test_collection_for_follows_discover(tmp_path):
+    data = str(tmp_path)
+    assert collection_for(f"{data}/a.pdf", data) == DEFAULT_COLLECTION
+    assert collection_for(f"{data}/Python-3.12/b.pdf", data) == "python-3.12"
+    assert collection_for(f"{data}/checkpoints/c.pdf", data) is None
+    assert collection_for(f"{data}/a/b/c.pdf", data) is None
+    assert collection_for(f"{data}/notes.txt", data) is None
+
+def test_failures_retry_with_backoff_then_fail(tmp_path, queue):
+    (tmp_path / "a.pdf").write_bytes(b"%PDF")
+    def broken(path, scheduler, collection, progress=None):
+        raise RuntimeError("parse error")
+    d = daemon.IngestDaemon(str(tmp_path), ingest=broken)
+    d._process("a.pdf", DEFAULT_COLLECTION, attempts=2)
+    d._process("a.pdf", DEFAULT_COLLECTION, attempts=daemon.INGEST_MAX_ATTEMPTS)
+    (_, retry), (_, final) = queue
+    assert retry["status"] == "queued" and retry["delay"] == daemon.INGEST_RETRY_SECONDS * 2
+    assert final["status"] == "failed" and final["error"] == "parse error"
+
+def test_progress_is_recorded_and_missing_files_dropped(tmp_path, queue, monkeypatch):
+    (tmp_path / "a.pdf").write_bytes(b"%PDF")
+    def ingest(path, scheduler, collection, progress=None):
+        for done in range(0, 301, 100):
+            progress(done, 300)
+        return {"status": "ingested", "chunks": 300}
+    d = daemon.IngestDaemon(str(tmp_path), ingest=ingest)
+    d._process("a.pdf", DEFAULT_COLLECTION, attempts=1)
+    # Throttled: the first report and the final one
+    assert [p for q, p in queue if q == daemon.PROGRESS_SQL] == [(0, 300, "a.pdf"), (300, 300, "a.pdf")]
+    assert queue[-1][1]["status"] == "done" and '"chunks": 300' in queue[-1][1]["result"]
+    queue.clear()
+    d._process("gone.pdf", DEFAULT_COLLECTION, attempts=1)
+    assert queue == [("DELETE FROM ingest_queue WHERE path = %s", ("gone.pdf",))]
+
+def test_format_status():
+    rows = [{"path": "a.pdf", "status": "running", "chunks_done": 40, "chunks_total": 120, "attempts": 1, "error": None},
+            {"path": "b.pdf", "status": "failed", "chunks_done": None, "chunks_total": None, "attempts": 5,
+             "error": "boom"}]
+    text = daemon.format_status(rows)
+    assert "40/120  a.pdf" in text and "b.pdf  (5 attempts: boom)" in text
+    assert daemon.format_status([]) == "Nothing queued yet."
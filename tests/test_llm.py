@@ -0,0 +1,80 @@
+import pytest
+import src.llm as llm
+from src.llm import OllamaClient, LLMTimeout, SYSTEM_PROMPT, build_prompt
+from benchmarks.stub_ollama import StubOllama
+
+TOKENS = ["Set", " `shared_buffers`", " (Source:", " tuning.pdf,", " p. 4)"]
+
+
+def test_stream_uses_stable_system_prefix():
+    with StubOllama(tokens=TOKENS) as stub:
+        client = OllamaClient(base_url=stub.url)
+        first = "".join(client.stream(build_prompt("q1", "Source: a.pdf p.1\nContent: one")))
+        second = "".join(client.stream(build_prompt("q2", "Source: b.pdf p.2\nContent: two")))
+        client.close()
+    assert first == second == "".join(TOKENS)
+    a, b = stub.requests
+    assert a["system"] == b["system"] == SYSTEM_PROMPT
+    assert a["prompt"].startswith("<context>\nSource: a.pdf") and a["prompt"].endswith("<question>\nq1\n</question>")
+    assert a["keep_alive"] == client.keep_alive and a["options"] == {"num_ctx": client.num_ctx}
+
+def test_sync_requests_reuse_one_connection():
+    with StubOllama(tokens=TOKENS) as stub:
+        client = OllamaClient(base_url=stub.url)
+        for i in range(5):
+            assert "".join(client.stream(f"question {i}")) == "".join(TOKENS)
+        client.close()
+    assert len(stub.connections) == 1
+
+@pytest.mark.asyncio
+async def test_async_requests_reuse_one_connection():
+    with StubOllama(tokens=TOKENS) as stub:
+        client = OllamaClient(base_url=stub.url)
+        for i in range(5):
+            assert "".join([t async for t in client.astream(f"question {i}")]) == "".join(TOKENS)
+        await client.aclose()
+    assert len(stub.connections) == 1
+
+def test_records_time_to_first_token_and_throughput():
+    with StubOllama(tokens=TOKENS, first_token_delay=0.1, token_delay=0.02) as stub:
+        client = OllamaClient(base_url=stub.url)
+        list(client.stream("question"))
+        client.close()
+    stats = client.last_stats
+    assert stats.ttft >= 0.1 and stats.total >= stats.ttft
+    assert stats.tokens == len(TOKENS)
+    # From Ollama's eval_count / eval_duration: 5 tokens over 5 * 20ms
+    assert stats.tokens_per_sec == pytest.approx(50, rel=0.01)
+    assert client.metrics()["requests"] == 1
+
+@pytest.mark.asyncio
+async def test_first_token_timeout():
+    with StubOllama(tokens=TOKENS, first_token_delay=0.5) as stub:
+        client = OllamaClient(base_url=stub.url, first_token_timeout=0.1)
+        with pytest.raises(LLMTimeout):
+            [t async for t in client.astream("slow")]
+        await client.aclose()
+
+def test_warm_loads_model_without_generating():
+    with StubOllama(tokens=TOKENS) as stub:
+        client = OllamaClient(base_url=stub.url, keep_alive="1h")
+        assert client.warm()
+        client.close()
+    assert stub.requests == [{"model": client.model, "prompt": "", "keep_alive": "1h",
+                              "options": {"num_ctx": client.num_ctx}}]
+    assert not OllamaClient(base_url="http://127.0.0.1:1", timeout=1).warm()
+
+def test_endpoint_is_looked_up_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm, "_endpoint", None)
+    monkeypatch.delenv("OLLAMA_BASE_URL", raising=False)
+    monkeypatch.setattr(llm, "_default_gateway_endpoint", lambda: calls.append(1) or "http://10.0.0.1:11434")
+    assert llm.resolve_endpoint() == llm.resolve_endpoint() == "http://10.0.0.1:11434"
+    assert len(calls) == 1
+    monkeypatch.setattr(llm, "_endpoint", None)
+    monkeypatch.setenv("OLLAMA_BASE_URL", "http://gpu-box:11434")
+    assert llm.resolve_endpoint() == "http://gpu-box:11434"
+    # Lazily resolved on first use only
+    client = OllamaClient(resolver=lambda: calls.append(2) or "http://lazy:1")
+    assert calls == [1]
+    assert client.url == "http://lazy:1/api/generate" and calls == [1, 2]
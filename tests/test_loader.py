@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+import numpy as np
+import src.loader as loader
+from src.loader import StreamingLoader
+
+
+class FakeCopy:
+    def __init__(self, statement):
+        self.statement = statement
+        self.types = None
+        self.rows = []
+
+    def set_types(self, types):
+        self.types = types
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rowcount = 3
+
+    def _text(self, query):
+        return query if isinstance(query, str) else query.as_string(None)
+
+    def execute(self, query, params=None):
+        self.pool.log.append(("execute", self._text(query), params))
+        return self
+
+    def fetchone(self):
+        return (self.pool.answer,)
+
+    @contextmanager
+    def copy(self, statement):
+        copy = FakeCopy(self._text(statement))
+        self.pool.copies.append(copy)
+        self.pool.log.append(("copy", copy.statement, None))
+        yield copy
+
+
+class FakeConn:
+    def __init__(self, pool):
+        self.pool = pool
+
+    @contextmanager
+    def cursor(self):
+        yield FakeCursor(self.pool)
+
+
+class RecordingPool:
+    """Each connection() block is one transaction: it commits on the way out, like psycopg_pool's."""
+    def __init__(self, answer=0):
+        self.answer = answer
+        self.log = []
+        self.copies = []
+
+    @contextmanager
+    def connection(self):
+        yield FakeConn(self)
+        self.log.append(("commit", None, None))
+
+
+def test_live_writes_bump_the_generation_in_their_transaction(monkeypatch):
+    own = []
+    monkeypatch.setattr(loader, "own_corpus_change", own.append)
+    pool = RecordingPool(answer=12)
+    StreamingLoader("a.pdf", pool=pool).write_rows([("text", 1, np.zeros(4, dtype=np.float32))])
+    assert [kind for kind, _, _ in pool.log] == ["copy", "execute", "commit"]
+    assert "corpus_generation" in pool.log[1][1] and own == [12]
+    # A staging table isn't searched yet
+    staged = RecordingPool()
+    StreamingLoader("a.pdf", pool=staged, table="doc_chunks_rebuild.doc_chunks").write_rows([("t", 1, np.zeros(4))])
+    assert [kind for kind, _, _ in staged.log] == ["copy", "commit"] and own == [12]
+
+def test_copy_columns_follow_the_row_layout(monkeypatch):
+    monkeypatch.setattr(loader, "own_corpus_change", lambda generation: None)
+    pool = RecordingPool()
+    vector = np.arange(4, dtype=np.float32)
+    plain = StreamingLoader("a.pdf", pool=pool)
+    assert plain.write_rows([("text", 3, vector)]) == 1
+    copy = pool.copies[-1]
+    assert copy.statement == 'COPY "doc_chunks" ("content", "embedding", "filename", "page_number") FROM STDIN WITH (FORMAT BINARY)'
+    assert copy.types == ["text", "vector", "text", "int4"]
+    assert copy.rows == [("text", vector, "a.pdf", 3)]
+    full = StreamingLoader("a.pdf", pool=pool, file_hash="fh", model="bge-small", collection="python-3.12")
+    full.write_rows([("text", 3, vector, "ch")])
+    copy = pool.copies[-1]
+    assert '"chunk_hash", "file_hash", "embedding_model", "embedding_dim", "collection")' in copy.statement
+    assert copy.types == ["text", "vector", "text", "int4", "text", "text", "text", "int4", "text"]
+    assert copy.rows == [("text", vector, "a.pdf", 3, "ch", "fh", "bge-small", 4, "python-3.12")]
+    assert len(copy.types) == len(copy.rows[0]) and full.rows_written == 1
+
+def test_loaded_rows_only_counts_this_file_version_and_collection():
+    pool = RecordingPool(answer=7)
+    assert StreamingLoader("a.pdf", pool=pool, table="doc_chunks_rebuild.doc_chunks", file_hash="fh",
+                           collection="python-3.12").loaded_rows() == 7
+    _, query, params = pool.log[0]
+    assert query == ('SELECT count(*) FROM "doc_chunks_rebuild"."doc_chunks" WHERE filename = %s '
+                     'AND collection = %s AND file_hash = %s')
+    assert params == ["a.pdf", "python-3.12", "fh"]
+
+def test_replace_rows_deletes_and_copies_in_one_transaction(monkeypatch):
+    monkeypatch.setattr(loader, "own_corpus_change", lambda generation: None)
+    pool = RecordingPool()
+    rows = [("new", 1, np.zeros(4, dtype=np.float32), "h")]
+    assert StreamingLoader("a.pdf", pool=pool, file_hash="fh", collection="default").replace_rows(rows) == 1
+    kinds = [kind for kind, _, _ in pool.log]
+    # Nothing is committed between the delete and the new rows, searches never see the file missing
+    assert kinds == ["execute", "copy", "execute", "commit"]
+    assert pool.log[0][1].startswith('DELETE FROM "doc_chunks" WHERE filename = %s AND collection = %s')
+    assert pool.log[0][2] == ["a.pdf", "default"]
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+import src.pool as pool
+
+
+class FakePool:
+    created = []
+
+    def __init__(self, conninfo, configure=None, open=True, **kwargs):
+        self.configure = configure
+        self.opened = open
+        self.closed = False
+        self.created.append(self)
+
+    def close(self):
+        self.closed = True
+
+    @staticmethod
+    def check_connection(conn):
+        pass
+
+
+class FakeAsyncPool(FakePool):
+    async def open(self):
+        # Yield so every concurrent first caller gets to run
+        await asyncio.sleep(0.01)
+        self.opened = True
+
+    async def close(self):
+        self.closed = True
+
+    @staticmethod
+    async def check_connection(conn):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.prepare_threshold = None
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def fake_pools(monkeypatch):
+    FakePool.created = []
+    monkeypatch.setattr(pool, "ConnectionPool", FakePool)
+    monkeypatch.setattr(pool, "AsyncConnectionPool", FakeAsyncPool)
+    monkeypatch.setattr(pool, "get_connection_string", lambda: "postgresql://test")
+    monkeypatch.setattr(pool, "_pool", None)
+    monkeypatch.setattr(pool, "_async_pool", None)
+    return FakePool.created
+
+
+def test_get_pool_is_a_lazy_singleton(fake_pools):
+    assert fake_pools == []
+    first = pool.get_pool()
+    assert pool.get_pool() is first
+    assert fake_pools == [first]
+    assert first.opened
+
+
+def test_close_pools_resets_the_singleton(fake_pools):
+    first = pool.get_pool()
+    pool.close_pools()
+    assert first.closed
+    assert pool.pool_stats() == {}
+    assert pool.get_pool() is not first
+
+
+def test_configure_registers_vector_on_every_connection(fake_pools, monkeypatch):
+    registered = []
+    monkeypatch.setattr(pool, "register_vector", registered.append)
+    pool.get_pool()
+    configure = fake_pools[0].configure
+    conns = [FakeConn(), FakeConn()]
+    for conn in conns:
+        configure(conn)
+
+    assert registered == conns
+    for conn in conns:
+        assert conn.prepare_threshold == pool.PREPARE_THRESHOLD
+        # Handed back to the pool idle
+        assert conn.commits == 1
+
+
+@pytest.mark.asyncio
+async def test_async_configure_registers_vector(monkeypatch):
+    registered = []
+
+    async def register(conn):
+        registered.append(conn)
+
+    class AsyncConn(FakeConn):
+        async def commit(self):
+            self.commits += 1
+
+    monkeypatch.setattr(pool, "register_vector_async", register)
+    conn = AsyncConn()
+    await pool._aconfigure(conn)
+    assert registered == [conn]
+    assert conn.commits == 1
+
+
+@pytest.mark.asyncio
+async def test_async_pool_created_once_under_concurrent_first_calls(fake_pools):
+    pools = await asyncio.gather(*[pool.get_async_pool() for _ in range(5)])
+    assert len(fake_pools) == 1
+    assert all(p is fake_pools[0] for p in pools)
+    assert fake_pools[0].opened
+
+    await pool.aclose_pools()
+    assert fake_pools[0].closed
+    assert pool._async_pool is None
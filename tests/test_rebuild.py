@@ -0,0 +1,41 @@
+import src.rebuild as rebuild
+
+
+class FakeConn:
+    """Answers index_statements' catalog queries with canned rows."""
+    def __init__(self, constraints, indexes, bm25):
+        self.answers = {"pg_get_constraintdef": constraints, "pg_get_indexdef": indexes}
+        self.bm25 = bm25
+
+    def execute(self, query, params=None):
+        return next(rows for key, rows in self.answers.items() if key in query)
+
+
+def test_live_indexes_are_retargeted_at_the_staging_table(monkeypatch):
+    monkeypatch.setattr(rebuild, "has_bm25", lambda conn: conn.bm25)
+    conn = FakeConn(
+        constraints=[("doc_chunks_pkey", "PRIMARY KEY (id, collection)")],
+        indexes=[("idx_embedding_hnsw", "CREATE INDEX idx_embedding_hnsw ON ONLY public.doc_chunks USING hnsw "
+                                        "(embedding vector_cosine_ops) WITH (m='16', ef_construction='64')"),
+                 ("idx_doc_chunks_file", "CREATE INDEX idx_doc_chunks_file ON doc_chunks USING btree (filename, file_hash)")],
+        bm25=True)
+    statements = dict(rebuild.index_statements(conn, ["default", "python-3.12"]))
+    staging = f"{rebuild.STAGING_SCHEMA}.doc_chunks"
+    assert statements["doc_chunks_pkey"] == f"ALTER TABLE {staging} ADD CONSTRAINT doc_chunks_pkey PRIMARY KEY (id, collection)"
+    # Built on the staging parent without ONLY, so it recurses into every partition
+    assert statements["idx_embedding_hnsw"].startswith(f"CREATE INDEX idx_embedding_hnsw ON {staging} USING hnsw")
+    assert f"ON {staging} USING btree (filename, file_hash)" in statements["idx_doc_chunks_file"]
+    assert {"doc_chunks_default_bm25", f"{rebuild.partition_name('python-3.12')}_bm25"} <= set(statements)
+    conn.bm25 = False
+    assert not [name for name in dict(rebuild.index_statements(conn, ["default"])) if name.endswith("_bm25")]
+
+def test_reembed_retargets_compact_indexes_at_the_new_dimension(monkeypatch):
+    monkeypatch.setattr(rebuild, "has_bm25", lambda conn: conn.bm25)
+    conn = FakeConn(
+        constraints=[],
+        indexes=[("idx_embedding_halfvec", "CREATE INDEX idx_embedding_halfvec ON ONLY public.doc_chunks USING hnsw "
+                                           "(((embedding)::halfvec(1024)) halfvec_cosine_ops)")],
+        bm25=False)
+    assert "::halfvec(1024)" in dict(rebuild.index_statements(conn, ["default"]))["idx_embedding_halfvec"]
+    statement = dict(rebuild.index_statements(conn, ["default"], dim=384))["idx_embedding_halfvec"]
+    assert "((embedding)::halfvec(384)) halfvec_cosine_ops" in statement
@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.rerank_batcher import RerankBatcher, RerankOverloaded
+
+
+class SerialModel:
+    """One model instance: calls are serialized and cost a fixed overhead plus a per-pair cost."""
+    def __init__(self, overhead: float = 0.0, per_pair: float = 0.0):
+        self.overhead = overhead
+        self.per_pair = per_pair
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def predict(self, pairs):
+        with self._lock:
+            time.sleep(self.overhead + self.per_pair * len(pairs))
+            self.batches.append(len(pairs))
+            return [float(len(q) * 1000 + len(t)) for q, t in pairs]
+
+
+def pairs_for(n: int, size: int = 4):
+    return [("q" * (n + 1), "t" * i) for i in range(size)]
+
+
+def expected(pairs):
+    return [float(len(q) * 1000 + len(t)) for q, t in pairs]
+
+
+def test_concurrent_requests_share_batches():
+    model = SerialModel(overhead=0.02)
+    batcher = RerankBatcher(model.predict, max_batch=16, max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda n: batcher.predict(pairs_for(n)), range(8)))
+    assert results == [expected(pairs_for(n)) for n in range(8)]
+    assert len(model.batches) < 8 and max(model.batches) <= 16
+    metrics = batcher.metrics()
+    assert metrics["requests"] == 8 and metrics["pairs"] == 32
+    assert 0 < metrics["batch_fill"] <= 1 and metrics["queue_depth"] == 0
+    batcher.close()
+
+def test_oversized_request_runs_alone():
+    model = SerialModel()
+    batcher = RerankBatcher(model.predict, max_batch=4, max_queue=4, max_wait=0.01)
+    big = pairs_for(0, size=10)
+    assert batcher.predict(big) == expected(big)
+    assert batcher.predict([]) == []
+    assert model.batches == [10]
+    batcher.close()
+
+def test_full_queue_applies_backpressure():
+    gate = threading.Event()
+    started = threading.Event()
+
+    def blocked(pairs):
+        started.set()
+        gate.wait()
+        return [0.0] * len(pairs)
+
+    batcher = RerankBatcher(blocked, max_batch=4, max_wait=0.0, max_queue=8, enqueue_timeout=0.1)
+    running = batcher.submit(pairs_for(0))
+    started.wait(1)
+    queued = [batcher.submit(pairs_for(1)), batcher.submit(pairs_for(2))]
+    assert batcher.metrics()["queue_depth"] == 8
+    with pytest.raises(RerankOverloaded):
+        batcher.submit(pairs_for(3))
+    assert batcher.metrics()["rejected"] == 1
+    gate.set()
+    assert [f.result(1) for f in [running] + queued] == [[0.0] * 4] * 3
+    # Space freed up once the queued requests were taken
+    assert batcher.predict(pairs_for(3)) == [0.0] * 4
+    batcher.close()
+
+def test_cancelled_request_is_skipped():
+    gate = threading.Event()
+    model = SerialModel()
+
+    def predict(pairs):
+        gate.wait()
+        return model.predict(pairs)
+
+    batcher = RerankBatcher(predict, max_batch=4, max_wait=0.0)
+    first = batcher.submit(pairs_for(0))
+    time.sleep(0.05)
+    cancelled = batcher.submit(pairs_for(1))
+    assert cancelled.cancel()
+    gate.set()
+    assert first.result(1) == expected(pairs_for(0))
+    assert batcher.predict(pairs_for(2)) == expected(pairs_for(2))
+    assert model.batches == [4, 4]
+    assert batcher.metrics()["queue_depth"] == 0
+    batcher.close()
+
+def test_errors_reach_every_request_in_the_batch():
+    def broken(pairs):
+        raise RuntimeError("cuda out of memory")
+
+    batcher = RerankBatcher(broken, max_batch=8, max_wait=0.05)
+    futures = [batcher.submit(pairs_for(n, size=2)) for n in range(3)]
+    for f in futures:
+        with pytest.raises(RuntimeError, match="out of memory"):
+            f.result(1)
+    batcher.close()
+
+def run_load(score, users: int, queries: int):
+    latencies = []
+
+    def user(n):
+        for i in range(queries):
+            start = time.perf_counter()
+            assert score(pairs_for(n * queries + i, size=20)) == expected(pairs_for(n * queries + i, size=20))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return users * queries / elapsed, latencies[int(0.95 * (len(latencies) - 1))]
+
+def test_load_batching_raises_throughput_with_bounded_latency():
+    # Per-call overhead dominates small batches, like a cross-encoder on GPU or a threaded CPU kernel
+    unbatched_qps, unbatched_p95 = run_load(SerialModel(overhead=0.02, per_pair=0.0002).predict, users=16, queries=4)
+    batcher = RerankBatcher(SerialModel(overhead=0.02, per_pair=0.0002).predict, max_batch=160, max_wait=0.005)
+    batched_qps, batched_p95 = run_load(batcher.predict, users=16, queries=4)
+    metrics = batcher.metrics()
+    batcher.close()
+    assert batched_qps > 2 * unbatched_qps
+    assert batched_p95 < unbatched_p95
+    assert metrics["pairs_per_batch"] > 40
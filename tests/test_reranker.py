@@ -0,0 +1,76 @@
+import time
+from src.rerank_batcher import RerankBatcher
+from src.reranker import Reranker, ScoreCache, length_buckets
+
+
+class CountingModel:
+    """Scores a pair by the length of its text, records every batch it was given."""
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, pairs, batch_size=32):
+        self.batches.append(list(pairs))
+        return [float(len(text)) for _, text in pairs]
+
+
+def rows(texts):
+    return [(text, "manual.pdf", i + 1, 0.5, 100 + i) for i, text in enumerate(texts)]
+
+
+def test_rerank_orders_by_score_and_keeps_top_k():
+    reranker = Reranker(model=CountingModel(), model_name="fake")
+    ranked = reranker.rerank("q", rows(["bb", "a", "dddd", "ccc"]), top_k=3)
+    assert [r[0] for r in ranked] == ["dddd", "ccc", "bb"]
+    assert reranker.rerank("q", []) == []
+
+def test_scores_are_cached_per_query_and_chunk():
+    model = CountingModel()
+    reranker = Reranker(model=model, model_name="fake")
+    candidates = rows(["one", "three", "fives"])
+    first = reranker.score("q", candidates)
+    assert reranker.score("q", candidates) == first
+    assert len(model.batches) == 1
+    # A next page shares two chunks with the first one, only the new chunk is scored
+    reranker.score("q", candidates[1:] + rows(["x", "y", "z", "new"])[3:])
+    assert model.batches[-1] == [("q", "new")]
+    reranker.score("other question", candidates[:1])
+    assert model.batches[-1] == [("other question", "one")]
+    assert reranker.stats["pairs_scored"] == 5
+
+def test_predict_buckets_by_length_and_restores_order():
+    model = CountingModel()
+    reranker = Reranker(model=model, model_name="fake", batch_size=2, batch_tokens=10**6)
+    texts = ["x" * n for n in (5, 400, 10, 300, 20)]
+    assert reranker.predict([("q", t) for t in texts]) == [float(len(t)) for t in texts]
+    assert [[len(t) for _, t in b] for b in model.batches] == [[400, 300], [20, 10], [5]]
+
+def test_length_buckets_respect_token_budget():
+    lengths = [500, 100, 100, 100, 100, 10, 10]
+    batches = length_buckets(lengths, max_batch=8, max_tokens=512)
+    assert batches == [[0], [1, 2, 3, 4, 5], [6]]
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+
+def test_score_cache_evicts_least_recent():
+    cache = ScoreCache(max_entries=2)
+    cache.put(("q", 1), 0.1)
+    cache.put(("q", 2), 0.2)
+    cache.get(("q", 1))
+    cache.put(("q", 3), 0.3)
+    assert cache.get(("q", 2)) is None
+    assert cache.get(("q", 1)) == 0.1
+
+def test_bulk_scoring_never_overflows_the_queue():
+    class SlowModel(CountingModel):
+        def predict(self, pairs, batch_size=32):
+            time.sleep(0.05)
+            return super().predict(pairs, batch_size)
+    reranker = Reranker(model=SlowModel(), model_name="fake", batching=False)
+    # Submitting every slice at once would be 5x what the queue holds, and time out waiting for room
+    reranker.batcher = RerankBatcher(reranker.predict, max_batch=4, max_queue=8, enqueue_timeout=0.01)
+    try:
+        candidates = [rows([f"{q}-{i}" for i in range(20)]) for q in "ab"]
+        scores = reranker.score_many(["a", "b"], candidates)
+    finally:
+        reranker.close()
+    assert scores == [[float(len(c[0])) for c in listed] for listed in candidates]
+    assert reranker.batcher.stats["max_queue_depth"] <= 8
@@ -0,0 +1,60 @@
+import pytest
+from src.retrieval import (RetrievalConfig, COMPACT_STORAGE, CANDIDATES_SQL, ann_sql, candidates_sql,
+                           compact_index_sql, reciprocal_rank_fusion, weighted_fusion, fuse, _params, _settings)
+
+
+@pytest.mark.parametrize("storage", list(COMPACT_STORAGE))
+def test_compact_query_matches_its_index_expression(storage):
+    # The planner only uses an expression index when the ORDER BY repeats the expression exactly
+    column = COMPACT_STORAGE[storage][0].format(dim=384)
+    assert column in compact_index_sql(storage, 384)
+    sql = ann_sql(storage, 384)
+    assert f"ORDER BY {column}" in sql and "LIMIT %(k_rescore)s" in sql
+    # Final order is by exact distance against the full-precision column
+    assert "embedding <=> %(vector)s::vector AS distance" in sql
+    assert ann_sql(storage, 384) in candidates_sql(storage, 384)
+
+def test_compact_modes_widen_the_hnsw_scan():
+    full = RetrievalConfig(storage="full", ef_search=80, rescore_k=200, k_ann=50)
+    compact = RetrievalConfig(storage="binary", ef_search=80, rescore_k=200, k_ann=50)
+    assert _settings(full)[0] == "80" and _settings(compact)[0] == "200"
+    assert _params([0.0] * 4, "q", RetrievalConfig(k_ann=50, rescore_k=10))["k_rescore"] == 50
+    assert candidates_sql("full") == CANDIDATES_SQL
+    with pytest.raises(ValueError):
+        ann_sql("pq", 384)
+
+def test_rrf_sums_weighted_reciprocal_ranks():
+    legs = {"bm25": [(1, 1, 9.0), (2, 2, 5.0)], "ann": [(2, 1, 0.9), (3, 2, 0.8)]}
+    fused = reciprocal_rank_fusion(legs, k=10)
+    # Found by both legs beats first place in one of them
+    assert fused[2] == pytest.approx(1 / 12 + 1 / 11)
+    assert fused[1] == pytest.approx(1 / 11)
+    # A chunk only one leg found still gets that leg's share
+    assert fused[3] == pytest.approx(1 / 12)
+    assert sorted(fused, key=fused.get, reverse=True) == [2, 1, 3]
+    weighted = reciprocal_rank_fusion(legs, k=10, weights={"bm25": 0.0, "ann": 2.0})
+    assert weighted[1] == 0.0 and weighted[2] == pytest.approx(2 / 11)
+    # A small k makes the top ranks count for more
+    assert reciprocal_rank_fusion(legs, k=0)[1] == pytest.approx(1.0)
+
+def test_weighted_fusion_normalizes_each_leg():
+    legs = {"bm25": [(1, 1, 30.0), (2, 2, 10.0)], "ann": [(2, 1, 0.9), (3, 2, 0.6), (4, 3, 0.3)]}
+    fused = weighted_fusion(legs, {"bm25": 1.0, "ann": 0.5})
+    assert fused == pytest.approx({1: 1.0, 2: 0.5, 3: 0.25, 4: 0.0})
+
+def test_weighted_fusion_with_equal_scores_does_not_divide_by_zero():
+    fused = weighted_fusion({"bm25": [(1, 1, 4.2), (2, 2, 4.2)], "ann": []})
+    assert fused == {1: 1.0, 2: 1.0}
+
+def test_fuse_follows_the_config():
+    rows = [(1, "bm25", 1, 9.0, "one", "a.pdf", 1), (2, "bm25", 2, 1.0, "two", "a.pdf", 2),
+            (2, "ann", 1, 0.9, "two", "a.pdf", 2), (3, "ann", 2, 0.1, "three", "b.pdf", 5)]
+    ranked = fuse(rows, RetrievalConfig(fusion="rrf", rrf_k=60, limit=2))
+    assert [r[4] for r in ranked] == [2, 1]
+    assert ranked[0][:3] == ("two", "a.pdf", 2) and ranked[0][3] == pytest.approx(1 / 62 + 1 / 61)
+    # Min-max: chunk 1 tops bm25, chunk 2 tops ann and is last in bm25
+    ranked = fuse(rows, RetrievalConfig(fusion="weighted", weights={"bm25": 2.0, "ann": 1.0}, limit=3))
+    assert [r[4] for r in ranked] == [1, 2, 3]
+    assert [r[3] for r in ranked] == pytest.approx([2.0, 1.0, 0.0])
+    with pytest.raises(ValueError, match="Unknown fusion method"):
+        fuse(rows, RetrievalConfig(fusion="max"))
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from src.RAGService import RagService
+from benchmarks.stub_ollama import StubOllama
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Measured ~0.6s on a dev box with everything lazy; voyageai alone used to add ~0.9s, torch several seconds
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "2.0"))
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "voyageai", "onnxruntime")
+ENTRY_POINTS = ("src.RAGService", "src.ingest", "src.db")
+
+
+def import_profile():
+    env = {k: v for k, v in os.environ.items() if k != "VOYAGE_API"}
+    code = f"import {', '.join(ENTRY_POINTS)}; from src.RAGService import RagService; RagService()"
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=PROJECT_ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    modules = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+
+def test_import_time_budget():
+    modules = import_profile()
+    assert not [m for m in HEAVY_MODULES if m in modules], "heavy dependency imported at startup"
+    total = sum(modules.get(m, 0.0) for m in ENTRY_POINTS)
+    assert total < IMPORT_BUDGET_SECONDS, f"imports took {total:.2f}s"
+
+def test_construction_loads_nothing(monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("resolved at construction")
+    monkeypatch.setattr(RagService, "get_ollama_endpoint", staticmethod(forbidden))
+    monkeypatch.setattr("src.RAGService.Reranker", forbidden)
+    service = RagService()
+    assert service._reranker is None and service.llm._base_url is None
+
+def test_lazy_resources_are_built_once(monkeypatch):
+    built = []
+    barrier = threading.Barrier(8)
+
+    class FakeReranker:
+        def __init__(self):
+            built.append(self)
+
+    monkeypatch.setattr("src.RAGService.Reranker", FakeReranker)
+    monkeypatch.setattr(RagService, "get_ollama_endpoint", staticmethod(lambda: built.append("ip") or "http://x:11434"))
+    service = RagService()
+
+    def touch():
+        barrier.wait()
+        return service.reranker, service.OLLAMA_BASE
+
+    threads = [threading.Thread(target=touch) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len([b for b in built if b == "ip"]) == 1
+    assert len([b for b in built if b != "ip"]) == 1
+
+def test_warmup_loads_every_resource_and_survives_missing_db(monkeypatch):
+    calls = []
+
+    class FakeModel:
+        def predict(self, pairs, batch_size=32):
+            calls.append(pairs)
+            return [0.0] * len(pairs)
+
+    def no_db():
+        raise ConnectionError("Database Down.")
+
+    monkeypatch.setattr("src.db.get_voyage_client", lambda: calls.append("voyage"))
+    monkeypatch.setattr("src.pool.get_pool", no_db)
+    with StubOllama() as stub:
+        service = RagService(ollama_base=stub.url, reranker=FakeModel())
+        service.warmup()
+    assert calls == ["voyage", [("warmup", "warmup")]]
+    assert stub.requests[0]["prompt"] == "" and stub.requests[0]["keep_alive"]
+    service.reranker.close()
+    service.llm.close()
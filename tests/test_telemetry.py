@@ -0,0 +1,96 @@
+import importlib.util
+import pytest
+from src import telemetry
+from src.RAGService import RagService
+from benchmarks.stub_ollama import StubOllama
+
+TOKENS = ["Raise", " `max_wal_size`", " (Source:", " wal.pdf,", " p. 3)"]
+CANDIDATES = [("checkpoints happen when max_wal_size is reached", "wal.pdf", 3, 0.9, 1),
+              ("wal_compression trades CPU for WAL volume", "wal.pdf", 4, 0.5, 2)]
+
+
+class FakeModel:
+    def predict(self, pairs, batch_size=32):
+        return [1.0] * len(pairs)
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    """Turns telemetry on (in process only) and collects every finished span."""
+    finished = []
+    t = telemetry.configure(enabled=True, exporter="local")
+    finish = t._finish
+
+    def record(span, seconds, exc=None):
+        finished.append(span)
+        finish(span, seconds, exc)
+    monkeypatch.setattr(t, "_finish", record)
+    yield finished
+    telemetry.configure(enabled=False)
+
+
+def make_service(stub_url):
+    service = RagService(ollama_base=stub_url, reranker=FakeModel())
+    service.embedding_cache.get_or_embed = lambda query, embed_fn: [float(len(query))] * 8
+    service.search_database = lambda query_vector, query: CANDIDATES
+    service.answer_cache.threshold = 2.0
+    return service
+
+
+def test_disabled_is_a_shared_noop():
+    t = telemetry.configure(enabled=False)
+    with telemetry.span("rag.query", file="x") as span:
+        span.set(tokens=3)
+    telemetry.observe("llm.ttft", 1.0)
+    assert span is telemetry.NOOP
+    assert not t._ready and telemetry.snapshot() == {}
+
+def test_query_stages_are_children_of_one_span(spans):
+    with StubOllama(tokens=TOKENS) as stub:
+        service = make_service(stub.url)
+        assert "".join(service.get_response("when do checkpoints happen?")) == "".join(TOKENS)
+        service.reranker.close()
+        service.llm.close()
+    by_name = {s.name: s for s in spans}
+    root = by_name["rag.query"]
+    for stage in ("rag.embed", "rag.answer_cache", "rag.search", "rag.rerank", "rag.pack", "rag.generate"):
+        assert by_name[stage].parent is root
+    assert by_name["rag.search"].attributes["candidates"] == 2
+    assert by_name["rag.generate"].attributes["tokens"] == len(TOKENS)
+    # The query span stays open until the last token was streamed
+    assert spans[-1] is root
+    stats = telemetry.snapshot()
+    assert stats["rag.query"]["count"] == 1 and stats["llm.ttft"]["count"] == 1
+
+def test_abandoned_stream_is_cancelled_not_failed(spans):
+    with StubOllama(tokens=TOKENS) as stub:
+        service = make_service(stub.url)
+        gen = service.get_response("when do checkpoints happen?")
+        next(gen)
+        gen.close()
+        service.reranker.close()
+        service.llm.close()
+    root = next(s for s in spans if s.name == "rag.query")
+    assert root.attributes.get("cancelled") is True
+
+def test_failed_stage_ends_the_query_span(spans):
+    service = RagService(reranker=FakeModel())
+    service.embedding_cache.get_or_embed = lambda query, embed_fn: [1.0] * 8
+
+    def down(query_vector, query):
+        raise ConnectionError("Database Down.")
+    service.search_database = down
+    with pytest.raises(ConnectionError):
+        service.get_response_and_context("anything")
+    assert [s.name for s in spans][-2:] == ["rag.search", "rag.query"]
+    service.llm.close()
+
+@pytest.mark.skipif(importlib.util.find_spec("opentelemetry") is not None, reason="OpenTelemetry installed")
+def test_missing_opentelemetry_keeps_local_timings():
+    t = telemetry.configure(enabled=True, exporter="otlp")
+    try:
+        with telemetry.span("ingest.file"):
+            pass
+        assert t._tracer is None and telemetry.snapshot()["ingest.file"]["count"] == 1
+    finally:
+        telemetry.configure(enabled=False)